@@ -0,0 +1,90 @@
+# Sebastian Raschka 2014-2015
+# markdown-toclify
+#
+# Generators for synthetic Markdown documents that are used by
+# the benchmark runner (run_benchmarks.py).
+
+import random
+
+
+LOREM = ('Lorem ipsum dolor sit amet, consectetur adipisicing elit, sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim '
+         'ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut '
+         'aliquip ex ea commodo consequat.')
+
+WORDS = LOREM.replace(',', '').replace('.', '').lower().split()
+
+PLACEHOLDER = '??placeholder??'
+
+
+def _title(rng, n_words=4):
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words)).capitalize()
+
+
+def deep_blocks(rng):
+    """A deep heading tree that cycles through all six levels."""
+    while True:
+        for level in range(1, 7):
+            yield '%s %s\n\n%s\n\n' % ('#' * level, _title(rng), LOREM)
+
+
+def dense_blocks(rng):
+    """Heading-dense reference pages with one short line per section."""
+    while True:
+        yield '## %s\n`%s()`\n### %s\n' % (_title(rng, 2), rng.choice(WORDS),
+                                           _title(rng, 3))
+
+
+def code_blocks(rng):
+    """Code-heavy tutorials, mostly fenced shell snippets with comments."""
+    while True:
+        snippet = ''.join('# %s\n    %s --%s\n' % (_title(rng), rng.choice(WORDS),
+                                                   rng.choice(WORDS))
+                          for _ in range(10))
+        yield '## %s\n\n%s\n\n```bash\n%s```\n\n' % (_title(rng), LOREM, snippet)
+
+
+def duplicate_blocks(rng):
+    """Generated API docs with many repeated headings."""
+    while True:
+        yield ('## %s()\n\n%s\n\n### Parameters\n\n- x: int\n\n'
+               '### Returns\n\n- y: int\n\n' % (rng.choice(WORDS), LOREM))
+
+
+def placeholder_blocks(rng):
+    """Prose with a single TOC placeholder at the top of the document."""
+    yield '# %s\n\n%s\n\n' % (_title(rng), PLACEHOLDER)
+    while True:
+        yield '## %s\n\n%s\n\n%s\n\n' % (_title(rng), LOREM, LOREM)
+
+
+GENERATORS = {
+    'deep': deep_blocks,
+    'dense': dense_blocks,
+    'code': code_blocks,
+    'duplicates': duplicate_blocks,
+    'placeholder': placeholder_blocks,
+}
+
+
+def iter_document(kind, size, seed=0):
+    """Yields chunks of a synthetic document of about `size` characters."""
+    rng = random.Random(seed)
+    written = 0
+    for block in GENERATORS[kind](rng):
+        if written >= size:
+            break
+        yield block
+        written += len(block)
+
+
+def write_document(kind, size, path, seed=0):
+    """Writes a synthetic document of about `size` characters to `path`."""
+    with open(path, 'w') as f:
+        for block in iter_document(kind, size, seed):
+            f.write(block)
+
+
+def make_document(kind, size, seed=0):
+    """Returns a synthetic document of about `size` characters."""
+    return ''.join(iter_document(kind, size, seed))
@@ -0,0 +1,119 @@
+# Sebastian Raschka 2014-2015
+# markdown-toclify
+#
+# Startup benchmark for markdown_toclify: measures the import time of the
+# package with `python -X importtime` and the wall time of short command
+# line runs in fresh interpreter processes.
+#
+# e.g.,
+# bash> python benchmarks/import_time.py
+# bash> python benchmarks/import_time.py --budget 30 --top 5
+# bash> python benchmarks/import_time.py --json > import_output.txt
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+EXAMPLE = os.path.join(ROOT, 'example_markdown', 'input_1.md')
+
+
+def environment():
+    """The environment of the measured processes (bytecode caches enabled)."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (ROOT, env.get('PYTHONPATH')) if p)
+    return env
+
+
+def import_times(env):
+    """
+    Imports markdown_toclify in a fresh process with -X importtime.
+    Returns a dict that maps every imported module onto its
+    (self, cumulative) import time in microseconds.
+
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import markdown_toclify'],
+                          env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def wall_time(cmd, env):
+    """Returns the wall time of running `cmd` in seconds."""
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the startup of markdown_toclify.')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of fresh processes per measurement (the median is reported)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of modules with the largest cumulative import time to list')
+    parser.add_argument('--budget', type=float, default=None, metavar='MS',
+                        help='exit with status 1 if the median import time exceeds MS milliseconds')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args()
+
+    env = environment()
+    tmp = tempfile.mkdtemp(prefix='toclify_startup_')
+    try:
+        out_file = os.path.join(tmp, 'out.md')
+        commands = [
+            ('cli_version', [sys.executable, '-m', 'markdown_toclify', '--version']),
+            ('cli_single_file', [sys.executable, '-m', 'markdown_toclify', EXAMPLE, '-o', out_file]),
+            ('cli_argparse', [sys.executable, '-m', 'markdown_toclify', EXAMPLE, '-o', out_file,
+                              '--spacer', '10']),
+        ]
+        # writes the bytecode caches
+        import_times(env)
+
+        runs = [import_times(env) for _ in range(args.repeat)]
+        package = median([r['markdown_toclify'][1] for r in runs]) / 1000.0
+        last = runs[-1]
+        modules = sorted(last.items(), key=lambda item: item[1][1], reverse=True)
+        results = {'import_ms': package,
+                   'modules': [{'module': name, 'self_ms': s / 1000.0, 'cumulative_ms': c / 1000.0}
+                               for name, (s, c) in modules[:args.top]]}
+        for name, cmd in commands:
+            results[name + '_ms'] = median([wall_time(cmd, env) for _ in range(args.repeat)]) * 1000.0
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print('%-26s %10.1f ms' % ('import markdown_toclify', results['import_ms']))
+        for name, _ in commands:
+            print('%-26s %10.1f ms' % (name, results[name + '_ms']))
+        print('\n%-40s %10s %12s' % ('module', 'self ms', 'cumulative ms'))
+        for m in results['modules']:
+            print('%-40s %10.2f %12.2f' % (m['module'], m['self_ms'], m['cumulative_ms']))
+
+    if args.budget is not None and results['import_ms'] > args.budget:
+        sys.stderr.write('import time %.1f ms exceeds the budget of %.1f ms\n'
+                         % (results['import_ms'], args.budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# Sebastian Raschka 2014-2015
+# markdown-toclify
+#
+# Benchmark runner for markdown_toclify on synthetic documents.
+#
+# e.g.,
+# bash> python benchmarks/run_benchmarks.py
+# bash> python benchmarks/run_benchmarks.py --sizes 1KB,1MB,1GB --kinds dense
+# bash> python benchmarks/run_benchmarks.py --json > bench_output.txt
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import markdown_toclify as mt
+from markdown_toclify.markdown_toclify import build_markdown, read_lines, _slugify_cached
+
+from generators import GENERATORS, PLACEHOLDER, write_document
+
+
+UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(size):
+    size = size.strip().upper()
+    for unit, factor in UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def best_time(func, repeat):
+    """Returns the best wall time of `repeat` calls and the last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_memory(func):
+    """Returns the peak memory (in bytes) traced while calling `func`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def record(kind, size, stage, seconds, n_bytes, n_headings, peak=None):
+    seconds = max(seconds, 1e-9)
+    return {'kind': kind,
+            'size': size,
+            'stage': stage,
+            'seconds': seconds,
+            'mb_per_s': n_bytes / seconds / UNITS['MB'],
+            'headings_per_s': n_headings / seconds,
+            'peak_memory': peak}
+
+
+def bench_document(kind, size, path, repeat, stage_limit, memory):
+    options = {'placeholder': PLACEHOLDER} if kind == 'placeholder' else {}
+    n_bytes = os.path.getsize(path)
+    results = []
+
+    if size <= stage_limit:
+        lines = read_lines(path)
+        cleaned = mt.remove_lines(lines)
+        placeholders = [] if options else None
+        body, headlines = mt.tag_and_collect(cleaned, placeholder=options.get('placeholder'),
+                                             placeholders=placeholders)
+        n_headings = len(headlines)
+        heading_lines = [l.lstrip() for l in cleaned
+                         if l.lstrip().startswith('#')]
+
+        def slugify():
+            _slugify_cached.cache_clear()
+            for l in heading_lines:
+                mt.slugify_headline(l)
+
+        t, _ = best_time(slugify, repeat)
+        results.append(record(kind, size, 'slugify_headline', t, n_bytes, n_headings))
+        t, _ = best_time(lambda: mt.tag_and_collect(cleaned), repeat)
+        results.append(record(kind, size, 'tag_and_collect', t, n_bytes, n_headings))
+        text = '\n'.join(lines)
+        t, _ = best_time(lambda: mt.tag_and_collect_text(text), repeat)
+        results.append(record(kind, size, 'tag_and_collect_text', t, n_bytes, n_headings))
+        t, toc = best_time(lambda: mt.create_toc(headlines), repeat)
+        results.append(record(kind, size, 'create_toc', t, n_bytes, n_headings))
+        t, _ = best_time(lambda: build_markdown(toc, body, placeholder=options.get('placeholder'),
+                                                placeholder_lines=placeholders),
+                         repeat)
+        results.append(record(kind, size, 'build_markdown', t, n_bytes, n_headings))
+        del lines, cleaned, body, heading_lines, text
+    else:
+        n_headings = None
+
+    out_path = path + '.out'
+    end_to_end = [
+        ('markdown_toclify', lambda: mt.markdown_toclify(path, out_path, **options)),
+        ('markdown_toclify_stream', lambda: mt.markdown_toclify_stream(path, out_path, **options)),
+        ('markdown_toclify_mmap', lambda: mt.markdown_toclify_mmap(path, out_path, **options)),
+        ('markdown_toclify_parallel', lambda: mt.markdown_toclify_parallel(path, out_path, **options)),
+    ]
+    for stage, func in end_to_end:
+        if stage == 'markdown_toclify' and size > stage_limit:
+            continue
+        t, res = best_time(func, repeat)
+        if n_headings is None and isinstance(res, list):
+            n_headings = len(res)
+        peak = peak_memory(func) if memory else None
+        results.append(record(kind, size, stage, t, n_bytes, n_headings or 0, peak))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks markdown_toclify on synthetic documents.')
+    parser.add_argument('--sizes', default='1KB,100KB,1MB,10MB',
+                        help='comma-separated document sizes, e.g., "1KB,1MB,1GB"')
+    parser.add_argument('--kinds', default=','.join(sorted(GENERATORS)),
+                        help='comma-separated document kinds (%s)' % ', '.join(sorted(GENERATORS)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs per stage (the best run is reported)')
+    parser.add_argument('--stage_limit', default='100MB',
+                        help='largest size for which the in-memory stages are timed')
+    parser.add_argument('--no_memory', action='store_true',
+                        help='skip the (slow) peak memory measurements')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON lines')
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    kinds = args.kinds.split(',')
+    stage_limit = parse_size(args.stage_limit)
+
+    tmp = tempfile.mkdtemp(prefix='toclify_bench_')
+    try:
+        if not args.json:
+            print('%-12s %12s %-26s %10s %10s %14s %12s' % (
+                'kind', 'size', 'stage', 'seconds', 'MB/s', 'headings/s', 'peak MB'))
+        for kind in kinds:
+            for size in sizes:
+                path = os.path.join(tmp, '%s_%d.md' % (kind, size))
+                write_document(kind, size, path)
+                for r in bench_document(kind, size, path, args.repeat,
+                                        stage_limit, not args.no_memory):
+                    if args.json:
+                        print(json.dumps(r))
+                    else:
+                        peak = '' if r['peak_memory'] is None else \
+                            '%.1f' % (r['peak_memory'] / UNITS['MB'])
+                        print('%-12s %12d %-26s %10.4f %10.1f %14.0f %12s' % (
+                            r['kind'], r['size'], r['stage'], r['seconds'],
+                            r['mb_per_s'], r['headings_per_s'], peak))
+                    sys.stdout.flush()
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,40 @@
 # markdown-toclify
 
 from .markdown_toclify import markdown_toclify
+from .markdown_toclify import markdown_toclify_stream
+from .markdown_toclify import markdown_toclify_mmap
+from .markdown_toclify import markdown_toclify_parallel
+from .markdown_toclify import toclify_text
+from .markdown_toclify import toclify_stream
 from .markdown_toclify import tag_and_collect
+from .markdown_toclify import tag_and_collect_text
 from .markdown_toclify import create_toc
+from .markdown_toclify import create_toc_tree
+from .markdown_toclify import create_toc_html
+from .markdown_toclify import render_toc
 from .markdown_toclify import positioning_headlines
 from .markdown_toclify import slugify_headline
+from .markdown_toclify import register_slug_flavor
+from .markdown_toclify import SlugFlavor
 from .markdown_toclify import remove_lines
+from .markdown_toclify import Headline
+from .markdown_toclify import PlaceholderError
+from .markdown_toclify import check_toc
+from .markdown_toclify import markdown_toclify_many
+from .markdown_toclify import toclify_async
+from .markdown_toclify import toclify_text_async
+from .markdown_toclify import toclify_many_async
+from .markdown_toclify import expand_input_paths
+from .markdown_toclify import filter_input_paths
+from .markdown_toclify import read_file_list
+from .markdown_toclify import git_changed_files
+from .markdown_toclify import prune_cache
+from .markdown_toclify import TocWatcher
+from .markdown_toclify import headline_index
+from .markdown_toclify import write_headline_index
+from .markdown_toclify import read_headline_index
+from .markdown_toclify import build_site_toc
+from .markdown_toclify import section_lookup
 
 __version__ = '0.1.8'
 
@@ -21,14 +21,122 @@
 # markdown-toclify.py --help
 #
 
-import argparse
+# argparse, array, concurrent.futures, glob, hashlib, heapq, json, mmap,
+# stat and struct are imported in the functions that need them to keep
+# the startup of the command line tool short
+import collections
+import io
+import itertools
+import operator
+import os
 import re
+import sys
+import time
+from functools import lru_cache
 
 
 __version__ = '1.7.2'
 
 VALIDS = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_-&'
 
+MARKDOWN_EXTENSIONS = ('.md', '.markdown', '.mdown', '.mkd')
+
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+SLUG_CACHE_SIZE = 4096
+
+PARALLEL_CHUNK_SIZE = 16 * 1024 * 1024
+
+# policies for documents with more than one placeholder and without a placeholder
+MULTIPLE_PLACEHOLDERS = ('all', 'first', 'error')
+
+MISSING_PLACEHOLDER = ('ignore', 'top', 'error')
+
+# worker threads of the default executor of the asyncio API
+ASYNC_MAX_WORKERS = 4
+
+# files that toclify_many_async processes at the same time
+ASYNC_MAX_CONCURRENCY = 64
+
+# formats of the separate TOC outputs (see render_toc) and the extensions
+# of their files in batch mode
+TOC_FORMATS = ('markdown', 'html', 'json')
+
+TOC_EXTENSIONS = {'markdown': '.toc.md', 'html': '.toc.html', 'json': '.toc.json'}
+
+# lines around the TOC in round-trip mode
+TOC_BEGIN = '<!-- mk-toclify-begin -->'
+
+TOC_END = '<!-- mk-toclify-end -->'
+
+
+class Headline(object):
+    """
+    A headline of a markdown document.
+
+    Attributes:
+        text: the '#'-stripped headline, e.g., 'Some header lvl3'
+        slug: the string for the <a id=''></a> anchor tags,
+            e.g., 'some-header-lvl3'
+        level: the headline level as integer, e.g., 3
+        line: the 1-based line number of the headline (or None)
+        offset: the byte offset of the headline (or None)
+        suffix: the number that was appended to a duplicate slug
+            (or None)
+
+    For backwards compatibility, headlines behave like the
+    [text, slug, level] lists of previous versions, e.g.,
+    `headline[-1] -= 1` changes the level, and they compare
+    equal to such lists.
+
+    """
+    __slots__ = ('text', 'slug', 'level', 'line', 'offset', 'suffix')
+
+    _fields = ('text', 'slug', 'level')
+
+    def __init__(self, text, slug, level, line=None, offset=None, suffix=None):
+        self.text = text
+        self.slug = slug
+        self.level = level
+        self.line = line
+        self.offset = offset
+        self.suffix = suffix
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        yield self.text
+        yield self.slug
+        yield self.level
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.text, self.slug, self.level][i]
+        return getattr(self, self._fields[i])
+
+    def __setitem__(self, i, value):
+        setattr(self, self._fields[i], value)
+
+    def __eq__(self, other):
+        if isinstance(other, (Headline, list, tuple)) and len(other) == 3:
+            return (self.text == other[0] and self.slug == other[1] and
+                    self.level == other[2])
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Headline(%r, %r, %r)' % (self.text, self.slug, self.level)
+
+    def copy(self):
+        return Headline(self.text, self.slug, self.level,
+                        self.line, self.offset, self.suffix)
+
 
 def read_lines(in_file):
     """Returns a list of lines from a input markdown file."""
@@ -52,7 +160,26 @@ def remove_lines(lines, remove=('[[back to top]', '<a class="mk-toclify"')):
     return out
 
 
-def slugify_headline(line, remove_dashes=False):
+def iter_lines(in_file):
+    """Yields the lines of a input markdown file one at a time."""
+
+    with open(in_file, 'r') as inf:
+        for l in inf:
+            if l.endswith('\n'):
+                l = l[:-1]
+            yield l
+
+
+def iter_remove_lines(lines, remove=('[[back to top]', '<a class="mk-toclify"')):
+    """Lazy version of remove_lines that works on any iterable of lines."""
+
+    for l in lines:
+        if remove and l.startswith(remove):
+            continue
+        yield l
+
+
+def slugify_headline(line, remove_dashes=False, slug_flavor='default'):
     """
     Takes a header line from a Markdown document and
     returns a tuple of the
@@ -63,32 +190,208 @@ def slugify_headline(line, remove_dashes=False):
     >>> dashify_headline('### some header lvl3')
     ('Some header lvl3', 'some-header-lvl3', 3)
 
+    The slug is created by the rules of `slug_flavor`, the name of
+    a registered flavor (see register_slug_flavor) or a SlugFlavor.
+
+    """
+    return list(_slugify_cached(line, remove_dashes, _slug_flavor(slug_flavor)))
+
+
+class SlugFlavor(object):
+    """
+    Rules for turning headline texts into slugs, compiled into a
+    translation table and regular expressions once, when the flavor
+    is created (see register_slug_flavor for the parameters).
+    The rules are applied in the order of the parameters.
+
+    """
+    def __init__(self, name, ascii_only=False, delete='', remove=None,
+                 strip_spaces=False, dash=None, lower=True, strip='',
+                 leading=None, replace=(), empty='', sep='-'):
+        self.name = name
+        self.ascii_only = ascii_only
+        self.delete = dict.fromkeys(map(ord, delete)) if delete else None
+        self.remove = re.compile(remove) if remove else None
+        self.strip_spaces = strip_spaces
+        self.dash = re.compile(dash) if dash else None
+        self.lower = lower
+        self.strip = strip
+        self.leading = re.compile(leading) if leading else None
+        self.replace = tuple(replace)
+        self.empty = empty
+        self.sep = sep
+
+    def __repr__(self):
+        return 'SlugFlavor(%r)' % self.name
+
+    def slugify(self, text):
+        """Returns the slug of the (whitespace-stripped) headline text."""
+        if self.ascii_only:
+            import unicodedata
+            text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+        if self.delete is not None:
+            text = text.translate(self.delete)
+        if self.remove is not None:
+            text = self.remove.sub('', text)
+        if self.strip_spaces:
+            text = text.strip()
+        if self.dash is not None:
+            text = self.dash.sub('-', text)
+        if self.lower:
+            text = text.lower()
+        if self.strip:
+            text = text.strip(self.strip)
+        if self.leading is not None:
+            text = self.leading.sub('', text, count=1)
+        for old, new in self.replace:
+            text = text.replace(old, new)
+        return text or self.empty
+
+
+# registered slug flavors by name (see register_slug_flavor)
+SLUG_FLAVORS = {}
+
+
+def register_slug_flavor(name, ascii_only=False, delete='', remove=None,
+                         strip_spaces=False, dash=None, lower=True, strip='',
+                         leading=None, replace=(), empty='', sep='-'):
+    r""" Registers a slug flavor that can be selected by its name.
+
+    The rules are compiled when the flavor is registered, and
+    a flavor that is registered again under the same name
+    replaces the old one.
+
+    Parameters
+    -----------
+      name: str
+        Name of the flavor, e.g., 'gitlab'.
+
+      ascii_only: bool (default: False)
+        Decomposes accented characters (NFKD) and drops all
+        characters that are not ASCII.
+
+      delete: str (default: '')
+        Characters that are deleted, e.g., './'.
+
+      remove: str (default: None)
+        Regular expression of the substrings that are deleted,
+        e.g., r'[^\w\- ]'.
+
+      strip_spaces: bool (default: False)
+        Strips whitespace from both ends after deleting characters.
+
+      dash: str (default: None)
+        Regular expression of the substrings that are
+        replaced by a dash, e.g., ' ' or r'[-\s]+'.
+
+      lower: bool (default: True)
+        Converts the slug to lowercase.
+
+      strip: str (default: '')
+        Characters that are stripped from both ends, e.g., '-'.
+
+      leading: str (default: None)
+        Regular expression of a prefix that is deleted,
+        e.g., r'^[\W\d_]+' (everything up to the first letter).
+
+      replace: list (default: ())
+        (old, new) tuples of strings that are replaced at the end.
+
+      empty: str (default: '')
+        Slug of headlines whose slug would be empty, e.g., 'section'.
+
+      sep: str (default: '-')
+        Separator of the suffixes that make duplicate slugs
+        unique (see `unique_slugs`), e.g., '_' for 'a_1'.
+
+    Returns
+    -----------
+    flavor: SlugFlavor
+      The registered flavor.
+
+    """
+    flavor = SlugFlavor(name, ascii_only=ascii_only, delete=delete, remove=remove,
+                        strip_spaces=strip_spaces, dash=dash, lower=lower,
+                        strip=strip, leading=leading, replace=replace,
+                        empty=empty, sep=sep)
+    SLUG_FLAVORS[name] = flavor
+    return flavor
+
+
+# the slugs of markdown_toclify: each run of characters that are not in
+# VALIDS (and dashes) becomes a single dash; '&' becomes a double dash
+register_slug_flavor('default', delete='./',
+                     dash='[^%s]+' % re.escape(VALIDS.replace('-', '')),
+                     strip='-', replace=[('-&-', '--')])
+
+# github-slugger
+register_slug_flavor('github', remove=r'[^\w\- ]', dash=' ')
+
+# GitLab's Markdown renderer
+register_slug_flavor('gitlab', remove=r'[^\w\- ]', dash='[ -]+')
+
+# pandoc's auto_identifiers extension
+register_slug_flavor('pandoc', remove=r'[^\w\-.\s]', strip_spaces=True,
+                     dash=r'\s+', leading=r'^[\W\d_]+', empty='section')
+
+# the toc extension of Python-Markdown (MkDocs)
+register_slug_flavor('mkdocs', ascii_only=True, remove=r'[^\w\s-]',
+                     strip_spaces=True, dash=r'[-\s]+', sep='_')
+
+
+def _slug_flavor(slug_flavor):
     """
-    stripped_right = line.rstrip('#')
-    stripped_both = stripped_right.lstrip('#')
-    level = len(stripped_right) - len(stripped_both)
-    stripped_wspace = stripped_both.strip()
+    Returns the registered SlugFlavor with the name `slug_flavor`
+    (or `slug_flavor` itself if it is a SlugFlavor or None).
+
+    """
+    if slug_flavor is None or isinstance(slug_flavor, SlugFlavor):
+        return slug_flavor
+    try:
+        return SLUG_FLAVORS[slug_flavor]
+    except KeyError:
+        raise ValueError('unknown slug flavor %r, expected one of %s'
+                         % (slug_flavor, ', '.join(sorted(SLUG_FLAVORS))))
+
+
+def _suffix_sep(remove_dashes=False, slug_flavor=None):
+    """Separator of the suffixes of duplicate slugs (see _make_unique)."""
+    sep = slug_flavor.sep if slug_flavor is not None else '-'
+    return sep.replace('-', '') if remove_dashes else sep
 
-    # character replacements
-    replaced_colon = stripped_wspace.replace('.', '')
-    replaced_slash = replaced_colon.replace('/', '')
-    rem_nonvalids = ''.join([c if c in VALIDS
-                             else '-' for c in replaced_slash])
 
-    lowered = rem_nonvalids.lower()
-    slugified = re.sub(r'(-)\1+', r'\1', lowered)  # remove duplicate dashes
-    slugified = slugified.strip('-')  # strip dashes from start and end
+@lru_cache(maxsize=SLUG_CACHE_SIZE)
+def _slugify_cached(line, remove_dashes, slug_flavor=None, level=None):
+    """
+    Memoized implementation of slugify_headline that
+    returns a tuple; repeated headlines such as
+    '## Parameters' are only slugified once.
+
+    If `level` is given, `line` is the text line of a
+    Setext headline of that level.
+
+    """
+    if level is None:
+        stripped_right = line.rstrip('#')
+        stripped_both = stripped_right.lstrip('#')
+        level = len(stripped_right) - len(stripped_both)
+        stripped_wspace = stripped_both.strip()
+    else:
+        stripped_wspace = line.strip()
 
-    # exception '&' (double-dash in github)
-    slugified = slugified.replace('-&-', '--')
+    if slug_flavor is None:
+        slug_flavor = SLUG_FLAVORS['default']
+    slugified = slug_flavor.slugify(stripped_wspace)
 
     if remove_dashes:
-        slugified = slugified.replace('-','')
+        slugified = slugified.replace('-', '')
 
-    return [stripped_wspace, slugified, level]
+    return stripped_wspace, slugified, level
 
 
-def tag_and_collect(lines, id_tag=True, back_links=False, exclude_h=None, remove_dashes=False):
+def tag_and_collect(lines, id_tag=True, back_links=False, exclude_h=None, remove_dashes=False,
+                    unique_slugs=False, placeholder=None, placeholders=None,
+                    slug_flavor='default', setext=False):
     """
     Gets headlines from the markdown document and creates anchor tags.
 
@@ -99,6 +402,17 @@ def tag_and_collect(lines, id_tag=True, back_links=False, exclude_h=None, remove
         back_links: if true, adds "back to top" links below each headline
         exclude_h: header levels to exclude. E.g., [2, 3]
             excludes level 2 and 3 headings.
+        unique_slugs: if true, appends GitHub-style suffixes to duplicate
+            slugs, e.g., 'parameters', 'parameters-1', 'parameters-2'
+        placeholder: the TOC placeholder string (see placeholders).
+        placeholders: list that the (index, count) tuples of the output
+            lines that contain the placeholder outside of code blocks
+            are appended to, e.g., [(12, 1)] (see build_markdown).
+        slug_flavor: name of the slug flavor (see register_slug_flavor)
+        setext: if true, Setext headlines (a text line underlined by
+            '===' or '---') are collected, too. The anchor tag is inserted
+            above the text line, and the [back to top] link below the
+            underline.
 
     Returns a tuple of 2 lists:
         1st list:
@@ -107,54 +421,597 @@ def tag_and_collect(lines, id_tag=True, back_links=False, exclude_h=None, remove
             above the header lines (if github is False).
 
         2nd list:
-            A list of 3-value sublists, where the first value
-            represents the heading, the second value the string
-            that was inserted assigned to the IDs in the anchor tags,
-            and the third value is an integer that reprents the headline level.
+            A list of Headline objects, which behave like 3-value
+            sublists, where the first value represents the heading,
+            the second value the string that was inserted assigned
+            to the IDs in the anchor tags, and the third value is an
+            integer that reprents the headline level. The `line`
+            attribute is the 1-based index of the headline in `lines`.
             E.g.,
             [['some header lvl3', 'some-header-lvl3', 3], ...]
 
     """
-    out_contents = []
     headlines = []
-    for l in lines:
-        saw_headline = False
+    out_contents = list(iter_tag_and_collect(lines, headlines,
+                                             id_tag=id_tag,
+                                             back_links=back_links,
+                                             exclude_h=exclude_h,
+                                             remove_dashes=remove_dashes,
+                                             unique_slugs=unique_slugs,
+                                             placeholder=placeholder,
+                                             placeholders=placeholders,
+                                             slug_flavor=slug_flavor,
+                                             setext=setext))
+    return out_contents, headlines
 
-        orig_len = len(l)
-        l = l.lstrip()
 
-        if l.startswith(('# ', '## ', '### ', '#### ', '##### ', '###### ')):
+def iter_tag_and_collect(lines, headlines=None, id_tag=True, back_links=False,
+                         exclude_h=None, remove_dashes=False, unique_slugs=False,
+                         placeholder=None, placeholders=None,
+                         slug_flavor='default', setext=False):
+    """
+    Lazy version of tag_and_collect that yields the output lines
+    one at a time. The headlines are appended to the `headlines`
+    list as they are found (they are discarded if `headlines` is None),
+    and so are the placeholder lines to `placeholders`.
 
-            # comply with new markdown standards
+    Lines in fenced code blocks (``` or ~~~) and raw HTML blocks
+    (<pre>, <script>, <style>, <textarea> and <!-- comments -->)
+    are never treated as headlines or placeholders.
 
-            # not a headline if '#' not followed by whitespace '##no-header':
-            if not l.lstrip('#').startswith(' '):
-                continue
-            # not a headline if more than 6 '#':
-            if len(l) - len(l.lstrip('#')) > 6:
-                continue
-            # headers can be indented by at most 3 spaces:
-            if orig_len - len(l) > 3:
-                continue
+    """
+    slug_flavor = _slug_flavor(slug_flavor)
+    seen = {} if unique_slugs else None
+    sep = _suffix_sep(remove_dashes, slug_flavor)
+    if placeholders is None:
+        placeholder = None
+    # the Setext level of the current line (see _iter_setext)
+    levels = [None]
+    if setext:
+        lines = _iter_setext(lines, levels)
+    lines = iter(lines)
+    number = 0
+    # number of anchor tags and [back to top] links that were
+    # inserted so far (for the indices of the placeholder lines)
+    inserted = 0
+    for l in lines:
+        number += 1
+        orig_len = len(l)
+        l = l.lstrip()
 
-            # ignore empty headers
-            if not set(l) - {'#', ' '}:
+        if l[:1] in _BLOCK_START_CHARS and orig_len - len(l) <= 3:
+            block = _open_block(l)
+            if block is not None:
+                # a placeholder may be a block itself, e.g., <!-- toc -->
+                if placeholder is not None and placeholder in l:
+                    placeholders.append((number - 1 + inserted, l.count(placeholder)))
+                yield l
+                if _closes_block(block, l, opening=True):
+                    continue
+                # skip ahead to the end of the block
+                for l in lines:
+                    number += 1
+                    orig_len = len(l)
+                    l = l.lstrip()
+                    yield l
+                    if _closes_block(block, l, orig_len - len(l)):
+                        break
                 continue
 
-            saw_headline = True
-            slugified = slugify_headline(l, remove_dashes)
+        # excluded headlines are not slugified unless they are
+        # needed for the numbering of duplicate slugs
+        level = levels[0]
+        headline = _headline(l, orig_len - len(l), remove_dashes,
+                             exclude_h if seen is None else None,
+                             slug_flavor, level)
+        if headline is None:
+            if placeholder is not None and placeholder in l:
+                placeholders.append((number - 1 + inserted, l.count(placeholder)))
+            yield l
+            if level == 0 and back_links:
+                # below the underline of a Setext headline
+                inserted += 1
+                yield '[[back to top](#table-of-contents)]'
+            continue
+        if headline is not False:
+            if seen is not None:
+                _make_unique(headline, seen, sep)
 
-            if not exclude_h or not slugified[-1] in exclude_h:
+            if not exclude_h or not headline.level in exclude_h:
                 if id_tag:
-                    id_tag = '<a class="mk-toclify" id="%s"></a>'\
-                              % (slugified[1])
-                    out_contents.append(id_tag)
-                headlines.append(slugified)
-
-        out_contents.append(l)
-        if back_links and saw_headline:
-            out_contents.append('[[back to top](#table-of-contents)]')
-    return out_contents, headlines
+                    inserted += 1
+                    yield '<a class="mk-toclify" id="%s"></a>' % (headline.slug)
+                if headlines is not None:
+                    headline.line = number
+                    headlines.append(headline)
+
+        if placeholder is not None and placeholder in l:
+            placeholders.append((number - 1 + inserted, l.count(placeholder)))
+        yield l
+        if back_links and not level:
+            inserted += 1
+            yield '[[back to top](#table-of-contents)]'
+
+
+def tag_and_collect_text(text, headlines=None, id_tag=True, back_links=False,
+                         exclude_h=None, remove_dashes=False, unique_slugs=False,
+                         slug_flavor='default', strip_indent=True):
+    """
+    Bulk version of remove_lines and tag_and_collect for a whole document
+    (a string with '\n' line breaks) that returns the output document as
+    a string. The headlines are appended to `headlines` like in
+    iter_tag_and_collect, with the line numbers in the document without
+    the removed [back to top] links and anchor tags.
+
+    All lines that can change (ATX headline candidates, indented lines,
+    code fences, HTML blocks and old links / anchor tags) are found with
+    a single regular expression, and the lines in between are copied as
+    slices of `text`. Code and HTML blocks are skipped in one step. If
+    `strip_indent` is False, the indented lines are not left-stripped
+    (like in the output of markdown_toclify with nolink).
+
+    Placeholders and Setext headlines are not supported; use
+    tag_and_collect for them.
+
+    """
+    slug_flavor = _slug_flavor(slug_flavor)
+    seen = {} if unique_slugs else None
+    sep = _suffix_sep(remove_dashes, slug_flavor)
+    search = _TEXT_EVENT.search
+    pieces = []
+    # offset up to which `text` is copied to the pieces
+    pos = 0
+    # number of line breaks before `counted` and of removed lines
+    number, counted, removed = 0, 0, 0
+    block = None
+    # offset of the line that closes the open HTML block
+    html_close = None
+    # all matches but one on the first line start with the line break
+    m = _TEXT_LINE_EVENT.match(text) or search(text)
+    while m is not None:
+        start, end = m.span()
+        if text[start] == '\n':
+            start += 1
+        m = None
+        l = text[start:end]
+        if l.startswith(_REMOVE):
+            pieces.append(text[pos:start])
+            pos = end + 1
+            removed += 1
+            m = search(text, end)
+            continue
+
+        if html_close is not None and start > html_close:
+            # closed by a line without events
+            block = html_close = None
+        stripped = l.lstrip()
+        indent = len(l) - len(stripped)
+        out = stripped if strip_indent else l
+        # offset of the line break after the lines that are skipped
+        skip = None
+
+        if block is not None:
+            if html_close is not None:
+                if start == html_close:
+                    block = html_close = None
+            elif _closes_block(block, stripped, indent):
+                block = None
+        elif stripped[:1] in _BLOCK_START_CHARS and indent <= 3 and _open_block(stripped):
+            block = _open_block(stripped)
+            if _closes_block(block, stripped, opening=True):
+                block = None
+            elif block[0] == 'html':
+                html_close = _text_html_close(text, block[1], end)
+                skip = html_close - 1 if html_close < len(text) else html_close
+            else:
+                skip = _text_fence_close(text, block, end)
+        else:
+            # excluded headlines are not slugified unless they are
+            # needed for the numbering of duplicate slugs
+            if indent or l[0] != '#':
+                headline = _headline(stripped, indent, remove_dashes,
+                                     exclude_h if seen is None else None, slug_flavor)
+            elif (exclude_h and seen is None and
+                  len(l) - len(l.lstrip('#')) in exclude_h):
+                headline = False
+            else:
+                # the event is an ATX headline (see _TEXT_EVENT)
+                headline = Headline(*_slugify_cached(l, remove_dashes, slug_flavor))
+            if headline is not None:
+                if headline is not False:
+                    if seen is not None:
+                        _make_unique(headline, seen, sep)
+                    if not exclude_h or not headline.level in exclude_h:
+                        if id_tag:
+                            out = '<a class="mk-toclify" id="%s"></a>\n%s' % (headline.slug, out)
+                        if headlines is not None:
+                            number += text.count('\n', counted, start)
+                            counted = start
+                            headline.line = number + 1 - removed
+                            headlines.append(headline)
+                if back_links:
+                    out += '\n[[back to top](#table-of-contents)]'
+
+        if out != l:
+            pieces.append(text[pos:start])
+            pieces.append(out)
+            pos = end
+        if skip is not None:
+            # the lines in the block only lose their indentation
+            # and the old links / anchor tags
+            if _TEXT_BLOCK_EVENT.search(text, end, skip):
+                pieces.append(text[pos:end])
+                region, count = _TEXT_BLOCK_REMOVE.subn('', text[end:skip])
+                removed += count
+                if strip_indent:
+                    region = _TEXT_BLOCK_INDENT.sub('\n', region)
+                pieces.append(region)
+                pos = skip
+            end = skip
+        m = search(text, end)
+
+    pieces.append(text[pos:])
+    out = ''.join(pieces)
+    if pos > len(text) and out:
+        # the last line was removed, and so is the line break before it
+        out = out[:-1]
+    return out
+
+
+class _LazyRegex(object):
+    """
+    A regular expression that is compiled when it is used for the first
+    time rather than on import. The attributes of the compiled pattern
+    (e.g., its match method) are cached on the instance.
+
+    """
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name):
+        value = getattr(re.compile(self.pattern, self.flags), name)
+        setattr(self, name, value)
+        return value
+
+
+_REMOVE = ('[[back to top]', '<a class="mk-toclify"')
+
+# the lines that tag_and_collect_text has to look at: indented lines (which
+# are left-stripped), ATX headlines (at most 6 '#', a space and some contents),
+# code fences, the start tags of HTML blocks and old [back to top] links and
+# anchor tags; the candidates are checked by _open_block and _headline
+_TEXT_LINE_EVENT = _LazyRegex(r'(?:[^\S\n]|#{1,6} [# ]*[^# \n]|```|~~~|\[\[back to top\]'
+                              r'|<(?i:pre|script|style|textarea|!--|a class="mk-toclify"))'
+                              r'[^\n]*')
+
+# the events after a line break (a literal prefix is found much faster
+# than the start of a line in MULTILINE mode)
+_TEXT_EVENT = _LazyRegex(r'\n' + _TEXT_LINE_EVENT.pattern)
+
+# lines in code blocks that change
+_TEXT_BLOCK_EVENT = _LazyRegex(r'\n(?:[^\S\n]|\[\[back to top\]|<a class="mk-toclify")')
+
+_TEXT_BLOCK_REMOVE = _LazyRegex(r'\n(?:\[\[back to top\]|<a class="mk-toclify")[^\n]*')
+
+_TEXT_BLOCK_INDENT = _LazyRegex(r'\n[^\S\n]+')
+
+_TEXT_FENCE_CLOSE = {}
+
+_TEXT_HTML_CLOSE = {}
+
+
+def _text_fence_close(text, block, start):
+    """
+    Returns the offset of the line break before the first line after
+    `start` that closes the fenced code block, or len(text).
+
+    """
+    marker = block[1]
+    regex = _TEXT_FENCE_CLOSE.get(marker)
+    if regex is None:
+        regex = re.compile(r'\n[^\S\n]{0,3}' + re.escape(marker))
+        _TEXT_FENCE_CLOSE[marker] = regex
+    while True:
+        m = regex.search(text, start)
+        if m is None:
+            return len(text)
+        end = text.find('\n', m.end())
+        if end == -1:
+            end = len(text)
+        l = text[m.start() + 1:end]
+        stripped = l.lstrip()
+        if _closes_block(block, stripped, len(l) - len(stripped)):
+            return m.start()
+        start = end
+
+
+def _text_html_close(text, marker, start):
+    """
+    Returns the offset of the first line after `start` that closes the
+    HTML block with the end `marker` (see _closes_block), ignoring old
+    links / anchor tags, or len(text) if the block is not closed.
+
+    """
+    regex = _TEXT_HTML_CLOSE.get(marker)
+    if regex is None:
+        # str.lower only maps ASCII characters onto the ASCII markers
+        regex = re.compile(re.escape(marker), re.IGNORECASE | re.ASCII)
+        _TEXT_HTML_CLOSE[marker] = regex
+    while True:
+        m = regex.search(text, start)
+        if m is None:
+            return len(text)
+        line = text.rfind('\n', 0, m.start()) + 1
+        if not text.startswith(_REMOVE, line):
+            return line
+        start = text.find('\n', m.end())
+        if start == -1:
+            return len(text)
+
+
+# first characters of lines that can open a code fence or a raw HTML block
+_BLOCK_START_CHARS = ('`', '~', '<')
+
+_FENCE_OPEN = _LazyRegex(r'(`{3,})[^`]*$|(~{3,})')
+
+_HTML_BLOCK_OPEN = _LazyRegex(r'<(pre|script|style|textarea)(?:[\s>]|$)|<!--',
+                              re.IGNORECASE)
+
+
+def _open_block(l):
+    """
+    Checks if the (left-stripped) line `l` opens a fenced code block
+    or a raw HTML block. Returns a (kind, marker) tuple with the
+    marker that closes the block, or None.
+
+    """
+    m = _FENCE_OPEN.match(l)
+    if m:
+        return 'fence', m.group(1) or m.group(2)
+    m = _HTML_BLOCK_OPEN.match(l)
+    if m:
+        if m.group(1):
+            return 'html', '</%s>' % m.group(1).lower()
+        return 'html', '-->'
+    return None
+
+
+def _closes_block(block, l, indent=0, opening=False):
+    """Checks if the (left-stripped) line `l` closes the block."""
+    kind, marker = block
+    if kind == 'fence':
+        # a closing fence has at least as many fence characters as
+        # the opening fence and nothing else but whitespace
+        if opening or indent > 3 or not l.startswith(marker):
+            return False
+        return not l.rstrip().strip(marker[0])
+    if opening:
+        # the end marker may be on the same line as the start tag
+        l = l[4:] if marker == '-->' else l[1:]
+    return marker in l.lower()
+
+
+def _tag_line(l, block=None, id_tag=True, back_links=False, exclude_h=None,
+              remove_dashes=False, seen=None, slug_flavor=None, setext=None):
+    """
+    Single-line step of iter_tag_and_collect for callers that keep
+    their own per-line state. `block` is the code/HTML block that is
+    open before the line (see _open_block), `seen` the dict of
+    used slugs if duplicate slugs are made unique (see _make_unique),
+    and `setext` the Setext level of the line (see _iter_setext).
+
+    Returns a tuple of the output lines, the headline (or None) and
+    the block that is open after the line.
+
+    """
+    orig_len = len(l)
+    l = l.lstrip()
+    if block is not None:
+        if _closes_block(block, l, orig_len - len(l)):
+            block = None
+        return [l], None, block
+
+    if l[:1] in _BLOCK_START_CHARS and orig_len - len(l) <= 3:
+        block = _open_block(l)
+        if block is not None:
+            if _closes_block(block, l, opening=True):
+                block = None
+            return [l], None, block
+
+    headline = _headline(l, orig_len - len(l), remove_dashes,
+                         exclude_h if seen is None else None,
+                         slug_flavor, setext)
+    if headline is None:
+        if setext == 0 and back_links:
+            return [l, '[[back to top](#table-of-contents)]'], None, None
+        return [l], None, None
+    if seen is not None:
+        _make_unique(headline, seen, _suffix_sep(remove_dashes, slug_flavor))
+
+    out = []
+    if headline is not False and (not exclude_h or not headline.level in exclude_h):
+        if id_tag:
+            out.append('<a class="mk-toclify" id="%s"></a>' % (headline.slug))
+    else:
+        headline = None
+    out.append(l)
+    if back_links and not setext:
+        out.append('[[back to top](#table-of-contents)]')
+    return out, headline, None
+
+
+def _headline(l, indent, remove_dashes=False, exclude_h=None,
+              slug_flavor=None, setext=None):
+    """
+    Returns a Headline if the (left-stripped) line `l`, which was
+    indented by `indent` characters, is an ATX headline, and None
+    otherwise. Headlines of the levels in `exclude_h` are not
+    slugified, and False is returned for them instead.
+
+    If `setext` is 1 or 2, `l` is the text line of a Setext
+    headline of that level (see _iter_setext).
+
+    """
+    if setext:
+        if exclude_h and setext in exclude_h:
+            return False
+        return Headline(*_slugify_cached(l, remove_dashes, slug_flavor, setext))
+
+    if not l.startswith(('# ', '## ', '### ', '#### ', '##### ', '###### ')):
+        return None
+
+    # comply with new markdown standards
+
+    # not a headline if '#' not followed by whitespace '##no-header':
+    stripped = l.lstrip('#')
+    if not stripped.startswith(' '):
+        return None
+    # not a headline if more than 6 '#':
+    level = len(l) - len(stripped)
+    if level > 6:
+        return None
+    # headers can be indented by at most 3 spaces:
+    if indent > 3:
+        return None
+
+    # ignore empty headers
+    if not set(l) - {'#', ' '}:
+        return None
+
+    if exclude_h and level in exclude_h:
+        return False
+    return Headline(*_slugify_cached(l, remove_dashes, slug_flavor))
+
+
+# the underline of a Setext headline: '=' (level 1) or '-' (level 2)
+_SETEXT_UNDERLINE = _LazyRegex(r' {0,3}(?:(=+)|-+)[ \t]*$')
+
+# (left-stripped) lines that end a paragraph: ATX headlines and thematic breaks
+_SETEXT_BREAK = _LazyRegex(r'#{1,6}(?:\s|$)|([-*_])(?:\s*\1){2,}\s*$')
+
+# (left-stripped) lines that are not paragraph text: list items, block quotes and HTML
+_SETEXT_NOT_TEXT = _LazyRegex(r'[-+*]\s|\d{1,9}[.)]\s|[><]')
+
+
+def _iter_setext(lines, levels, skip=None):
+    """
+    Yields the `lines` unchanged with one line of lookahead and sets
+    levels[0] to the Setext level of every line before it is yielded:
+    1 or 2 for the text line of a Setext headline, 0 for its underline
+    and None for all other lines. Lines that start with `skip` are
+    ignored (their level is None).
+
+    Only single-line headlines are recognized: the text line has to
+    follow a blank line, a headline or a code/HTML block, and it must
+    not be indented by more than 3 spaces or look like a list item,
+    a block quote, a thematic break or HTML.
+
+    """
+    lines = iter(lines)
+    # lines that were read ahead
+    ahead = collections.deque()
+    block = None
+    # the previous line is paragraph text, which the next line continues
+    text = False
+    underline = False
+    while True:
+        if ahead:
+            l = ahead.popleft()
+        else:
+            l = next(lines, None)
+            if l is None:
+                return
+        level = None
+        if skip and l.startswith(skip):
+            pass
+        elif underline:
+            level = 0
+            underline = text = False
+        else:
+            stripped = l.lstrip()
+            indent = len(l) - len(stripped)
+            if block is not None:
+                if _closes_block(block, stripped, indent):
+                    block = None
+            elif not stripped:
+                text = False
+            elif indent > 3:
+                # indented code unless it continues a paragraph
+                pass
+            elif stripped[:1] in _BLOCK_START_CHARS and _open_block(stripped) is not None:
+                block = _open_block(stripped)
+                if _closes_block(block, stripped, opening=True):
+                    block = None
+                text = False
+            elif _SETEXT_BREAK.match(stripped):
+                text = False
+            elif text or _SETEXT_NOT_TEXT.match(stripped):
+                text = True
+            else:
+                text = True
+                nxt = _next_line(lines, ahead, skip)
+                if nxt is not None:
+                    m = _SETEXT_UNDERLINE.match(nxt)
+                    if m is not None:
+                        level = 1 if m.group(1) else 2
+                        underline = True
+        levels[0] = level
+        yield l
+
+
+def _next_line(lines, ahead, skip=None):
+    """
+    Returns the next line that does not start with `skip` without
+    consuming it: the lines that are read from the iterator `lines`
+    are appended to the deque `ahead`. Returns None at the end.
+
+    """
+    for l in ahead:
+        if not (skip and l.startswith(skip)):
+            return l
+    for l in lines:
+        ahead.append(l)
+        if not (skip and l.startswith(skip)):
+            return l
+    return None
+
+
+def _exclude_levels(exclude_h=None, min_depth=1, max_depth=6):
+    """
+    Adds the headline levels outside of the range from `min_depth`
+    to `max_depth` to the excluded levels `exclude_h`.
+
+    """
+    if min_depth <= 1 and max_depth >= 6:
+        return exclude_h
+    levels = set(exclude_h or ())
+    levels.update(level for level in range(1, 7)
+                  if level < min_depth or level > max_depth)
+    return sorted(levels)
+
+
+def _make_unique(headline, seen, sep='-'):
+    """
+    Appends a GitHub-style suffix to the slug of `headline` if the slug
+    was used before: 'parameters', 'parameters-1', 'parameters-2', ...
+
+    `seen` maps every slug that was used so far onto the last suffix
+    that was tried for it, so that every headline is processed in
+    constant amortized time. A suffixed slug that collides with the
+    slug of a literal headline, e.g., '# Parameters 1', gets another
+    suffix ('parameters-1-1') like on GitHub.
+
+    """
+    base = slug = headline.slug
+    while slug in seen:
+        seen[base] += 1
+        slug = '%s%s%d' % (base, sep, seen[base])
+    seen[slug] = 0
+    if slug != base:
+        headline.slug = slug
+        headline.suffix = seen[base]
 
 
 def positioning_headlines(headlines):
@@ -172,7 +1029,8 @@ def positioning_headlines(headlines):
     return headlines
 
 
-def create_toc(headlines, hyperlink=True, top_link=False, no_toc_header=False):
+def create_toc(headlines, hyperlink=True, top_link=False, no_toc_header=False,
+               max_children=None):
     """
     Creates the table of contents from the headline list
     that was returned by the tag_and_collect function.
@@ -185,6 +1043,10 @@ def create_toc(headlines, hyperlink=True, top_link=False, no_toc_header=False):
         top_link: if True, add a id tag for linking the table
             of contents itself (for the back-to-top-links)
         no_toc_header: suppresses TOC header if True.
+        max_children: maximum number of entries below every entry
+            (and on the top level). Further entries and their
+            subentries are replaced by a single 'more...' entry
+            that links to the first of them.
 
     Returns  a list of headlines for a table of contents
     in Markdown format,
@@ -197,6 +1059,9 @@ def create_toc(headlines, hyperlink=True, top_link=False, no_toc_header=False):
             processed.append('<a class="mk-toclify" id="table-of-contents"></a>\n')
         processed.append('# Table of Contents')
 
+    if max_children is not None:
+        headlines = _collapse_headlines(headlines, max_children)
+
     for line in headlines:
         if hyperlink:
             item = '%s- [%s](#%s)' % ((line[2]-1)*'    ', line[0], line[1])
@@ -207,7 +1072,149 @@ def create_toc(headlines, hyperlink=True, top_link=False, no_toc_header=False):
     return processed
 
 
-def build_markdown(toc_headlines, body, spacer=0, placeholder=None):
+def _collapse_headlines(headlines, max_children):
+    """
+    Yields the headlines of create_toc with at most `max_children`
+    children per headline; the first dropped child of a headline is
+    replaced by a 'more...' entry.
+
+    """
+    # [level, number of children, dropped] of the open headlines
+    stack = [[0, 0, False]]
+    for line in headlines:
+        level = line[2]
+        while len(stack) > 1 and stack[-1][0] >= level:
+            stack.pop()
+        parent = stack[-1]
+        parent[1] += 1
+        dropped = parent[2] or parent[1] > max_children
+        if not parent[2] and parent[1] == max_children + 1:
+            yield ['more...', line[1], level]
+        elif not dropped:
+            yield line
+        stack.append([level, 0, dropped])
+
+
+def create_toc_tree(headlines, max_children=None):
+    """
+    Creates the table of contents as a tree from the headline list
+    that was returned by the tag_and_collect function (after
+    positioning_headlines).
+
+    Returns a list of dicts, one per top-level entry, with the keys
+    'text', 'slug', 'level' (the level in the TOC), 'line' (the line
+    number of the headline or None) and 'children' (a list of dicts
+    for the entries below). The tree can be serialized with `json.dumps`.
+    See create_toc for `max_children`.
+
+    """
+    if max_children is not None:
+        headlines = _collapse_headlines(headlines, max_children)
+    tree = []
+    # (level, children) of the open entries
+    stack = [(0, tree)]
+    for line in headlines:
+        level = line[2]
+        while len(stack) > 1 and stack[-1][0] >= level:
+            stack.pop()
+        node = {'text': line[0], 'slug': line[1], 'level': level,
+                'line': getattr(line, 'line', None), 'children': []}
+        stack[-1][1].append(node)
+        stack.append((level, node['children']))
+    return tree
+
+
+def create_toc_html(headlines, hyperlink=True, max_children=None):
+    """
+    Creates the table of contents as an HTML fragment from the headline
+    list that was returned by the tag_and_collect function (after
+    positioning_headlines): a <nav> element with nested <ul> lists,
+    e.g.,
+        <nav class="mk-toclify">
+        <ul>
+        <li><a href="#some-header-lvl1">Some header lvl1</a></li>
+        </ul>
+        </nav>
+
+    The headline texts are HTML-escaped, but Markdown in them is not
+    rendered. See create_toc for `hyperlink` and `max_children`.
+
+    """
+    import html
+    processed = ['<nav class="mk-toclify">']
+
+    def add_list(nodes):
+        processed.append('<ul>')
+        for node in nodes:
+            text = html.escape(node['text'], quote=False)
+            if hyperlink:
+                item = '<li><a href="#%s">%s</a>' % (html.escape(node['slug']), text)
+            else:
+                item = '<li>%s' % text
+            if node['children']:
+                processed.append(item)
+                add_list(node['children'])
+                processed.append('</li>')
+            else:
+                processed.append(item + '</li>')
+        processed.append('</ul>')
+
+    tree = create_toc_tree(headlines, max_children)
+    if tree:
+        add_list(tree)
+    processed.append('</nav>')
+    return '\n'.join(processed)
+
+
+def render_toc(headlines, toc_format='markdown', hyperlink=True,
+               no_toc_header=False, max_children=None):
+    """
+    Renders the table of contents of the (left-justified) headlines
+    on its own in one of the TOC_FORMATS: 'markdown' (see create_toc),
+    'html' (see create_toc_html) or 'json' (see create_toc_tree).
+    Returns the contents of the output file as a string.
+
+    """
+    if toc_format == 'markdown':
+        toc = create_toc(headlines, hyperlink=hyperlink, no_toc_header=no_toc_header,
+                         max_children=max_children)
+        return '\n'.join(toc).rstrip('\n') + '\n'
+    if toc_format == 'html':
+        return create_toc_html(headlines, hyperlink=hyperlink,
+                               max_children=max_children) + '\n'
+    if toc_format == 'json':
+        import json
+        return json.dumps(create_toc_tree(headlines, max_children),
+                          indent=2, ensure_ascii=False) + '\n'
+    raise ValueError('unknown TOC format %r, expected one of %s'
+                     % (toc_format, ', '.join(TOC_FORMATS)))
+
+
+def _check_toc_outputs(toc_outputs):
+    """Raises a ValueError for unknown formats in `toc_outputs`."""
+    for toc_format in toc_outputs or ():
+        if toc_format not in TOC_FORMATS:
+            raise ValueError('unknown TOC format %r, expected one of %s'
+                             % (toc_format, ', '.join(TOC_FORMATS)))
+
+
+def _write_toc_outputs(headlines, toc_outputs, nolink=False,
+                       no_toc_header=False, max_children=None):
+    """
+    Writes the TOC in every format of `toc_outputs` to its path
+    (unless the file is up to date).
+
+    """
+    for toc_format, path in sorted(toc_outputs.items()):
+        cont = render_toc(headlines, toc_format, hyperlink=not nolink,
+                          no_toc_header=no_toc_header, max_children=max_children)
+        if not _output_is_current(cont, path):
+            output_markdown(cont, path)
+
+
+def build_markdown(toc_headlines, body, spacer=0, placeholder=None,
+                   placeholder_lines=None, multiple_placeholders='all',
+                   missing_placeholder='ignore'):
     """
     Returns a string with the Markdown output contents incl.
     the table of contents.
@@ -222,74 +1229,2743 @@ def build_markdown(toc_headlines, body, spacer=0, placeholder=None):
             of contents. Height in pixels.
         placeholder: If a placeholder string is provided, the placeholder
             will be replaced by the TOC instead of inserting the TOC at
-            the top of the document
+            the top of the document. Placeholders in code blocks and
+            placeholders that span multiple lines are not replaced.
+        placeholder_lines: (index, count) tuples of the lines in `body`
+            that contain the placeholder as collected by tag_and_collect.
+            `body` is searched for the placeholder if None.
+        multiple_placeholders: 'all' replaces every placeholder, 'first'
+            only the first one, and 'error' raises a PlaceholderError
+            if there is more than one placeholder.
+        missing_placeholder: if there is no placeholder, 'ignore' returns
+            the document without a TOC, 'top' inserts the TOC at the top
+            of the document, and 'error' raises a PlaceholderError.
 
     """
-    if spacer:
-        spacer_line = ['\n<div style="height:%spx;"></div>\n' % (spacer)]
-        toc_markdown = "\n".join(toc_headlines + spacer_line)
-    else:
-        toc_markdown = "\n".join(toc_headlines)
+    toc_markdown = _toc_markdown(toc_headlines, spacer)
+    splices = None
+    if placeholder:
+        if placeholder_lines is None:
+            placeholder_lines = _placeholder_lines(body, placeholder)
+        splices = _select_placeholders(placeholder, placeholder_lines,
+                                       multiple_placeholders, missing_placeholder)
 
-    body_markdown = "\n".join(body).strip()
+    # the equivalent of "\n".join(body).strip(): leading and trailing
+    # blank lines are dropped and the outer lines are stripped, so that
+    # the document is only joined once
+    start, end = 0, len(body)
+    while start < end and not body[start].strip():
+        start += 1
+    while end > start and not body[end - 1].strip():
+        end -= 1
+    lines = body[start:end]
+    if not lines:
+        return toc_markdown if splices is None else ''
+    lines[0] = lines[0].lstrip()
+    lines[-1] = lines[-1].rstrip()
 
-    if placeholder:
-        markdown = body_markdown.replace(placeholder, toc_markdown)
+    if splices is None:
+        lines[0] = toc_markdown + lines[0]
     else:
-        markdown = toc_markdown + body_markdown
-
-    return markdown
+        for index, count in splices.items():
+            if start <= index < end:
+                lines[index - start] = lines[index - start].replace(placeholder, toc_markdown,
+                                                                    count)
+    return '\n'.join(lines)
 
 
-def output_markdown(markdown_cont, output_file):
+def iter_markdown(toc_headlines, body, spacer=0, placeholder=None,
+                  placeholder_lines=None, multiple_placeholders='all',
+                  missing_placeholder='ignore'):
     """
-    Writes to an output file if `outfile` is a valid path.
+    Lazy version of build_markdown that yields the Markdown output
+    in chunks instead of joining the document into a single string.
+    `body` can be any iterable of lines, but it is held in memory if
+    there is a placeholder and `placeholder_lines` is None.
+    `''.join(iter_markdown(...))` equals `build_markdown(...)`.
+
+    The placeholder policies are applied (and a PlaceholderError is
+    raised) when iter_markdown is called, before any output is produced.
 
     """
-    if output_file:
-        with open(output_file, 'w') as out:
-            out.write(markdown_cont)
+    toc_markdown = _toc_markdown(toc_headlines, spacer)
+    splices = None
+    if placeholder:
+        if placeholder_lines is None:
+            body = list(body)
+            placeholder_lines = _placeholder_lines(body, placeholder)
+        splices = _select_placeholders(placeholder, placeholder_lines,
+                                       multiple_placeholders, missing_placeholder)
+    return _iter_markdown(toc_markdown, body, placeholder, splices)
 
 
-def markdown_toclify(input_file, output_file=None, github=False,
-                     back_to_top=False, nolink=False,
-                     no_toc_header=False, spacer=0, placeholder=None,
-                     exclude_h=None, remove_dashes=False):
-    """ Function to add table of contents to markdown files.
+def _iter_markdown(toc_markdown, body, placeholder, splices):
+    if splices is None:
+        yield toc_markdown
+        splices = {}
 
-    Parameters
-    -----------
+    # equivalent of "\n".join(body).strip() without holding the body:
+    # leading blank lines are dropped, and trailing blank lines are
+    # held back until the next non-blank line shows up
+    first = True
+    pending = []
+    # index of the line in pending[0]
+    last_index = None
+    for index, l in enumerate(body):
+        if not l.strip():
+            if not first:
+                pending.append(l)
+            continue
+        if first:
+            l = l.lstrip()
+        if pending:
+            last = pending[0]
+            blanks = pending[1:]
+            pending = []
+            if last_index in splices:
+                last = last.replace(placeholder, toc_markdown, splices[last_index])
+            yield last
+            for b in blanks:
+                yield '\n' + b
+            yield '\n'
+        pending.append(l)
+        last_index = index
+        first = False
+
+    if pending:
+        last = pending[0].rstrip()
+        if last_index in splices:
+            last = last.replace(placeholder, toc_markdown, splices[last_index])
+        yield last
+
+
+def _toc_markdown(toc_headlines, spacer=0):
+    """Joins the TOC lines and the spacer."""
+    if spacer:
+        spacer_line = ['\n<div style="height:%spx;"></div>\n' % (spacer)]
+        return "\n".join(toc_headlines + spacer_line)
+    return "\n".join(toc_headlines)
+
+
+class PlaceholderError(ValueError):
+    """
+    Raised if a document has more than one placeholder or none at all
+    and the `multiple_placeholders` or `missing_placeholder` policy
+    is 'error', or if a TOC_BEGIN line has no TOC_END line in
+    round-trip mode.
+
+    """
+
+
+def _placeholder_lines(lines, placeholder):
+    """
+    Returns the (index, count) tuples of the `lines` that contain the
+    placeholder outside of code blocks like tag_and_collect.
+
+    """
+    found = []
+    block = None
+    for index, l in enumerate(lines):
+        # fast path for lines that can neither contain a placeholder
+        # nor open or close a block
+        if block is None:
+            if placeholder not in l and '`' not in l and '~' not in l and '<' not in l:
+                continue
+        elif block[1][0] not in l:
+            continue
+        stripped = l.lstrip()
+        indent = len(l) - len(stripped)
+        if block is not None:
+            if _closes_block(block, stripped, indent):
+                block = None
+            continue
+        if stripped[:1] in _BLOCK_START_CHARS and indent <= 3:
+            block = _open_block(stripped)
+            if block is not None and _closes_block(block, stripped, opening=True):
+                block = None
+        # the line that opens a block may contain a placeholder, too
+        if placeholder in stripped:
+            found.append((index, stripped.count(placeholder)))
+    return found
+
+
+def _select_placeholders(placeholder, found, multiple_placeholders='all',
+                         missing_placeholder='ignore'):
+    """
+    Applies the placeholder policies to the (position, count) tuples of
+    the placeholders that were found in a document. Returns a dict that
+    maps the positions onto the number of placeholders that are replaced
+    there, or None if the TOC is inserted at the top of the document.
+
+    """
+    if multiple_placeholders not in MULTIPLE_PLACEHOLDERS:
+        raise ValueError('multiple_placeholders must be one of %s' % (MULTIPLE_PLACEHOLDERS,))
+    if missing_placeholder not in MISSING_PLACEHOLDER:
+        raise ValueError('missing_placeholder must be one of %s' % (MISSING_PLACEHOLDER,))
+    total = sum(count for _, count in found)
+    if not total:
+        if missing_placeholder == 'error':
+            raise PlaceholderError('placeholder %r not found' % placeholder)
+        if missing_placeholder == 'top':
+            return None
+        return {}
+    if total > 1:
+        if multiple_placeholders == 'error':
+            raise PlaceholderError('placeholder %r found %d times' % (placeholder, total))
+        if multiple_placeholders == 'first':
+            return {found[0][0]: 1}
+    return dict(found)
+
+
+def output_markdown(markdown_cont, output_file, newline=None):
+    """
+    Writes to an output file if `outfile` is a valid path
+    (`newline` like in `open`, e.g., '' to keep the line breaks).
+
+    """
+    if output_file:
+        with open(output_file, 'w', newline=newline) as out:
+            out.write(markdown_cont)
+
+
+class _StageTimer(object):
+    """
+    Measures the wall time of consecutive stages of the pipeline for the
+    `stats` callbacks; `lap` does nothing if the timer is not enabled.
+
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.headings = None
+        self.lines = None
+        self.start = self._last = time.perf_counter()
+        self._slug_cache = _slugify_cached.cache_info()
+
+    def lap(self, stage):
+        """Adds the time since the previous lap to `stage`."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def record(self, input_file):
+        """Returns the statistics of the run as a JSON-serializable dict."""
+        slug_cache = _slugify_cached.cache_info()
+        try:
+            n_bytes = os.path.getsize(input_file)
+        except OSError:
+            n_bytes = None
+        return dict(input_file=input_file,
+                    bytes=n_bytes,
+                    lines=self.lines,
+                    headings=self.headings,
+                    seconds=self._last - self.start,
+                    stages=self.stages,
+                    slug_cache=dict(hits=slug_cache.hits - self._slug_cache.hits,
+                                    misses=slug_cache.misses - self._slug_cache.misses),
+                    peak_rss=_peak_rss())
+
+
+_NO_TIMER = _StageTimer(enabled=False)
+
+
+def _peak_rss():
+    """Returns the peak resident set size of the process in bytes (or None)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def markdown_toclify(input_file, output_file=None, github=False,
+                     back_to_top=False, nolink=False,
+                     no_toc_header=False, spacer=0, placeholder=None,
+                     exclude_h=None, remove_dashes=False, unique_slugs=False,
+                     cache_dir=None, index_file=None, in_place=False,
+                     min_depth=1, max_depth=6, max_children=None, stats=None,
+                     multiple_placeholders='all', missing_placeholder='ignore',
+                     slug_flavor='default', setext=False, toc_outputs=None,
+                     roundtrip=False):
+    """ Function to add table of contents to markdown files.
+
+    Parameters
+    -----------
       input_file: str
         Path to the markdown input file.
 
-      output_file: str (defaul: None)
-        Path to the markdown output file.
+      output_file: str (defaul: None)
+        Path to the markdown output file.
+
+      github: bool (default: False)
+        Uses GitHub TOC syntax if True.
+
+      back_to_top: bool (default: False)
+        Inserts back-to-top links below headings if True.
+
+      nolink: bool (default: False)
+        Creates the table of contents without internal links if True.
+
+      no_toc_header: bool (default: False)
+        Suppresses the Table of Contents header if True
+
+      spacer: int (default: 0)
+        Inserts horizontal space (in pixels) after the table of contents.
+
+      placeholder: str (default: None)
+        Inserts the TOC at the placeholder string instead
+        of inserting the TOC at the top of the document.
+        Placeholders in code blocks and HTML blocks are
+        not replaced, and a placeholder must not span
+        multiple lines. A placeholder in the line that
+        opens a block is replaced, so that placeholders
+        can be HTML comments like '<!-- toc -->'.
+
+      exclude_h: list (default None)
+        Excludes header levels, e.g., if [2, 3], ignores header
+        levels 2 and 3 in the TOC.
+
+      remove_dashes: bool (default: False)
+        Removes dashes from headline slugs
+
+      unique_slugs: bool (default: False)
+        Appends GitHub-style suffixes to duplicate slugs, e.g.,
+        'parameters', 'parameters-1', 'parameters-2', so that
+        every TOC entry links to its own headline.
+
+      slug_flavor: str (default: 'default')
+        Name of the registered slug flavor that creates the anchors,
+        e.g., 'github', 'gitlab', 'pandoc' or 'mkdocs' to match the
+        anchors of these renderers (see `register_slug_flavor`).
+
+      setext: bool (default: False)
+        Adds Setext headlines (a single text line underlined by '==='
+        for level 1 or '---' for level 2) to the TOC, too.
+
+      roundtrip: bool (default: False)
+        Keeps all lines of the document as they are except for the
+        anchor tags and [back to top] links of the headlines and puts
+        the TOC between TOC_BEGIN and TOC_END comment lines. A TOC
+        between such lines is replaced by the new TOC, so that running
+        markdown_toclify again on its output returns the same contents.
+        The line breaks of the document (those of its first line) are
+        kept, too. The placeholder is only used if the document has no such TOC.
+        Cannot be combined with `setext`.
+
+      multiple_placeholders: str (default: 'all')
+        What to do if the placeholder occurs more than once:
+        'all' replaces every placeholder by the TOC, 'first'
+        only the first one, and 'error' raises a PlaceholderError.
+
+      missing_placeholder: str (default: 'ignore')
+        What to do if the placeholder does not occur in the document:
+        'ignore' leaves the document without a TOC, 'top' inserts
+        the TOC at the top of the document, and 'error' raises a
+        PlaceholderError.
+
+      cache_dir: str (default: None)
+        Directory of a cache for the Markdown output keyed by a hash
+        of the input file contents and the options above. The TOC is
+        only generated on a cache miss, and an output file that is
+        already up to date is not rewritten. See also `prune_cache`.
+
+      index_file: str (default: None)
+        Path to a headline index file with the text, slug, level,
+        line number and byte offset of every headline in the input
+        file (see `write_headline_index`).
+
+      toc_outputs: dict (default: None)
+        Maps TOC formats ('markdown', 'html' or 'json') onto paths of
+        output files for the TOC on its own, e.g., {'html': 'nav.html'}.
+        All formats are rendered from the headlines of the same parse
+        (see `render_toc`). The files are written on cache hits, too,
+        but the headlines have to be collected from the input file then.
+
+      in_place: bool (default: False)
+        Rewrites the input file instead of writing to `output_file`.
+        The file is only written if its contents change, and then
+        atomically (a temporary file replaces the input file), so
+        that unchanged files keep their modification times.
+
+      min_depth, max_depth: int (default: 1, 6)
+        Range of the header levels in the TOC. The headlines of other
+        levels are excluded like the levels in `exclude_h`; they are
+        not slugified (unless `unique_slugs` is True) and do not get
+        anchor tags.
+
+      max_children: int (default: None)
+        Maximum number of entries below every TOC entry (and on the
+        top level of the TOC). Further entries and their subentries
+        are collapsed into a single 'more...' entry that links to
+        the first of them.
+
+      stats: callable (default: None)
+        Called with a dict of statistics about the run when it is
+        finished: the wall time of the individual stages ('stages',
+        e.g., 'read', 'tag_and_collect' (incl. slugifying) and
+        'build_markdown') and in total ('seconds'), the size of the input
+        file in bytes, the number of lines and headings, the hits and
+        misses of the slug cache and the peak resident set size of the
+        process in bytes ('peak_rss'). Values that are not known, e.g.,
+        the headings on a cache hit, are None. The dict can be
+        serialized with `json.dumps`.
+
+    Returns
+    -----------
+    cont: str
+      Markdown contents including the TOC.
+
+    """
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    options = dict(github=github,
+                   back_to_top=back_to_top,
+                   nolink=nolink,
+                   no_toc_header=no_toc_header,
+                   spacer=spacer,
+                   placeholder=placeholder,
+                   exclude_h=exclude_h,
+                   remove_dashes=remove_dashes,
+                   unique_slugs=unique_slugs,
+                   max_children=max_children,
+                   multiple_placeholders=multiple_placeholders,
+                   missing_placeholder=missing_placeholder,
+                   slug_flavor=slug_flavor,
+                   setext=setext,
+                   roundtrip=roundtrip)
+    # the line breaks are kept in round-trip mode
+    newline = '' if roundtrip else None
+
+    if in_place:
+        output_file = input_file
+    _check_toc_outputs(toc_outputs)
+    timer = _StageTimer() if stats is not None else _NO_TIMER
+    toc_headlines = [] if toc_outputs else None
+
+    if cache_dir:
+        with open(input_file, 'rb') as inf:
+            raw = inf.read()
+        timer.lap('read')
+        key = _cache_key(raw, options)
+        cont = _cache_lookup(cache_dir, key)
+        timer.lap('cache_lookup')
+        # decode like read_lines (default encoding, universal newlines)
+        text = None
+        if cont is None or index_file or toc_outputs:
+            text = io.TextIOWrapper(io.BytesIO(raw), newline=newline).read()
+            timer.lap('decode')
+        if cont is None:
+            cont = _toclify_text(text, headlines=toc_headlines, timer=timer, **options)
+            _cache_store(cache_dir, key, cont)
+            timer.lap('cache_store')
+        elif toc_outputs:
+            _, raw_headlines = tag_and_collect(remove_lines(_NEWLINE.split(text)[::2]),
+                                               id_tag=False,
+                                               exclude_h=exclude_h,
+                                               remove_dashes=remove_dashes,
+                                               unique_slugs=unique_slugs,
+                                               slug_flavor=slug_flavor,
+                                               setext=setext)
+            toc_headlines = positioning_headlines(raw_headlines)
+            timer.lap('tag_and_collect')
+        if in_place:
+            _replace_output(cont, output_file, newline)
+        elif output_file and not _output_is_current(cont, output_file, newline):
+            output_markdown(cont, output_file, newline)
+    else:
+        if index_file:
+            # the byte offsets in the index depend on the line terminators
+            with open(input_file, 'rb') as inf:
+                raw = inf.read()
+            text = io.TextIOWrapper(io.BytesIO(raw), newline=newline).read()
+        else:
+            with open(input_file, 'r', newline=newline) as inf:
+                text = inf.read()
+        timer.lap('read')
+        cont = _toclify_text(text, headlines=toc_headlines, timer=timer, **options)
+        if in_place:
+            _replace_output(cont, output_file, newline)
+        elif output_file and not _output_is_current(cont, output_file, newline):
+            output_markdown(cont, output_file, newline)
+    timer.lap('output')
+
+    if toc_outputs:
+        _write_toc_outputs(toc_headlines, toc_outputs, nolink=nolink,
+                           no_toc_header=no_toc_header, max_children=max_children)
+        timer.lap('toc_outputs')
+
+    if index_file:
+        lines, newlines, encoding = _split_raw_lines(raw)
+        entries = headline_index(lines, exclude_h=exclude_h,
+                                 remove_dashes=remove_dashes,
+                                 unique_slugs=unique_slugs,
+                                 encoding=encoding,
+                                 slug_flavor=slug_flavor,
+                                 setext=setext,
+                                 newlines=newlines)
+        write_headline_index(index_file, entries, source=input_file)
+        timer.lap('index')
+
+    if stats is not None:
+        if text is not None:
+            timer.lines = text.count('\n') + 1
+        stats(timer.record(input_file))
+    return cont
+
+
+def toclify_text(text, encoding='utf-8', exclude_h=None, min_depth=1, max_depth=6,
+                 **options):
+    """ Adds a table of contents to Markdown contents in memory.
+
+    Parameters
+    -----------
+      text: str, bytes, bytearray or memoryview
+        Markdown contents. Binary input is decoded with `encoding`
+        directly from the buffer (without an intermediate bytes copy).
+
+      encoding: str (default: 'utf-8')
+        Encoding of binary input and output.
+
+      exclude_h, min_depth, max_depth:
+        Header levels in the TOC (see `markdown_toclify`).
+
+      **options:
+        Keyword arguments of `markdown_toclify`, e.g., `github=True`.
+
+    Returns
+    -----------
+    cont: str or bytes
+      Markdown contents including the TOC; bytes if `text` is binary.
+
+    """
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    binary = not isinstance(text, str)
+    if binary:
+        text = str(text, encoding)
+    # universal newlines as in read_lines (the round trip keeps the line breaks)
+    if '\r' in text and not options.get('roundtrip'):
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    cont = _toclify_text(text, exclude_h=exclude_h, **options)
+    if binary:
+        return cont.encode(encoding)
+    return cont
+
+
+def toclify_stream(in_fp, out_fp=None, encoding='utf-8', **options):
+    """ Adds a table of contents to Markdown contents read from a file object.
+
+    Parameters
+    -----------
+      in_fp: file object
+        Text or binary file object (e.g., `sys.stdin`, `io.BytesIO`)
+        with the Markdown contents.
+
+      out_fp: file object (default: None)
+        File object the output is written to. Receives bytes
+        if `in_fp` is a binary file object.
+
+      encoding: str (default: 'utf-8')
+        Encoding of binary input and output.
+
+      **options:
+        Keyword arguments of `markdown_toclify`, e.g., `github=True`.
+
+    Returns
+    -----------
+    cont: str or bytes
+      Markdown contents including the TOC.
+
+    """
+    cont = toclify_text(in_fp.read(), encoding=encoding, **options)
+    if out_fp is not None:
+        out_fp.write(cont)
+    return cont
+
+
+def _toclify_lines(raw_contents, github=False, back_to_top=False,
+                   nolink=False, no_toc_header=False, spacer=0,
+                   placeholder=None, exclude_h=None, remove_dashes=False,
+                   unique_slugs=False, max_children=None,
+                   multiple_placeholders='all', missing_placeholder='ignore',
+                   slug_flavor='default', setext=False, headlines=None,
+                   timer=_NO_TIMER):
+    """
+    Runs the markdown_toclify pipeline on a list of lines. The
+    left-justified headlines are appended to `headlines` (if given).
+
+    """
+    cleaned_contents = remove_lines(raw_contents, remove=('[[back to top]', '<a class="mk-toclify"'))
+    timer.lap('remove_lines')
+    placeholders = [] if placeholder else None
+    # the untagged lines are written if nolink is True, so that the
+    # placeholder lines are collected without inserting any lines
+    processed_contents, raw_headlines = tag_and_collect(
+                                            cleaned_contents,
+                                            id_tag=not github and not nolink,
+                                            back_links=back_to_top and not nolink,
+                                            exclude_h=exclude_h,
+                                            remove_dashes=remove_dashes,
+                                            unique_slugs=unique_slugs,
+                                            placeholder=placeholder,
+                                            placeholders=placeholders,
+                                            slug_flavor=slug_flavor,
+                                            setext=setext
+                                            )
+    timer.lap('tag_and_collect')
+    timer.headings = len(raw_headlines)
+    return _render_markdown(cleaned_contents, processed_contents,
+                            raw_headlines, github=github, nolink=nolink,
+                            no_toc_header=no_toc_header, spacer=spacer,
+                            placeholder=placeholder, max_children=max_children,
+                            placeholder_lines=placeholders,
+                            multiple_placeholders=multiple_placeholders,
+                            missing_placeholder=missing_placeholder,
+                            headlines=headlines, timer=timer)
+
+
+def _toclify_text(text, placeholder=None, setext=False, roundtrip=False,
+                  headlines=None, timer=_NO_TIMER, **options):
+    """
+    Runs the markdown_toclify pipeline on a whole document (with '\n'
+    line breaks) with tag_and_collect_text. Documents with placeholders
+    or Setext headlines are split into lines for _toclify_lines.
+
+    """
+    if roundtrip:
+        if setext:
+            raise ValueError('Setext headlines are not supported in round-trip mode')
+        return _roundtrip_toclify(text, placeholder=placeholder, headlines=headlines,
+                                  timer=timer, **options)
+    if placeholder or setext:
+        return _toclify_lines(text.split('\n'), placeholder=placeholder,
+                              setext=setext, headlines=headlines, timer=timer,
+                              **options)
+    return _bulk_toclify(text, headlines=headlines, timer=timer, **options)
+
+
+def _bulk_toclify(text, github=False, back_to_top=False, nolink=False,
+                  no_toc_header=False, spacer=0, exclude_h=None,
+                  remove_dashes=False, unique_slugs=False, max_children=None,
+                  multiple_placeholders='all', missing_placeholder='ignore',
+                  slug_flavor='default', headlines=None, timer=_NO_TIMER):
+    """_toclify_lines for documents without placeholders and Setext headlines."""
+    raw_headlines = []
+    body = tag_and_collect_text(text, raw_headlines,
+                                id_tag=not github and not nolink,
+                                back_links=back_to_top and not nolink,
+                                exclude_h=exclude_h,
+                                remove_dashes=remove_dashes,
+                                unique_slugs=unique_slugs,
+                                slug_flavor=slug_flavor,
+                                strip_indent=not nolink)
+    timer.lap('tag_and_collect')
+    timer.headings = len(raw_headlines)
+    # build_markdown strips the body, which is a single "line" here
+    return _render_markdown([body], [body], raw_headlines, github=github,
+                            nolink=nolink, no_toc_header=no_toc_header,
+                            spacer=spacer, max_children=max_children,
+                            headlines=headlines, timer=timer)
+
+
+def _roundtrip_toclify(text, github=False, back_to_top=False, nolink=False,
+                       no_toc_header=False, spacer=0, placeholder=None,
+                       exclude_h=None, remove_dashes=False, unique_slugs=False,
+                       max_children=None, multiple_placeholders='all',
+                       missing_placeholder='ignore', slug_flavor='default',
+                       headlines=None, timer=_NO_TIMER):
+    """
+    Round-trip version of _bulk_toclify: all lines are kept as they are
+    except for the old anchor tags and [back to top] links, which are
+    replaced, and the TOC is put between TOC_BEGIN and TOC_END lines.
+    The TOCs between such lines are replaced by the new TOC; otherwise,
+    the TOC is inserted at the placeholder or on top of the document.
+
+    """
+    # the document is processed with '\n' line breaks and returned with
+    # its own line terminator (that of its first line)
+    newline = '\n'
+    if '\r' in text:
+        newline = _NEWLINE.search(text).group(1)
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    # the TOCs are cut out and replaced by a string that is not in the text
+    sentinel = '\0'
+    while sentinel in text:
+        sentinel += '\0'
+    if TOC_BEGIN in text:
+        text, found = _cut_toc_regions(text, sentinel)
+    else:
+        found = False
+    raw_headlines = []
+    body = tag_and_collect_text(text, raw_headlines,
+                                id_tag=not github and not nolink,
+                                back_links=back_to_top and not nolink,
+                                exclude_h=exclude_h,
+                                remove_dashes=remove_dashes,
+                                unique_slugs=unique_slugs,
+                                slug_flavor=slug_flavor,
+                                strip_indent=False)
+    timer.lap('tag_and_collect')
+    timer.headings = len(raw_headlines)
+
+    leftjustified_headlines = positioning_headlines(raw_headlines)
+    if headlines is not None:
+        headlines.extend(leftjustified_headlines)
+    processed_headlines = create_toc(leftjustified_headlines,
+                                     hyperlink=not nolink,
+                                     top_link=not nolink and not github,
+                                     no_toc_header=no_toc_header,
+                                     max_children=max_children)
+    toc = '%s\n%s\n%s' % (TOC_BEGIN, _toc_markdown(processed_headlines, spacer).strip('\n'),
+                          TOC_END)
+    timer.lap('create_toc')
+
+    if found:
+        cont = body.replace(sentinel, toc)
+    elif not placeholder:
+        cont = toc + '\n' + body if body else toc
+    else:
+        lines = body.split('\n')
+        splices = _select_placeholders(placeholder, _placeholder_lines(lines, placeholder),
+                                       multiple_placeholders, missing_placeholder)
+        if splices is None:
+            cont = toc + '\n' + body if body else toc
+        else:
+            for index, count in splices.items():
+                # the TOC markers are kept on lines of their own
+                parts = lines[index].split(placeholder, count)
+                for i in range(len(parts) - 1):
+                    if parts[i].strip():
+                        parts[i] += '\n'
+                    if parts[i + 1].strip():
+                        parts[i + 1] = '\n' + parts[i + 1]
+                lines[index] = toc.join(parts)
+            cont = '\n'.join(lines)
+    if newline != '\n':
+        cont = cont.replace('\n', newline)
+    timer.lap('build_markdown')
+    return cont
+
+
+def _cut_toc_regions(text, sentinel):
+    """
+    Replaces the TOCs from the TOC_BEGIN lines to the next TOC_END lines
+    outside of code blocks by `sentinel`. Returns the new text and
+    whether any TOC was found.
+
+    """
+    lines = text.split('\n')
+    out = []
+    found = False
+    block = None
+    index = 0
+    while index < len(lines):
+        l = lines[index]
+        stripped = l.lstrip()
+        indent = len(l) - len(stripped)
+        if block is not None:
+            if _closes_block(block, stripped, indent):
+                block = None
+        elif stripped.rstrip() == TOC_BEGIN:
+            for end in range(index + 1, len(lines)):
+                if lines[end].strip() == TOC_END:
+                    break
+            else:
+                raise PlaceholderError('line %d: %r without %r'
+                                       % (index + 1, TOC_BEGIN, TOC_END))
+            # the whitespace around the markers is kept
+            tail = lines[end][lines[end].index(TOC_END) + len(TOC_END):]
+            out.append(l[:indent] + sentinel + tail)
+            found = True
+            index = end + 1
+            continue
+        elif stripped[:1] in _BLOCK_START_CHARS and indent <= 3:
+            block = _open_block(stripped)
+            if block is not None and _closes_block(block, stripped, opening=True):
+                block = None
+        out.append(l)
+        index += 1
+    if not found:
+        return text, False
+    return '\n'.join(out), True
+
+
+def _render_markdown(cleaned_contents, processed_contents, raw_headlines,
+                     github=False, nolink=False, no_toc_header=False,
+                     spacer=0, placeholder=None, max_children=None,
+                     placeholder_lines=None, multiple_placeholders='all',
+                     missing_placeholder='ignore', headlines=None,
+                     timer=_NO_TIMER):
+    """Creates the TOC from the collected headlines and builds the output."""
+    leftjustified_headlines = positioning_headlines(raw_headlines)
+    if headlines is not None:
+        headlines.extend(leftjustified_headlines)
+    processed_headlines = create_toc(leftjustified_headlines,
+                                     hyperlink=not nolink,
+                                     top_link=not nolink and not github,
+                                     no_toc_header=no_toc_header,
+                                     max_children=max_children)
+    timer.lap('create_toc')
+
+    if nolink:
+        processed_contents = cleaned_contents
+
+    cont = build_markdown(toc_headlines=processed_headlines,
+                          body=processed_contents,
+                          spacer=spacer,
+                          placeholder=placeholder,
+                          placeholder_lines=placeholder_lines,
+                          multiple_placeholders=multiple_placeholders,
+                          missing_placeholder=missing_placeholder)
+    timer.lap('build_markdown')
+    return cont
+
+
+def check_toc(input_file, github=False, back_to_top=False, nolink=False,
+              no_toc_header=False, exclude_h=None, remove_dashes=False,
+              unique_slugs=False, min_depth=1, max_depth=6, max_children=None,
+              slug_flavor='default', setext=False):
+    """ Checks if the table of contents of a markdown file is up to date.
+
+    The file is read line by line in a single pass that stops at the
+    first mismatch, and no output document is built. The TOC is found
+    at the '# Table of Contents' line (or at the first list item of
+    the document if `no_toc_header` is True), and its entries are
+    compared with the headlines of the document. Unless `github` or
+    `nolink` is True, every headline in the TOC also has to be preceded
+    by its anchor tag, and if `back_to_top` is True, every headline has
+    to be followed by a [back to top] link. Anchor tags and links that
+    markdown_toclify would remove make the TOC out of date, too.
+
+    Takes the same parameters as `markdown_toclify`, except for the
+    ones that change neither the TOC nor the headlines.
+
+    Returns
+    -----------
+    mismatch: str or None
+      None if the TOC is up to date, or a description
+      of the first mismatch.
+
+    """
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    toc = {}
+    # headlines that were found before the TOC
+    pending = []
+    # the TOC entries are indented by the left-justified levels, which
+    # are shifted by one if there are no level-1 headlines
+    shifts = (0, 1)
+    # the shift is decided before max_children drops any headlines
+    levels = set()
+    position = 0
+
+    # the body is not tagged if nolink is True
+    headlines = _iter_check_headlines(iter_lines(input_file), toc,
+                                      id_tag=not github and not nolink,
+                                      back_links=back_to_top and not nolink,
+                                      top_link=not (github or nolink or no_toc_header),
+                                      no_toc_header=no_toc_header,
+                                      exclude_h=exclude_h,
+                                      remove_dashes=remove_dashes,
+                                      unique_slugs=unique_slugs,
+                                      slug_flavor=_slug_flavor(slug_flavor),
+                                      setext=setext)
+    if max_children is not None:
+        headlines = _collapse_headlines(_record_levels(headlines, levels),
+                                        max_children)
+    try:
+        # the trailing None matches the headlines that precede a TOC
+        # at the end of the document
+        for headline in itertools.chain(headlines, [None]):
+            if headline is not None:
+                levels.add(headline[2])
+                pending.append(headline)
+            if 'entries' not in toc:
+                continue
+            entries = toc['entries']
+            for h in pending:
+                if position == len(entries):
+                    return 'headline %r is not in the TOC' % h[0]
+                number, entry = entries[position]
+                shifts = tuple(shift for shift in shifts
+                               if entry == _toc_entry(h, shift, not nolink))
+                if not shifts:
+                    return 'line %d: TOC entry %r does not match headline %r' % (
+                        number, entry, h[0])
+                position += 1
+            pending = []
+    except _TocMismatch as e:
+        return str(e)
+    finally:
+        headlines.close()
+
+    if 'entries' not in toc:
+        if no_toc_header and not pending:
+            # the TOC of a document without headlines is empty
+            return None
+        return 'no table of contents found'
+    entries = toc['entries']
+    if position < len(entries):
+        return 'line %d: TOC entry %r has no headline' % entries[position]
+    if (0 if 1 in levels else 1) not in shifts:
+        return 'the TOC entries are not indented like the headline levels'
+    return None
+
+
+def _record_levels(headlines, levels):
+    """Yields the headlines and adds their levels to the set `levels`."""
+    for headline in headlines:
+        levels.add(headline[2])
+        yield headline
+
+
+class _TocMismatch(Exception):
+    """Raised by _iter_check_headlines at the first mismatch."""
+
+
+def _toc_entry(headline, shift=0, hyperlink=True):
+    """Renders a TOC entry like create_toc for a headline level shifted by `shift`."""
+    indent = (headline[2] - 1 - shift) * '    '
+    if hyperlink:
+        return '%s- [%s](#%s)' % (indent, headline[0], headline[1])
+    return '%s- %s' % (indent, headline[0])
+
+
+def _iter_check_headlines(lines, toc, id_tag=True, back_links=False,
+                          top_link=False, no_toc_header=False, exclude_h=None,
+                          remove_dashes=False, unique_slugs=False,
+                          slug_flavor=None, setext=False):
+    """
+    Yields the headlines of a markdown document for check_toc and stores
+    the (line number, entry) tuples of the TOC in toc['entries'] when
+    the TOC is found. Raises _TocMismatch if an anchor tag or a
+    [back to top] link is missing or does not belong to a headline.
+
+    """
+    back_link = '[[back to top](#table-of-contents)]'
+    top_anchor = '<a class="mk-toclify" id="table-of-contents"></a>'
+    seen = {} if unique_slugs else None
+    block = None
+    entries = None
+    # (line number, line) of an anchor tag that needs a headline
+    anchor = None
+    top_anchor_line = None
+    # line number of the last headline if it needs a [back to top] link
+    back_link_for = None
+    levels = [None]
+    if setext:
+        lines = _iter_setext(lines, levels, ('[[back to top]', '<a class="mk-toclify"'))
+    for number, l in enumerate(lines, 1):
+        if back_link_for is not None:
+            if l != back_link:
+                raise _TocMismatch('line %d: [back to top] link missing' % back_link_for)
+            back_link_for = None
+            continue
+        if entries is not None:
+            if l.lstrip(' ').startswith('- '):
+                entries.append((number, l))
+                continue
+            # end of the TOC
+            entries = None
+
+        if l.startswith('[[back to top]'):
+            raise _TocMismatch('line %d: [back to top] link without headline' % number)
+        if l.startswith('<a class="mk-toclify"'):
+            if anchor is not None:
+                break
+            if top_link and l == top_anchor:
+                top_anchor_line = number
+            else:
+                anchor = number, l
+            continue
+
+        if block is None and 'entries' not in toc:
+            if no_toc_header:
+                found = l.lstrip(' ').startswith('- ')
+            else:
+                found = l == '# Table of Contents'
+            if found:
+                if anchor is not None:
+                    break
+                # create_toc puts the anchor tag and a blank line above the header
+                if top_link and top_anchor_line != number - 2:
+                    raise _TocMismatch('line %d: anchor tag of the TOC missing' % number)
+                entries = toc['entries'] = []
+                if no_toc_header:
+                    entries.append((number, l))
+                continue
+
+        out, headline, block = _tag_line(l, block, id_tag=False,
+                                         back_links=back_links,
+                                         exclude_h=exclude_h,
+                                         remove_dashes=remove_dashes,
+                                         seen=seen,
+                                         slug_flavor=slug_flavor,
+                                         setext=levels[0])
+        if headline is not None:
+            if id_tag:
+                if anchor is None or anchor[1] != '<a class="mk-toclify" id="%s"></a>' % (headline.slug):
+                    raise _TocMismatch('line %d: anchor tag missing for headline %r'
+                                       % (number, headline.text))
+                anchor = None
+            headline.line = number
+            yield headline
+        if anchor is not None:
+            break
+        if len(out) > 1:
+            # excluded headlines get [back to top] links, too
+            back_link_for = number
+
+    if anchor is not None:
+        raise _TocMismatch('line %d: anchor tag without headline' % anchor[0])
+    if back_link_for is not None:
+        raise _TocMismatch('line %d: [back to top] link missing' % back_link_for)
+
+
+def headline_index(lines, exclude_h=None, remove_dashes=False,
+                   unique_slugs=False, encoding='utf-8',
+                   slug_flavor='default', setext=False, newlines=None):
+    """
+    Collects the headlines of a markdown document together with
+    their positions in the document.
+
+    Keyword arguments:
+        lines: list of lines of the markdown document
+            as returned by read_lines.
+        exclude_h: header levels to exclude. E.g., [2, 3]
+        remove_dashes: removes dashes from the slugs if True.
+        unique_slugs: appends suffixes to duplicate slugs if True.
+        encoding: encoding used to compute the byte offsets.
+        slug_flavor: name of the slug flavor (see register_slug_flavor).
+        setext: collects Setext headlines, too, if True.
+        newlines: the line terminators of the lines in the file,
+            e.g., '\r\n' (see _split_raw_lines); '\n' if None.
+
+    Returns a list of (heading, slug, level, line, offset) tuples, where
+    `line` is the 1-based line number and `offset` the byte offset of
+    the headline in the document. The levels are not left-justified
+    (see positioning_headlines).
+
+    """
+    slug_flavor = _slug_flavor(slug_flavor)
+    entries = []
+    block = None
+    seen = {} if unique_slugs else None
+    offset = 0
+    remove = ('[[back to top]', '<a class="mk-toclify"')
+    levels = [None]
+    if setext:
+        lines = _iter_setext(lines, levels, remove)
+    if newlines is None:
+        newlines = itertools.repeat('\n')
+    for number, (l, newline) in enumerate(zip(lines, newlines), 1):
+        if not l.startswith(remove):
+            _, headline, block = _tag_line(l, block, id_tag=False,
+                                           exclude_h=exclude_h,
+                                           remove_dashes=remove_dashes,
+                                           seen=seen,
+                                           slug_flavor=slug_flavor,
+                                           setext=levels[0])
+            if headline is not None:
+                entries.append((headline.text, headline.slug, headline.level,
+                                number, offset))
+        offset += len((l + newline).encode(encoding))
+    return entries
+
+
+_NEWLINE = _LazyRegex(r'(\r\n|\r|\n)')
+
+
+def _split_raw_lines(raw):
+    """
+    Decodes the raw contents of a file like read_lines (default
+    encoding, universal newlines). Returns the lines, their original
+    line terminators and the name of the codec (see headline_index).
+
+    """
+    f = io.TextIOWrapper(io.BytesIO(raw), newline='')
+    parts = _NEWLINE.split(f.read())
+    return parts[::2], parts[1::2] + [''], f.encoding
+
+
+_INDEX_MAGIC = b'MTIX'
+
+_INDEX_VERSION = 1
+
+
+def write_headline_index(path, entries, source=None):
+    """
+    Writes a headline index (see headline_index) to `path`.
+
+    Indexes are written as JSON lines if `path` ends with '.jsonl' or
+    '.json': a first line with the source document followed by one
+    object per headline. All other paths get a compact binary format:
+    a header followed by arrays of the levels, line numbers, byte
+    offsets and string lengths, and the UTF-8 encoded strings.
+
+    """
+    if path.endswith(('.jsonl', '.json')):
+        import json
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'source': source, 'version': _INDEX_VERSION}) + '\n')
+            for text, slug, level, line, offset in entries:
+                f.write(json.dumps({'text': text, 'slug': slug, 'level': level,
+                                    'line': line, 'offset': offset}) + '\n')
+        return
+
+    import array
+    import struct
+    strings = [(source or '').encode('utf-8')]
+    for entry in entries:
+        strings.append(entry[0].encode('utf-8'))
+        strings.append(entry[1].encode('utf-8'))
+    levels = array.array('B', [e[2] for e in entries])
+    lines = array.array('I', [e[3] for e in entries])
+    offsets = array.array('Q', [e[4] for e in entries])
+    lengths = array.array('I', [len(b) for b in strings])
+    arrays = (levels, lines, offsets, lengths)
+    if sys.byteorder == 'big':
+        for a in arrays:
+            a.byteswap()
+    with open(path, 'wb') as f:
+        f.write(_INDEX_MAGIC + struct.pack('<BI', _INDEX_VERSION, len(entries)))
+        for a in arrays:
+            f.write(a.tobytes())
+        f.write(b''.join(strings))
+
+
+def read_headline_index(path):
+    """
+    Reads a headline index that was written by write_headline_index.
+    Returns a tuple of the source document and a list of
+    (heading, slug, level, line, offset) tuples.
+
+    """
+    if path.endswith(('.jsonl', '.json')):
+        import json
+        with io.open(path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            entries = []
+            for row in f:
+                e = json.loads(row)
+                entries.append((e['text'], e['slug'], e['level'],
+                                e['line'], e['offset']))
+        return header.get('source'), entries
+
+    import array
+    import struct
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != _INDEX_MAGIC:
+        raise ValueError('%s is not a headline index file' % path)
+    version, n = struct.unpack_from('<BI', data, 4)
+    if version != _INDEX_VERSION:
+        raise ValueError('unsupported headline index version %d' % version)
+    pos = 9
+    arrays = []
+    for typecode, count in (('B', n), ('I', n), ('Q', n), ('I', 2 * n + 1)):
+        a = array.array(typecode)
+        end = pos + a.itemsize * count
+        a.frombytes(data[pos:end])
+        if sys.byteorder == 'big':
+            a.byteswap()
+        arrays.append(a)
+        pos = end
+    levels, lines, offsets, lengths = arrays
+
+    strings = []
+    for length in lengths:
+        strings.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+    source = strings[0] or None
+    entries = [(strings[2 * i + 1], strings[2 * i + 2], levels[i], lines[i], offsets[i])
+               for i in range(n)]
+    return source, entries
+
+
+def build_site_toc(index_files, base_dir=None, hyperlink=True, top_level=False):
+    """
+    Creates a table of contents across several documents from their
+    saved headline indexes without parsing any markdown.
+
+    Keyword arguments:
+        index_files: paths to headline index files.
+        base_dir: the links are relative to this directory
+            (absolute source paths are used if None).
+        hyperlink: creates hyperlinks in Markdown format if True,
+            e.g., '- [Some header lvl1](docs/a.md#some-header-lvl1)'
+        top_level: if True, only the top-level headlines of
+            every document are included.
+
+    Returns a list of lines for a table of contents in Markdown format.
+
+    """
+    processed = []
+    for index_file in index_files:
+        source, entries = read_headline_index(index_file)
+        if not entries:
+            continue
+        if base_dir is not None and source:
+            source = os.path.relpath(source, base_dir)
+        source = (source or '').replace(os.sep, '/')
+        min_level = min(e[2] for e in entries)
+        for text, slug, level, _, _ in entries:
+            if top_level and level > min_level:
+                continue
+            indent = (level - min_level) * '    '
+            if hyperlink:
+                processed.append('%s- [%s](%s#%s)' % (indent, text, source, slug))
+            else:
+                processed.append('%s- %s' % (indent, text))
+    return processed
+
+
+def section_lookup(index_files):
+    """
+    Builds a jump-to-section lookup from saved headline indexes.
+    Returns a dict that maps every slug onto a list of
+    (source, line, offset) tuples of the sections with that slug.
+
+    """
+    lookup = {}
+    for index_file in index_files:
+        source, entries = read_headline_index(index_file)
+        for _, slug, _, line, offset in entries:
+            lookup.setdefault(slug, []).append((source, line, offset))
+    return lookup
+
+
+def _cache_key(raw, options):
+    """
+    Hashes the raw input file contents together with the options.
+    The slug flavor is hashed by its name and rules (see _flavor_key)
+    so that the key is the same in every process.
+
+    """
+    import hashlib
+    options = dict(options)
+    options['slug_flavor'] = _flavor_key(_slug_flavor(options.get('slug_flavor')))
+    if options.get('exclude_h') is not None:
+        options['exclude_h'] = sorted(options['exclude_h'])
+    h = hashlib.sha1(raw)
+    h.update(('\0%s\0%r' % (__version__, sorted(options.items()))).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _flavor_key(flavor):
+    """The registry name and the rules of a SlugFlavor (or None) as plain values."""
+    if flavor is None:
+        return None
+    patterns = tuple(r.pattern if r is not None else None
+                     for r in (flavor.remove, flavor.dash, flavor.leading))
+    return (flavor.name, flavor.ascii_only, sorted(flavor.delete or ()), patterns,
+            flavor.strip_spaces, flavor.lower, flavor.strip, flavor.replace,
+            flavor.empty, flavor.sep)
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.md')
+
+
+def _cache_lookup(cache_dir, key):
+    """Returns the cached Markdown output for `key` or None on a miss."""
+    path = _cache_path(cache_dir, key)
+    try:
+        with io.open(path, 'r', encoding='utf-8', newline='') as f:
+            cont = f.read()
+    except (IOError, OSError):
+        return None
+    # mark the entry as recently used for the LRU eviction
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return cont
+
+
+def _cache_store(cache_dir, key, cont):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(cache_dir, key)
+    tmp_path = _temp_path(path)
+    with io.open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(cont)
+    os.replace(tmp_path, path)
+
+
+def prune_cache(cache_dir, max_size=CACHE_MAX_SIZE):
+    """
+    Evicts the least recently used entries from a cache directory
+    (see the `cache_dir` argument of `markdown_toclify`) until
+    the total size of the entries is at most `max_size` bytes.
+
+    Returns the number of evicted entries.
+
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.md'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    evicted = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def _output_bytes(cont, newline=None):
+    """Encodes `cont` like a file that is opened for writing in text mode."""
+    f = io.TextIOWrapper(io.BytesIO(), newline=newline)
+    f.write(cont)
+    f.flush()
+    return f.detach().getvalue()
+
+
+def _holds_bytes(output_file, data):
+    """Returns True if `output_file` holds exactly the bytes `data`."""
+    try:
+        if os.path.getsize(output_file) != len(data):
+            return False
+        with open(output_file, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def _output_is_current(cont, output_file, newline=None):
+    """
+    Returns True if `output_file` already holds the contents `cont`,
+    byte for byte as output_markdown would write them.
+
+    """
+    return _holds_bytes(output_file, _output_bytes(cont, newline))
+
+
+def _temp_path(path):
+    """
+    Path of a temporary file next to `path` (on the same file system)
+    that is unique per process and thread, e.g., for the in-place writes
+    of toclify_async in the threads of the shared executor.
+
+    """
+    import threading
+    return '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+
+
+def _same_file(path1, path2):
+    """Checks if both paths refer to the same existing file."""
+    try:
+        return os.path.samefile(path1, path2)
+    except OSError:
+        return False
+
+
+def _replace_output(cont, output_file, newline=None):
+    """
+    Atomically replaces `output_file` by the contents `cont` unless
+    it already holds them. Returns True if the file was written.
+
+    """
+    data = _output_bytes(cont, newline)
+    if _holds_bytes(output_file, data):
+        return False
+    with _open_output(output_file, 'wb', in_place=True, compare=False) as out:
+        out.write(data)
+    return True
+
+
+def _open_output(output_file, mode='w', in_place=False, compare=True):
+    """
+    Opens `output_file` for writing. If `in_place` is True, the contents
+    are written to a temporary file that atomically replaces `output_file`
+    when the block is left without an exception, so that `output_file` is
+    never left half-written. If `compare` is True, the temporary file is
+    discarded instead if it has the same contents as `output_file`.
+
+    """
+    return _OutputFile(output_file, mode, in_place, compare)
+
+
+class _OutputFile(object):
+    """The context manager of _open_output."""
+
+    def __init__(self, output_file, mode, in_place, compare):
+        self.output_file = output_file
+        self.mode = mode
+        self.in_place = in_place
+        self.compare = compare
+        self.tmp_path = _temp_path(output_file) if in_place else None
+
+    def __enter__(self):
+        self.out = open(self.tmp_path or self.output_file, self.mode)
+        return self.out
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.in_place:
+            self.out.close()
+            return
+        import stat
+        tmp_path, output_file = self.tmp_path, self.output_file
+        try:
+            self.out.close()
+            if exc_type is None and (not self.compare or
+                                     not _same_contents(tmp_path, output_file)):
+                try:
+                    # keep the permissions of the replaced file
+                    os.chmod(tmp_path, stat.S_IMODE(os.stat(output_file).st_mode))
+                except OSError:
+                    pass
+                os.replace(tmp_path, output_file)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _same_contents(path1, path2, block_size=1024 * 1024):
+    """Compares two files block by block."""
+    try:
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+        with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+            while True:
+                b1 = f1.read(block_size)
+                if b1 != f2.read(block_size):
+                    return False
+                if not b1:
+                    return True
+    except OSError:
+        return False
+
+
+def markdown_toclify_stream(input_file, output_file=None, github=False,
+                            back_to_top=False, nolink=False,
+                            no_toc_header=False, spacer=0, placeholder=None,
+                            exclude_h=None, remove_dashes=False,
+                            unique_slugs=False, in_place=False,
+                            min_depth=1, max_depth=6, max_children=None,
+                            stats=None, multiple_placeholders='all',
+                            missing_placeholder='ignore', slug_flavor='default',
+                            setext=False, toc_outputs=None):
+    """ Streaming version of markdown_toclify for very large files.
+
+    The input file is read twice, once to collect the headlines
+    for the table of contents and once to write the document,
+    so that only the headlines are held in memory. The output
+    is written to `output_file` line by line; it is written to
+    the standard output if `output_file` is None.
+
+    Takes the same parameters as `markdown_toclify` (except for
+    `cache_dir` and `index_file`). The placeholders are found in the
+    first pass, too. In place, the new contents are compared with the
+    input file block by block before the input file is replaced.
+    The `stats` stages are 'collect' (the first pass), 'create_toc'
+    and 'write' (the second pass), and the lines are not counted.
+
+    Returns
+    -----------
+    headlines: list
+      The headlines in the table of contents.
+
+    """
+    if in_place:
+        output_file = input_file
+    elif output_file and _same_file(input_file, output_file):
+        # the input file is read again while the output is written
+        in_place = True
+    _check_toc_outputs(toc_outputs)
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    remove = ('[[back to top]', '<a class="mk-toclify"')
+    tag_options = dict(id_tag=not github,
+                       back_links=back_to_top,
+                       exclude_h=exclude_h,
+                       remove_dashes=remove_dashes,
+                       unique_slugs=unique_slugs,
+                       slug_flavor=_slug_flavor(slug_flavor),
+                       setext=setext)
+
+    timer = _StageTimer() if stats is not None else _NO_TIMER
+
+    raw_headlines = []
+    placeholders = [] if placeholder else None
+    # the untagged lines are written if nolink is True
+    collect_options = dict(tag_options)
+    if nolink:
+        collect_options.update(id_tag=False, back_links=False)
+    for _ in iter_tag_and_collect(iter_remove_lines(iter_lines(input_file), remove),
+                                  raw_headlines, placeholder=placeholder,
+                                  placeholders=placeholders, **collect_options):
+        pass
+    timer.lap('collect')
+
+    leftjustified_headlines = positioning_headlines(raw_headlines)
+    processed_headlines = create_toc(leftjustified_headlines,
+                                     hyperlink=not nolink,
+                                     top_link=not nolink and not github,
+                                     no_toc_header=no_toc_header,
+                                     max_children=max_children)
+    timer.lap('create_toc')
+
+    body = iter_remove_lines(iter_lines(input_file), remove)
+    if not nolink:
+        body = iter_tag_and_collect(body, None, **tag_options)
+
+    chunks = iter_markdown(toc_headlines=processed_headlines,
+                           body=body,
+                           spacer=spacer,
+                           placeholder=placeholder,
+                           placeholder_lines=placeholders,
+                           multiple_placeholders=multiple_placeholders,
+                           missing_placeholder=missing_placeholder)
+    if output_file:
+        with _open_output(output_file, 'w', in_place) as out:
+            out.writelines(chunks)
+    else:
+        sys.stdout.writelines(chunks)
+        sys.stdout.write('\n')
+    timer.lap('write')
+
+    if toc_outputs:
+        _write_toc_outputs(leftjustified_headlines, toc_outputs, nolink=nolink,
+                           no_toc_header=no_toc_header, max_children=max_children)
+        timer.lap('toc_outputs')
+
+    if stats is not None:
+        timer.headings = len(leftjustified_headlines)
+        stats(timer.record(input_file))
+    return leftjustified_headlines
+
+
+_MMAP_REGEXES = {}
+
+
+def _mmap_regexes(encoding):
+    """
+    Returns the compiled regular expressions of _mmap_pieces for `encoding`:
+    the lines that may be changed by the pipeline (indented lines, which are
+    left-stripped, headline candidates, code fences, HTML blocks and old
+    [back to top] links / anchor tags) and the (event, indent) regular
+    expressions of the lines in code blocks (see _segment_regexes).
+
+    """
+    regexes = _MMAP_REGEXES.get(encoding)
+    if regexes is None:
+        event = re.compile(br'^(?:%s|[#`~<]|\[\[back to top\])[^\n]*' % _indent_pattern(encoding),
+                           re.MULTILINE)
+        regexes = (event,) + _segment_regexes(encoding)
+        _MMAP_REGEXES[encoding] = regexes
+    return regexes
+
+
+_REMOVE_BYTES = (b'[[back to top]', b'<a class="mk-toclify"')
+
+
+def _mmap_pieces(mm, headlines=None, id_tag=True, back_links=False,
+                 exclude_h=None, remove_dashes=False, unique_slugs=False,
+                 nolink=False, encoding='utf-8', blocks=None, placeholder=None,
+                 splices=None, slug_flavor=None):
+    """
+    Yields the body of a memory-mapped markdown document as a sequence
+    of pieces: (start, end) tuples for ranges of unchanged lines that
+    can be copied straight from the mapping, and bytes for the lines
+    that were tagged, left-stripped or removed. Only the latter lines
+    are decoded, and fenced code blocks are processed as a whole.
+
+    If `nolink` is True, the body is not tagged and only old links
+    and anchor tags are removed.
+
+    The (start, end) offsets of the first and the last line of every
+    code or HTML block are appended to `blocks` (see _placeholder_spots).
+    `splices` maps the offsets of the lines with placeholders onto the
+    number of placeholders to replace; the TOC is yielded as None there.
+
+    """
+    size = len(mm)
+    event, block_event, block_indent = _mmap_regexes(encoding)
+    tag_options = dict(id_tag=id_tag, back_links=back_links,
+                       exclude_h=exclude_h, remove_dashes=remove_dashes,
+                       seen={} if unique_slugs else None,
+                       slug_flavor=slug_flavor)
+    emit = not nolink
+    block = None
+    block_start = None
+    html_close = None
+    pos = 0
+    scan = 0
+    # line numbers of the headlines
+    number = 1
+    counted = 0
+    # offsets of the placeholder lines, which are processed like event lines
+    spots = sorted(splices) if splices else []
+    spot = 0
+    while scan < size:
+        m = event.search(mm, scan)
+        if spot < len(spots) and (m is None or spots[spot] <= m.start()):
+            start = spots[spot]
+            count = splices[start]
+            spot += 1
+            end = mm.find(b'\n', start)
+            if end == -1:
+                end = size
+            raw = mm[start:end]
+        elif m is None:
+            break
+        else:
+            start, end = m.span()
+            raw = m.group()
+            count = 0
+        scan = end + 1
+        if html_close is not None and html_close < start:
+            # the HTML block was closed in an unchanged line
+            if blocks is not None:
+                blocks.append((block_start, mm.rfind(b'\n', 0, html_close) + 1))
+            block = html_close = None
+
+        if raw.startswith(_REMOVE_BYTES):
+            if start > pos:
+                yield pos, start
+            pos = min(end + 1, size)
+            continue
+        if nolink and headlines is None:
+            if count:
+                # the placeholder line is not changed otherwise
+                if start > pos:
+                    yield pos, start
+                pos = min(end + 1, size)
+                yield from _splice_pieces([raw.decode(encoding)], placeholder, count,
+                                          encoding, mm[end:pos])
+            continue
+
+        if block is None or block[0] == 'fence':
+            # fast paths for lines that can neither be headlines
+            # nor open or close a block
+            first = raw[:1]
+            if first not in _MMAP_INDENT:
+                if (block is not None and raw[0] != ord(block[1][0]) and
+                        first not in _MMAP_OTHER_INDENT):
+                    # unchanged line in a code block
+                    continue
+            else:
+                stripped = raw.lstrip(_MMAP_INDENT)
+                if stripped[:1] not in _MMAP_SLOW_PATH:
+                    if emit:
+                        if start > pos:
+                            yield pos, start
+                        pos = min(end + 1, size)
+                        if count:
+                            yield from _splice_pieces([stripped.decode(encoding)], placeholder,
+                                                      count, encoding, mm[end:pos])
+                        else:
+                            yield stripped + mm[end:pos]
+                    continue
+
+        opened = block is None
+        l = raw.decode(encoding)
+        out, headline, block = _tag_line(l, block, **tag_options)
+        if headline is not None and headlines is not None:
+            number += mm[counted:start].count(b'\n')
+            counted = start
+            headline.line = number
+            headline.offset = start
+            headlines.append(headline)
+        if blocks is not None:
+            if opened:
+                if block is not None:
+                    block_start = start
+                elif l.lstrip()[:1] in _BLOCK_START_CHARS and _opens_block(l):
+                    # the block was opened and closed in this line
+                    blocks.append((start, start))
+            elif block is None:
+                blocks.append((block_start, start))
+
+        if emit:
+            if start > pos:
+                yield pos, start
+            pos = min(end + 1, size)
+            if count:
+                yield from _splice_pieces(out, placeholder, count, encoding, mm[end:pos])
+            else:
+                yield '\n'.join(out).encode(encoding) + mm[end:pos]
+
+        if block is None:
+            html_close = None
+        elif block[0] == 'html' and html_close is None:
+            # HTML blocks can be closed anywhere in a line
+            close = re.compile(re.escape(block[1].encode(encoding)), re.IGNORECASE)
+            c = close.search(mm, end)
+            html_close = c.start() if c else size
+        elif opened:
+            # jump over the contents of the code block
+            close = _find_fence_close(mm, block, scan, encoding)
+            if emit and block_event.search(mm, scan, close):
+                if scan > pos:
+                    yield pos, scan
+                region = _MMAP_BLOCK_REMOVE.sub(b'', mm[scan:close])
+                yield block_indent.sub(b'', region)
+                pos = close
+            scan = close
+    if blocks is not None and block is not None:
+        if html_close is not None and html_close < size:
+            blocks.append((block_start, mm.rfind(b'\n', 0, html_close) + 1))
+        else:
+            blocks.append((block_start, size))
+    if pos < size:
+        yield pos, size
+
+
+def _opens_block(l):
+    """Checks if the line `l` opens a code or HTML block like tag_and_collect."""
+    stripped = l.lstrip()
+    return len(l) - len(stripped) <= 3 and _open_block(stripped) is not None
+
+
+def _placeholder_spots(mm, placeholder, blocks):
+    """
+    Returns the (offset, count) tuples of the lines of a memory-mapped
+    document that contain the (encoded) placeholder outside of the
+    `blocks` that were collected by _mmap_pieces or _merge_chunks,
+    like the placeholder lines of tag_and_collect.
+
+    """
+    found = []
+    if b'\n' in placeholder:
+        return found
+    b = 0
+    i = mm.find(placeholder)
+    while i != -1:
+        start = mm.rfind(b'\n', 0, i) + 1
+        while b < len(blocks) and blocks[b][1] < start:
+            b += 1
+        # placeholders in the first line of a block are replaced
+        in_block = b < len(blocks) and blocks[b][0] < start
+        if not in_block and not mm[start:start + 22].startswith(_REMOVE_BYTES):
+            if found and found[-1][0] == start:
+                found[-1] = start, found[-1][1] + 1
+            else:
+                found.append((start, 1))
+        i = mm.find(placeholder, i + len(placeholder))
+    return found
+
+
+def _body_line(out):
+    """Returns the index of the document line in the output lines of _tag_line."""
+    if len(out) > 1 and out[-1] == '[[back to top](#table-of-contents)]':
+        return len(out) - 2
+    return len(out) - 1
+
+
+def _splice_pieces(out, placeholder, count, encoding='utf-8', end=b''):
+    """
+    Yields the output lines of a document line (see _tag_line) as
+    pieces like _mmap_pieces, with None instead of the first `count`
+    placeholders in the document line. `end` is appended to the
+    last piece.
+
+    """
+    i = _body_line(out)
+    parts = out[i].split(placeholder, count)
+    parts[0] = '\n'.join(out[:i] + [parts[0]])
+    parts[-1] = '\n'.join([parts[-1]] + out[i + 1:])
+    for j, part in enumerate(parts):
+        if j:
+            yield None
+        part = part.encode(encoding)
+        yield part + end if j == len(parts) - 1 else part
+
+
+def _find_fence_close(mm, block, start, encoding='utf-8'):
+    """Returns the offset of the line that closes the fenced code block."""
+    marker = block[1]
+    regex = _MMAP_FENCE_CLOSE.get((marker, encoding))
+    if regex is None:
+        regex = re.compile(br'^%s{0,3}' % _indent_pattern(encoding) +
+                           re.escape(marker.encode(encoding)), re.MULTILINE)
+        _MMAP_FENCE_CLOSE[marker, encoding] = regex
+    size = len(mm)
+    while True:
+        m = regex.search(mm, start)
+        if m is None:
+            return size
+        end = mm.find(b'\n', m.start())
+        if end == -1:
+            end = size
+        l = mm[m.start():end].decode(encoding)
+        stripped = l.lstrip()
+        if _closes_block(block, stripped, len(l) - len(stripped)):
+            return m.start()
+        start = end
+
+
+_MMAP_FENCE_CLOSE = {}
+
+_MMAP_INDENT = b' \t\x0b\x0c'
+
+# first bytes of the other characters that str.lstrip strips
+_MMAP_OTHER_INDENT = set(bytes([c]) for c in b'\x1c\x1d\x1e\x1f' + bytes(range(0x80, 0x100)))
+
+# first (left-stripped) bytes of indented lines that need to be decoded: headline
+# and block markers and characters that str.lstrip also strips
+_MMAP_SLOW_PATH = set(bytes([c]) for c in b'#`~<') | _MMAP_OTHER_INDENT
+
+_MMAP_BLOCK_REMOVE = _LazyRegex(br'^(?:\[\[back to top\]|<a class="mk-toclify")[^\n]*\n?',
+                                re.MULTILINE)
+
+_WHITESPACE = {}
+
+
+def _whitespace(encoding):
+    """
+    Returns the whitespace that str.strip removes in `encoding`: a compiled
+    regular expression that matches leading whitespace, the single-byte
+    characters, the multi-byte characters and their last bytes.
+
+    """
+    whitespace = _WHITESPACE.get(encoding)
+    if whitespace is None:
+        leading = re.compile(br'(?:%s|[\r\n])*' % _indent_pattern(encoding))
+        chars = set(_encoded_chars(_INDENT_CHARS + '\r\n', encoding))
+        single = frozenset(c[0] for c in chars if len(c) == 1)
+        multi = tuple(sorted(c for c in chars if len(c) > 1))
+        whitespace = leading, single, multi, frozenset(c[-1] for c in multi)
+        _WHITESPACE[encoding] = whitespace
+    return whitespace
+
+
+def _rstrip_offset(data, start, end, whitespace):
+    """Returns the offset of the trailing whitespace in data[start:end]."""
+    _, single, multi, last = whitespace
+    while end > start:
+        b = data[end - 1]
+        if b in single:
+            end -= 1
+        elif b in last:
+            for c in multi:
+                if end - len(c) >= start and data[end - len(c):end] == c:
+                    end -= len(c)
+                    break
+            else:
+                return end
+        else:
+            return end
+    return end
+
+
+def _write_pieces(out, mm, pieces, toc, top=True, encoding='utf-8'):
+    """
+    Writes the body pieces (see _mmap_pieces) to the binary file object
+    `out` like build_markdown: the TOC is written on top of the document
+    if `top` is True and in place of the None pieces (the placeholders),
+    and the body is stripped of leading and trailing whitespace (the same
+    characters as str.strip in `encoding`). Ranges of the mapping are
+    written as memoryview slices without copying.
+
+    """
+    with memoryview(mm) as view:
+        _write_view_pieces(out, mm, view, pieces, toc, top, _whitespace(encoding))
+
+
+def _write_view_pieces(out, mm, view, pieces, toc, top, whitespace):
+    if top:
+        out.write(toc)
+    started = False
+    pending = []
+    for piece in pieces:
+        if piece is None:
+            # the TOC is not stripped
+            out.writelines(pending)
+            pending = []
+            out.write(toc)
+            started = True
+            continue
+        if isinstance(piece, bytes):
+            data, start, end = piece, 0, len(piece)
+        else:
+            data, (start, end) = mm, piece
+        if not started:
+            start = whitespace[0].match(data, start, end).end()
+            if start == end:
+                continue
+            started = True
+
+        # hold back trailing whitespace until more contents follow
+        stop = _rstrip_offset(data, start, end, whitespace)
+        if stop == start:
+            pending.append(data[start:end])
+            continue
+        out.writelines(pending)
+        pending = [data[stop:end]]
+        out.write(view[start:stop] if data is mm else data[start:stop])
+
+
+def markdown_toclify_mmap(input_file, output_file=None, github=False,
+                          back_to_top=False, nolink=False,
+                          no_toc_header=False, spacer=0, placeholder=None,
+                          exclude_h=None, remove_dashes=False,
+                          unique_slugs=False, in_place=False,
+                          min_depth=1, max_depth=6, max_children=None,
+                          stats=None, multiple_placeholders='all',
+                          missing_placeholder='ignore', encoding='utf-8',
+                          slug_flavor='default', setext=False, toc_outputs=None):
+    """ Memory-mapped version of markdown_toclify for very large files.
+
+    The input file is memory-mapped and scanned twice with a regular
+    expression for the lines that can be changed by markdown_toclify
+    (indented lines, headline candidates, code fences, HTML blocks and
+    old anchor tags). Only these lines are decoded; all other lines are
+    copied straight from the mapping to the output file, so that the
+    decoded document is never held in memory.
+
+    Takes the same parameters as `markdown_toclify_stream` and the
+    `encoding` of the input file. Files with '\r' line breaks are
+    processed by `markdown_toclify_stream`, and so are all files if
+    `setext` is True (Setext headlines need a line of lookahead).
+
+    Returns
+    -----------
+    headlines: list
+      The headlines in the table of contents.
+
+    """
+    import mmap
+    if in_place:
+        output_file = input_file
+    elif output_file and _same_file(input_file, output_file):
+        # the mapped input file must not be truncated
+        in_place = True
+    _check_toc_outputs(toc_outputs)
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    slug_flavor = _slug_flavor(slug_flavor)
+    tag_options = dict(id_tag=not github,
+                       back_links=back_to_top,
+                       exclude_h=exclude_h,
+                       remove_dashes=remove_dashes,
+                       unique_slugs=unique_slugs,
+                       slug_flavor=slug_flavor,
+                       encoding=encoding)
+
+    with open(input_file, 'rb') as inf:
+        if os.fstat(inf.fileno()).st_size == 0:
+            mm = None
+        else:
+            mm = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm is None or setext or mm.find(b'\r') != -1:
+        if mm is not None:
+            mm.close()
+        return markdown_toclify_stream(input_file, output_file, github=github,
+                                       back_to_top=back_to_top, nolink=nolink,
+                                       no_toc_header=no_toc_header, spacer=spacer,
+                                       placeholder=placeholder, exclude_h=exclude_h,
+                                       remove_dashes=remove_dashes,
+                                       unique_slugs=unique_slugs,
+                                       in_place=in_place,
+                                       max_children=max_children,
+                                       stats=stats,
+                                       multiple_placeholders=multiple_placeholders,
+                                       missing_placeholder=missing_placeholder,
+                                       slug_flavor=slug_flavor,
+                                       setext=setext,
+                                       toc_outputs=toc_outputs)
+
+    timer = _StageTimer() if stats is not None else _NO_TIMER
+    try:
+        # collect the headlines (and the code blocks for the placeholders)
+        # without building the output lines
+        raw_headlines = []
+        blocks = [] if placeholder else None
+        for _ in _mmap_pieces(mm, raw_headlines, nolink=True, blocks=blocks,
+                              **tag_options):
+            pass
+        splices = None
+        if placeholder:
+            found = _placeholder_spots(mm, placeholder.encode(encoding), blocks)
+            splices = _select_placeholders(placeholder, found, multiple_placeholders,
+                                           missing_placeholder)
+        timer.lap('collect')
+
+        leftjustified_headlines = positioning_headlines(raw_headlines)
+        processed_headlines = create_toc(leftjustified_headlines,
+                                         hyperlink=not nolink,
+                                         top_link=not nolink and not github,
+                                         no_toc_header=no_toc_header,
+                                         max_children=max_children)
+        toc = ''.join(iter_markdown(processed_headlines, [], spacer))
+        timer.lap('create_toc')
+
+        pieces = _mmap_pieces(mm, None, nolink=nolink, placeholder=placeholder,
+                              splices=splices, **tag_options)
+        toc = toc.encode(encoding)
+        if output_file:
+            with _open_output(output_file, 'wb', in_place) as out:
+                _write_pieces(out, mm, pieces, toc, splices is None, encoding)
+                # unmap the input file before it is replaced
+                mm.close()
+        else:
+            out = sys.stdout.buffer
+            _write_pieces(out, mm, pieces, toc, splices is None, encoding)
+            out.write(b'\n')
+            out.flush()
+    finally:
+        mm.close()
+    timer.lap('write')
+
+    if toc_outputs:
+        _write_toc_outputs(leftjustified_headlines, toc_outputs, nolink=nolink,
+                           no_toc_header=no_toc_header, max_children=max_children)
+        timer.lap('toc_outputs')
+
+    if stats is not None:
+        timer.headings = len(leftjustified_headlines)
+        stats(timer.record(input_file))
+    return leftjustified_headlines
+
+
+# lines that can be headlines or open or close a block: lines that start
+# with a headline or block marker (or a byte that has to be decoded to
+# tell) and lines that contain the end marker of a raw HTML block
+_CHUNK_EVENT = _LazyRegex(br'^[ \t\x0b\x0c]*[#`~<\x1c-\x1f\x80-\xff][^\n]*'
+                          br'|^[^\n]*(?:-->|</(?:pre|script|style|textarea)>)[^\n]*',
+                          re.MULTILINE | re.IGNORECASE)
+
+_HTML_BLOCK_CLOSE = _LazyRegex(br'-->|</(?:pre|script|style|textarea)>', re.IGNORECASE)
+
+# characters that str.lstrip removes (except for line breaks)
+_INDENT_CHARS = ('\t\x0b\x0c\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003'
+                 '\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000')
+
+_INDENT_PATTERNS = {}
+
+_SEGMENT_REGEXES = {}
+
+
+def _encoded_chars(chars, encoding):
+    """Yields the `chars` that can be encoded in `encoding` as bytes."""
+    for c in chars:
+        try:
+            yield c.encode(encoding)
+        except UnicodeEncodeError:
+            pass
+
+
+def _indent_pattern(encoding):
+    """
+    Returns a bytes pattern that matches one of the _INDENT_CHARS in
+    `encoding`, i.e., one character of the indentation that str.lstrip
+    removes from a line.
+
+    """
+    pattern = _INDENT_PATTERNS.get(encoding)
+    if pattern is None:
+        chars = set(_encoded_chars(_INDENT_CHARS, encoding))
+        single = b''.join(re.escape(c) for c in sorted(c for c in chars if len(c) == 1))
+        multi = [re.escape(c) for c in sorted(c for c in chars if len(c) > 1)]
+        pattern = b'(?:%s)' % b'|'.join([b'[%s]' % single] + multi)
+        _INDENT_PATTERNS[encoding] = pattern
+    return pattern
+
+
+def _segment_regexes(encoding, strip_indent=True):
+    """
+    Returns the compiled (event, indent) regular expressions for the
+    bulk processing of the lines between headlines (see _segment_pieces).
+
+    """
+    key = encoding, strip_indent
+    regexes = _SEGMENT_REGEXES.get(key)
+    if regexes is None:
+        indent = _indent_pattern(encoding)
+        remove = br'\[\[back to top\]|<a class="mk-toclify"'
+        if strip_indent:
+            event = re.compile(b'^(?:%s|%s)' % (indent, remove), re.MULTILINE)
+        else:
+            event = re.compile(b'^(?:%s)' % remove, re.MULTILINE)
+        regexes = event, re.compile(b'^%s+' % indent, re.MULTILINE)
+        _SEGMENT_REGEXES[key] = regexes
+    return regexes
+
+
+def _chunk_ranges(mm, chunk_size):
+    """Splits the mapping into line-aligned (start, end) ranges."""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = mm.find(b'\n', start + max(chunk_size, 1) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def _scan_chunk(job):
+    """
+    Worker function of markdown_toclify_parallel that scans the lines
+    in a range of the memory-mapped input file.
+
+    Returns a list of (offset, line, stripped line, indent, headline)
+    tuples for the lines that may be headlines or open or close a
+    block, and the number of line breaks in the range. `line` is
+    counted from the start of the range, and `headline` is the
+    (text, slug, level) tuple of a headline candidate, () for the
+    headlines of the levels in `exclude_h`, or None.
+
+    The block that is open at the start of the range is only known
+    when the chunks are merged (see _merge_chunks). Lines are only
+    slugified if they are not in a block when the range is assumed
+    to start outside of any block; `headline` is False for the lines
+    in blocks, which are slugified by _merge_chunks if the assumption
+    turns out to be wrong.
+
+    """
+    import mmap
+    input_file, start, end, remove_dashes, exclude_h, encoding, slug_flavor = job
+    records = []
+    with open(input_file, 'rb') as inf:
+        mm = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        number = 0
+        counted = start
+        block = None
+        for m in _CHUNK_EVENT.finditer(mm, start, end):
+            raw = m.group()
+            if raw.startswith(_REMOVE_BYTES):
+                continue
+            l = raw.decode(encoding)
+            stripped = l.lstrip()
+            if stripped[:1] not in ('#', '`', '~', '<') and not _HTML_BLOCK_CLOSE.search(raw):
+                continue
+            indent = len(l) - len(stripped)
+            headline = None
+            if block is not None:
+                headline = False
+                if _closes_block(block, stripped, indent):
+                    block = None
+            elif stripped[:1] in _BLOCK_START_CHARS and indent <= 3:
+                block = _open_block(stripped)
+                if block is not None and _closes_block(block, stripped, opening=True):
+                    block = None
+            else:
+                headline = _headline(stripped, indent, remove_dashes, exclude_h, slug_flavor)
+                if headline:
+                    headline = headline.text, headline.slug, headline.level
+                elif headline is False:
+                    headline = ()
+            offset = m.start()
+            number += mm[counted:offset].count(b'\n')
+            counted = offset
+            records.append((offset, number, stripped, indent, headline))
+        number += mm[counted:end].count(b'\n')
+    finally:
+        mm.close()
+    return records, number
+
+
+def _merge_chunks(results, headlines, exclude_h=None, remove_dashes=False,
+                  unique_slugs=False, excluded=None, blocks=None, slug_flavor=None):
+    """
+    Merges the scanned chunks (see _scan_chunk) in order. Code fences and
+    HTML blocks that span chunks and the counters of duplicate slugs are
+    carried over from one chunk to the next, and the included headlines
+    are appended to `headlines` with their line numbers and offsets.
+    The offsets of the excluded headlines are appended to `excluded`,
+    and the (start, end) offsets of the first and the last line of every
+    block to `blocks` (see _placeholder_spots).
+
+    """
+    seen = {} if unique_slugs else None
+    sep = _suffix_sep(remove_dashes, slug_flavor)
+    skip_h = exclude_h if seen is None else None
+    block = None
+    block_start = None
+    number = 1
+    for records, count in results:
+        for offset, line, l, indent, headline in records:
+            if block is not None:
+                if _closes_block(block, l, indent):
+                    block = None
+                    if blocks is not None:
+                        blocks.append((block_start, offset))
+                continue
+            if l[:1] in _BLOCK_START_CHARS and indent <= 3:
+                opened = _open_block(l)
+                if opened is not None:
+                    if not _closes_block(opened, l, opening=True):
+                        block = opened
+                        block_start = offset
+                    elif blocks is not None:
+                        blocks.append((offset, offset))
+                    continue
+            if headline is False:
+                # the line was assumed to be in a block by _scan_chunk
+                headline = _headline(l, indent, remove_dashes, skip_h, slug_flavor)
+            elif headline == ():
+                headline = False
+            elif headline is not None:
+                headline = Headline(*headline)
+            if headline is None:
+                continue
+            if headline is not False:
+                headline.line = number + line
+                headline.offset = offset
+                if seen is not None:
+                    _make_unique(headline, seen, sep)
+                if not exclude_h or not headline.level in exclude_h:
+                    headlines.append(headline)
+                    continue
+            if excluded is not None:
+                excluded.append(offset)
+        number += count
+    if blocks is not None and block is not None:
+        blocks.append((block_start, sys.maxsize))
+    return headlines
+
 
-      github: bool (default: False)
-        Uses GitHub TOC syntax if True.
+def _segment_pieces(mm, start, end, regexes, segment_size):
+    """
+    Yields the lines between `start` and `end` in pieces of about
+    `segment_size` bytes like _mmap_pieces. Old links and anchor tags
+    are removed and indented lines left-stripped with one regular
+    expression substitution per piece.
 
-      back_to_top: bool (default: False)
-        Inserts back-to-top links below headings if True.
+    """
+    event, indent = regexes
+    while start < end:
+        stop = mm.find(b'\n', start + segment_size - 1, end)
+        stop = end if stop == -1 else stop + 1
+        if event.search(mm, start, stop) is None:
+            yield start, stop
+        else:
+            region = _MMAP_BLOCK_REMOVE.sub(b'', mm[start:stop])
+            if indent is not None:
+                region = indent.sub(b'', region)
+            yield region
+        start = stop
 
-      nolink: bool (default: False)
-        Creates the table of contents without internal links if True.
 
-      no_toc_header: bool (default: False)
-        Suppresses the Table of Contents header if True
+def _headline_pieces(mm, headlines, id_tag=True, back_links=False, nolink=False,
+                     encoding='utf-8', segment_size=PARALLEL_CHUNK_SIZE, excluded=(),
+                     placeholder=None, splices=None):
+    """
+    Yields the body of a memory-mapped markdown document as pieces (see
+    _mmap_pieces) for the `headlines` and the `excluded` headlines (which
+    only get [back to top] links) that were found at known offsets.
+    `splices` maps the offsets of the lines with placeholders onto the
+    number of placeholders to replace like in _mmap_pieces.
 
-      spacer: int (default: 0)
-        Inserts horizontal space (in pixels) after the table of contents.
+    """
+    size = len(mm)
+    event, indent = _segment_regexes(encoding, strip_indent=not nolink)
+    if nolink:
+        # the body is not tagged
+        headlines = excluded = ()
+        regexes = event, None
+    else:
+        regexes = event, indent
+    # the headline and placeholder lines in the order of their offsets
+    import heapq
+    lines = heapq.merge(((h.offset, h) for h in headlines),
+                        ((offset, False) for offset in excluded),
+                        ((offset, None) for offset in sorted(splices or ())),
+                        key=operator.itemgetter(0))
+    pos = 0
+    for offset, marks in itertools.groupby(lines, key=operator.itemgetter(0)):
+        marks = [mark for _, mark in marks]
+        yield from _segment_pieces(mm, pos, offset, regexes, segment_size)
+        end = mm.find(b'\n', offset)
+        if end == -1:
+            end = size
+        l = mm[offset:end].decode(encoding)
+        out = []
+        if nolink:
+            out.append(l)
+        else:
+            headline = [mark for mark in marks if mark]
+            if headline and id_tag:
+                out.append('<a class="mk-toclify" id="%s"></a>' % (headline[0].slug))
+            out.append(l.lstrip())
+            if back_links and (headline or False in marks):
+                out.append('[[back to top](#table-of-contents)]')
+        pos = min(end + 1, size)
+        if None in marks:
+            yield from _splice_pieces(out, placeholder, splices[offset], encoding, mm[end:pos])
+        else:
+            yield '\n'.join(out).encode(encoding) + mm[end:pos]
+    yield from _segment_pieces(mm, pos, size, regexes, segment_size)
 
-      placeholder: str (default: None)
-        Inserts the TOC at the placeholder string instead
-        of inserting the TOC at the top of the document.
 
-      exclude_h: list (default None)
-        Excludes header levels, e.g., if [2, 3], ignores header
-        levels 2 and 3 in the TOC.
+def markdown_toclify_parallel(input_file, output_file=None, github=False,
+                              back_to_top=False, nolink=False,
+                              no_toc_header=False, spacer=0, placeholder=None,
+                              exclude_h=None, remove_dashes=False,
+                              unique_slugs=False, in_place=False,
+                              min_depth=1, max_depth=6, max_children=None,
+                              stats=None, multiple_placeholders='all',
+                              missing_placeholder='ignore', max_workers=None,
+                              chunk_size=PARALLEL_CHUNK_SIZE, encoding='utf-8',
+                              slug_flavor='default', setext=False,
+                              toc_outputs=None):
+    """ Version of markdown_toclify_mmap that scans a single large file
+    in parallel.
 
-      remove_dashes: bool (default: False)
-        Removes dashes from headline slugs
+    The memory-mapped input file is split into line-aligned chunks of
+    about `chunk_size` bytes, and the headlines in the chunks are found
+    and slugified in up to `max_workers` worker processes (default:
+    number of CPUs). Every worker maps the file itself, so the text is
+    never pickled. The chunks are merged in order, which resolves code
+    fences and HTML blocks that span chunks and makes duplicate slugs
+    unique across the whole file. The output is then written from the
+    mapping like in markdown_toclify_mmap.
+
+    Takes the same parameters as `markdown_toclify_mmap`; the first
+    `stats` stage is called 'scan'. Files with '\r' line breaks are
+    processed by `markdown_toclify_stream`, and so are all files if
+    `setext` is True.
+
+    Returns
+    -----------
+    headlines: list
+      The headlines in the table of contents.
+
+    """
+    import mmap
+    if in_place:
+        output_file = input_file
+    elif output_file and _same_file(input_file, output_file):
+        # the mapped input file must not be truncated
+        in_place = True
+    _check_toc_outputs(toc_outputs)
+    exclude_h = _exclude_levels(exclude_h, min_depth, max_depth)
+    slug_flavor = _slug_flavor(slug_flavor)
+    with open(input_file, 'rb') as inf:
+        if os.fstat(inf.fileno()).st_size == 0:
+            mm = None
+        else:
+            mm = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm is None or setext or mm.find(b'\r') != -1:
+        if mm is not None:
+            mm.close()
+        return markdown_toclify_stream(input_file, output_file, github=github,
+                                       back_to_top=back_to_top, nolink=nolink,
+                                       no_toc_header=no_toc_header, spacer=spacer,
+                                       placeholder=placeholder, exclude_h=exclude_h,
+                                       remove_dashes=remove_dashes,
+                                       unique_slugs=unique_slugs,
+                                       in_place=in_place,
+                                       max_children=max_children,
+                                       stats=stats,
+                                       multiple_placeholders=multiple_placeholders,
+                                       missing_placeholder=missing_placeholder,
+                                       slug_flavor=slug_flavor,
+                                       setext=setext,
+                                       toc_outputs=toc_outputs)
+
+    timer = _StageTimer() if stats is not None else _NO_TIMER
+    try:
+        # excluded headlines are not slugified unless they are
+        # needed for the numbering of duplicate slugs
+        jobs = [(input_file, start, end, remove_dashes,
+                 None if unique_slugs else exclude_h, encoding, slug_flavor)
+                for start, end in _chunk_ranges(mm, chunk_size)]
+        raw_headlines = []
+        excluded = [] if back_to_top else None
+        blocks = [] if placeholder else None
+        if max_workers == 1 or len(jobs) == 1:
+            _merge_chunks(map(_scan_chunk, jobs), raw_headlines, exclude_h,
+                          remove_dashes, unique_slugs, excluded, blocks, slug_flavor)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                _merge_chunks(executor.map(_scan_chunk, jobs), raw_headlines,
+                              exclude_h, remove_dashes, unique_slugs, excluded, blocks,
+                              slug_flavor)
+        splices = None
+        if placeholder:
+            found = _placeholder_spots(mm, placeholder.encode(encoding), blocks)
+            splices = _select_placeholders(placeholder, found, multiple_placeholders,
+                                           missing_placeholder)
+        timer.lap('scan')
+
+        pieces = _headline_pieces(mm, raw_headlines, id_tag=not github,
+                                  back_links=back_to_top, nolink=nolink,
+                                  encoding=encoding, excluded=excluded or (),
+                                  placeholder=placeholder, splices=splices)
+        leftjustified_headlines = positioning_headlines(raw_headlines)
+        processed_headlines = create_toc(leftjustified_headlines,
+                                         hyperlink=not nolink,
+                                         top_link=not nolink and not github,
+                                         no_toc_header=no_toc_header,
+                                         max_children=max_children)
+        toc = ''.join(iter_markdown(processed_headlines, [], spacer)).encode(encoding)
+        timer.lap('create_toc')
+        if output_file:
+            with _open_output(output_file, 'wb', in_place) as out:
+                _write_pieces(out, mm, pieces, toc, splices is None, encoding)
+                # unmap the input file before it is replaced
+                mm.close()
+        else:
+            out = sys.stdout.buffer
+            _write_pieces(out, mm, pieces, toc, splices is None, encoding)
+            out.write(b'\n')
+            out.flush()
+    finally:
+        mm.close()
+    timer.lap('write')
+
+    if toc_outputs:
+        _write_toc_outputs(leftjustified_headlines, toc_outputs, nolink=nolink,
+                           no_toc_header=no_toc_header, max_children=max_children)
+        timer.lap('toc_outputs')
+
+    if stats is not None:
+        timer.headings = len(leftjustified_headlines)
+        stats(timer.record(input_file))
+    return leftjustified_headlines
+
+
+def expand_input_paths(paths, extensions=MARKDOWN_EXTENSIONS):
+    """
+    Expands a list of file paths, glob patterns and directories
+    into a list of Markdown files. Directories are searched
+    recursively for files ending in one of `extensions`.
+    The order of `paths` is kept and duplicates are removed.
+
+    """
+    expanded = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.lower().endswith(extensions):
+                        found.append(os.path.join(root, f))
+        elif os.path.exists(path):
+            found = [path]
+        else:
+            import glob
+            found = sorted(glob.glob(path))
+            if not found:
+                # keep the path so that the missing file is reported
+                found = [path]
+        for f in found:
+            if f not in seen:
+                seen.add(f)
+                expanded.append(f)
+    return expanded
+
+
+def read_file_list(fp, extensions=MARKDOWN_EXTENSIONS):
+    """
+    Reads a list of changed files from the file object `fp`, one path
+    per line, e.g., the output of `git diff --name-only`. Blank lines,
+    duplicates, files that do not end in one of `extensions` and files
+    that do not exist (anymore) are skipped.
+
+    """
+    paths = []
+    seen = set()
+    for line in fp:
+        path = line.rstrip('\r\n')
+        if (path and path not in seen and path.lower().endswith(extensions)
+                and os.path.isfile(path)):
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def git_changed_files(since, cwd=None, extensions=MARKDOWN_EXTENSIONS):
+    """
+    Returns the Markdown files below `cwd` (default: the current
+    directory) that were changed since the git revision `since`:
+    committed, staged and unstaged changes (`git diff --name-only`)
+    and untracked files that are not ignored. Deleted files are
+    skipped. The paths are relative to `cwd` (or joined with it).
+
+    Raises a subprocess.CalledProcessError if git fails, e.g.,
+    for an unknown revision, and an OSError if git is not installed.
+
+    """
+    import subprocess
+
+    def git(*args):
+        out = subprocess.run(('git',) + args, cwd=cwd, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, check=True).stdout
+        return [os.fsdecode(p) for p in out.split(b'\0') if p]
+
+    changed = git('diff', '--name-only', '--relative', '--diff-filter=d', '-z',
+                  since, '--')
+    changed += git('ls-files', '--others', '--exclude-standard', '-z')
+    if cwd:
+        changed = [os.path.join(cwd, p) for p in changed]
+    paths = []
+    seen = set()
+    for path in changed:
+        if path not in seen and path.lower().endswith(extensions) and os.path.isfile(path):
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def filter_input_paths(files, paths):
+    """
+    Returns the files that match one of `paths` (file paths, glob
+    patterns or directories like in `expand_input_paths`) without
+    walking the directories, e.g., to restrict a list of changed files.
+
+    """
+    import fnmatch
+    dirs = [os.path.join(os.path.abspath(p), '') for p in paths if os.path.isdir(p)]
+    others = [p for p in paths if not os.path.isdir(p)]
+    abs_others = set(os.path.abspath(p) for p in others)
+    return [f for f in files
+            if os.path.abspath(f).startswith(tuple(dirs))
+            or os.path.abspath(f) in abs_others
+            or any(fnmatch.fnmatch(f, p) for p in others)]
+
+
+def _output_paths(input_files, output_dir, base_dir=None):
+    """
+    Maps input files onto output_dir, preserving the directory
+    structure relative to `base_dir` (default: the common parent
+    directory of the inputs).
+
+    """
+    if base_dir is not None:
+        base = os.path.abspath(base_dir)
+    else:
+        dirs = [os.path.dirname(os.path.abspath(f)) for f in input_files]
+        base = os.path.commonpath(dirs) if dirs else ''
+    return [os.path.join(output_dir, os.path.relpath(os.path.abspath(f), base))
+            for f in input_files]
+
+
+def _toclify_job(job):
+    """
+    Runs markdown_toclify for a single (input, output, index, toc_outputs,
+    options, with_stats) job. The statistics are returned with the result,
+    since the `stats` callback is called in the main process.
+
+    """
+    input_file, output_file, index_file, toc_outputs, options, with_stats = job
+    records = []
+    try:
+        for path in (output_file, index_file) + tuple((toc_outputs or {}).values()):
+            out_dir = os.path.dirname(path) if path else None
+            if out_dir and not os.path.isdir(out_dir):
+                os.makedirs(out_dir, exist_ok=True)
+        cont = markdown_toclify(input_file, output_file, index_file=index_file,
+                                toc_outputs=toc_outputs,
+                                stats=records.append if with_stats else None,
+                                **options)
+        return input_file, cont, None, records[0] if records else None
+    except Exception as e:
+        return input_file, None, e, None
+
+
+def _check_job(job):
+    """Runs check_toc for a single (input, options) job."""
+    input_file, options = job
+    try:
+        return input_file, check_toc(input_file, **options)
+    except Exception as e:
+        return input_file, str(e)
+
+
+def markdown_toclify_many(input_files, output_dir=None, max_workers=None,
+                          chunksize=1, cache_max_size=CACHE_MAX_SIZE,
+                          index_dir=None, toc_output_dirs=None, stats=None,
+                          base_dir=None, **options):
+    """ Adds tables of contents to many markdown files using a process pool.
+
+    Parameters
+    -----------
+      input_files: list
+        Paths, glob patterns or directories of the markdown input files
+        (see `expand_input_paths`).
+
+      output_dir: str (default: None)
+        Directory for the markdown output files. The directory structure
+        relative to the common parent directory of the input files
+        is preserved. No files are written if None, unless the input
+        files are rewritten with the `in_place` option.
+
+      max_workers: int (default: None)
+        Number of worker processes. Uses the number of CPUs if None.
+        The files are processed in the current process if 1.
+
+      chunksize: int (default: 1)
+        Number of files that are sent to a worker process at once.
+
+      cache_max_size: int (default: CACHE_MAX_SIZE)
+        Maximum size of the cache in bytes if the `cache_dir` option
+        is used. Least recently used entries are evicted after the run.
+
+      index_dir: str (default: None)
+        Directory for headline index files (see `write_headline_index`),
+        e.g., 'docs/a.md' gets the index file 'a.md.idx'. The directory
+        structure is preserved like for `output_dir`.
+
+      toc_output_dirs: dict (default: None)
+        Maps TOC formats onto directories for the TOCs on their own
+        (see the `toc_outputs` argument of `markdown_toclify`), e.g.,
+        {'html': 'nav'} writes the TOC of 'docs/a.md' to 'nav/a.toc.html'.
+        The directory structure is preserved like for `output_dir`.
+
+      stats: callable (default: None)
+        Called in the main process with the statistics of every
+        successfully processed file (see the `stats` argument of
+        `markdown_toclify`), in the order of the input files.
+
+      base_dir: str (default: None)
+        Directory whose structure is preserved in `output_dir`,
+        `index_dir` and `toc_output_dirs`. Uses the common parent
+        directory of the input files if None, so that it should be
+        set if only some of the files are processed, e.g., the
+        changed files (see `git_changed_files`).
+
+      **options:
+        Keyword arguments that are passed on to `markdown_toclify`,
+        e.g., `github=True`.
+
+    Returns
+    -----------
+    (results, errors): tuple of dicts
+      `results` maps each successfully processed input file onto its
+      Markdown contents incl. the TOC, and `errors` maps each
+      failed input file onto the raised exception.
+
+    """
+    input_files = expand_input_paths(input_files)
+    if output_dir:
+        output_files = _output_paths(input_files, output_dir, base_dir)
+    else:
+        output_files = [None] * len(input_files)
+    if index_dir:
+        index_files = [f + '.idx' for f in _output_paths(input_files, index_dir, base_dir)]
+    else:
+        index_files = [None] * len(input_files)
+    _check_toc_outputs(toc_output_dirs)
+    toc_outputs = [{} for _ in input_files]
+    for toc_format, toc_dir in sorted((toc_output_dirs or {}).items()):
+        for outputs, path in zip(toc_outputs, _output_paths(input_files, toc_dir, base_dir)):
+            outputs[toc_format] = os.path.splitext(path)[0] + TOC_EXTENSIONS[toc_format]
+    jobs = [(i, o, x, t or None, options, stats is not None)
+            for i, o, x, t in zip(input_files, output_files, index_files, toc_outputs)]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(jobs))
+
+    if max_workers <= 1:
+        results, errors = _collect_jobs(map(_toclify_job, jobs), stats)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            done = executor.map(_toclify_job, jobs, chunksize=chunksize)
+            results, errors = _collect_jobs(done, stats)
+
+    if options.get('cache_dir'):
+        prune_cache(options['cache_dir'], cache_max_size)
+    return results, errors
+
+
+def _collect_jobs(done, stats=None):
+    results, errors = {}, {}
+    for input_file, cont, error, record in done:
+        if error is None:
+            results[input_file] = cont
+        else:
+            errors[input_file] = error
+        if record is not None:
+            stats(record)
+    return results, errors
+
+
+_async_pool = None
+
+
+def _async_executor():
+    """
+    The default executor of the asyncio API: a thread pool with
+    ASYNC_MAX_WORKERS threads that is created on first use and
+    shared by all event loops.
+
+    """
+    global _async_pool
+    if _async_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _async_pool = ThreadPoolExecutor(max_workers=ASYNC_MAX_WORKERS,
+                                         thread_name_prefix='markdown_toclify')
+    return _async_pool
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _toclify_bytes(raw, options):
+    """Runs the markdown_toclify pipeline on the raw contents of a file."""
+    # decode like read_lines (default encoding, universal newlines)
+    newline = '' if options.get('roundtrip') else None
+    return toclify_text(io.TextIOWrapper(io.BytesIO(raw), newline=newline).read(),
+                        **options)
+
+
+def _write_output(cont, output_file, in_place=False, newline=None):
+    if in_place:
+        _replace_output(cont, output_file, newline)
+    else:
+        out_dir = os.path.dirname(output_file)
+        if out_dir and not os.path.isdir(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        output_markdown(cont, output_file, newline)
+
+
+async def toclify_async(input_file, output_file=None, in_place=False,
+                        executor=None, **options):
+    """ Adds a table of contents to a markdown file without blocking the event loop.
+
+    The file is read and written in the default executor of the
+    running event loop, and the TOC is generated in `executor`.
+
+    Parameters
+    -----------
+      input_file: str
+        Path to the markdown input file.
+
+      output_file: str (default: None)
+        Path to the markdown output file. Missing directories are created.
+
+      in_place: bool (default: False)
+        Rewrites the input file atomically if its contents change
+        (see `markdown_toclify`).
+
+      executor: concurrent.futures.Executor (default: None)
+        Executor that generates the TOC. Uses a shared pool of
+        ASYNC_MAX_WORKERS threads if None. A ProcessPoolExecutor
+        runs the TOC generation of several files in parallel.
+
+      **options:
+        Keyword arguments of `markdown_toclify` that control the TOC,
+        e.g., `github=True` or `max_depth=3`. The `cache_dir`,
+        `index_file` and `stats` arguments are not supported.
 
     Returns
     -----------
@@ -297,37 +3973,414 @@ def markdown_toclify(input_file, output_file=None, github=False,
       Markdown contents including the TOC.
 
     """
-    raw_contents = read_lines(input_file)
-    cleaned_contents = remove_lines(raw_contents, remove=('[[back to top]', '<a class="mk-toclify"'))
-    processed_contents, raw_headlines = tag_and_collect(
-                                            cleaned_contents,
-                                            id_tag=not github,
-                                            back_links=back_to_top,
-                                            exclude_h=exclude_h,
-                                            remove_dashes=remove_dashes
-                                            )
+    import asyncio
+    loop = asyncio.get_running_loop()
+    raw = await loop.run_in_executor(None, _read_bytes, input_file)
+    cont = await loop.run_in_executor(executor or _async_executor(),
+                                      _toclify_bytes, raw, options)
+    if in_place or output_file:
+        await loop.run_in_executor(None, _write_output, cont,
+                                   input_file if in_place else output_file,
+                                   in_place, '' if options.get('roundtrip') else None)
+    return cont
 
-    leftjustified_headlines = positioning_headlines(raw_headlines)
-    processed_headlines = create_toc(leftjustified_headlines,
-                                     hyperlink=not nolink,
-                                     top_link=not nolink and not github,
-                                     no_toc_header=no_toc_header)
 
-    if nolink:
-        processed_contents = cleaned_contents
+async def toclify_text_async(text, encoding='utf-8', executor=None, **options):
+    """ Adds a table of contents to Markdown contents in memory in `executor`.
 
-    cont = build_markdown(toc_headlines=processed_headlines,
-                          body=processed_contents,
-                          spacer=spacer,
-                          placeholder=placeholder)
+    Parameters
+    -----------
+      text: str, bytes, bytearray or memoryview
+        Markdown contents (see `toclify_text`).
 
-    if output_file:
-        output_markdown(cont, output_file)
-    return cont
+      encoding: str (default: 'utf-8')
+        Encoding of binary input and output.
+
+      executor: concurrent.futures.Executor (default: None)
+        Executor that generates the TOC (see `toclify_async`).
+
+      **options:
+        Keyword arguments of `markdown_toclify` that control the TOC,
+        e.g., `github=True`.
+
+    Returns
+    -----------
+    cont: str or bytes
+      Markdown contents including the TOC; bytes if `text` is binary.
+
+    """
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    job = functools.partial(toclify_text, text, encoding, **options)
+    return await loop.run_in_executor(executor or _async_executor(), job)
+
+
+async def toclify_many_async(input_files, output_dir=None,
+                             max_concurrency=ASYNC_MAX_CONCURRENCY,
+                             executor=None, **options):
+    """ Adds tables of contents to many markdown files from a coroutine.
+
+    Parameters
+    -----------
+      input_files: list
+        Paths, glob patterns or directories of the markdown input files
+        (see `expand_input_paths`).
+
+      output_dir: str (default: None)
+        Directory for the markdown output files (see `markdown_toclify_many`).
+
+      max_concurrency: int (default: ASYNC_MAX_CONCURRENCY)
+        Maximum number of files that are processed at the same time,
+        which bounds the number of open files and of documents in memory.
+
+      executor: concurrent.futures.Executor (default: None)
+        Executor that generates the TOCs (see `toclify_async`).
+
+      **options:
+        Keyword arguments that are passed on to `toclify_async`,
+        e.g., `github=True` or `in_place=True`.
+
+    Returns
+    -----------
+    (results, errors): tuple of dicts
+      `results` maps each successfully processed input file onto its
+      Markdown contents incl. the TOC, and `errors` maps each
+      failed input file onto the raised exception.
+
+    """
+    import asyncio
+    if max_concurrency < 1:
+        raise ValueError('max_concurrency must be at least 1')
+    loop = asyncio.get_running_loop()
+    input_files = await loop.run_in_executor(None, expand_input_paths, input_files)
+    if output_dir:
+        output_files = _output_paths(input_files, output_dir)
+    else:
+        output_files = [None] * len(input_files)
+    limiter = asyncio.Semaphore(max_concurrency)
+
+    async def run(input_file, output_file):
+        async with limiter:
+            return await toclify_async(input_file, output_file,
+                                       executor=executor, **options)
+
+    done = await asyncio.gather(*[run(i, o) for i, o in zip(input_files, output_files)],
+                                return_exceptions=True)
+    results, errors = {}, {}
+    for input_file, cont in zip(input_files, done):
+        if isinstance(cont, Exception):
+            errors[input_file] = cont
+        elif isinstance(cont, BaseException):
+            raise cont
+        else:
+            results[input_file] = cont
+    return results, errors
+
+
+# markdown_toclify arguments that make no sense for a TocWatcher
+_WATCHER_UNSUPPORTED = ('in_place', 'cache_dir', 'index_file', 'stats')
+
+
+class TocWatcher(object):
+    """
+    Watches Markdown files and regenerates their tables of contents
+    when they change. Changes are detected by polling the size and
+    modification time of the files, and bursts of changes (e.g., an
+    editor that saves in several steps) are debounced.
+
+    The tagged lines and headlines of every file are kept in memory,
+    so that after a change only the lines between the unchanged
+    beginning and end of the file are parsed again (the whole file
+    is parsed again if `unique_slugs` or `setext` is used).
+
+    Keyword arguments:
+        paths: paths, glob patterns or directories to watch
+            (see `expand_input_paths`); directories are rescanned
+            for new files on every poll.
+        output_file: path to the output file if a single file is watched
+            (the output is printed if neither output_file nor output_dir
+            is given).
+        output_dir: output directory if several files are watched.
+        interval: seconds between two polls.
+        debounce: seconds without further changes before a changed
+            file is processed.
+        callback: called as `callback(input_file, cont)` after a file
+            was regenerated.
+        **options: keyword arguments of `markdown_toclify` except for
+            `in_place`, `cache_dir`, `index_file` and `stats`. The
+            `toc_outputs` are written whenever a file is regenerated
+            (e.g., if a single file is watched), and in round-trip mode
+            the whole file is processed again.
+
+    """
+    def __init__(self, paths, output_file=None, output_dir=None,
+                 interval=0.5, debounce=0.05, callback=None, **options):
+        unsupported = sorted(set(options) & set(_WATCHER_UNSUPPORTED))
+        if unsupported:
+            raise ValueError('TocWatcher does not support %s' % ', '.join(unsupported))
+        if options.get('roundtrip') and options.get('setext'):
+            raise ValueError('Setext headlines are not supported in round-trip mode')
+        _check_toc_outputs(options.get('toc_outputs'))
+        self.paths = paths
+        self.output_file = output_file
+        self.output_dir = output_dir
+        self.interval = interval
+        self.debounce = debounce
+        self.callback = callback
+        self.options = options
+        self._signatures = {}
+        self._states = {}
+
+    def _stat_files(self):
+        signatures = {}
+        input_files = expand_input_paths(self.paths)
+        if self.output_dir:
+            outputs = _output_paths(input_files, self.output_dir)
+        else:
+            outputs = [self.output_file] * len(input_files)
+        for f, out in zip(input_files, outputs):
+            if out and os.path.abspath(out) == os.path.abspath(f):
+                # don't react to our own output
+                continue
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            signatures[f] = (st.st_mtime_ns, st.st_size, out)
+        return signatures
+
+    def _changed(self):
+        signatures = self._stat_files()
+        changed = [f for f, sig in signatures.items()
+                   if self._signatures.get(f) != sig]
+        for f in set(self._signatures) - set(signatures):
+            self._states.pop(f, None)
+        self._signatures = signatures
+        return changed
+
+    def poll(self):
+        """
+        Checks the watched files once and regenerates the changed ones.
+        Returns a dict that maps the regenerated files onto their contents.
+
+        """
+        changed = set(self._changed())
+        while changed and self.debounce:
+            time.sleep(self.debounce)
+            more = self._changed()
+            if not more:
+                break
+            changed.update(more)
+
+        results = {}
+        for f in sorted(changed):
+            if f not in self._signatures:
+                continue
+            try:
+                cont = self.regenerate(f)
+            except (IOError, OSError, UnicodeDecodeError, PlaceholderError) as e:
+                sys.stderr.write('%s: %s\n' % (f, e))
+                continue
+            results[f] = cont
+            out = self._signatures[f][2]
+            if out:
+                # the line breaks are kept in round-trip mode
+                newline = '' if self.options.get('roundtrip') else None
+                if not _output_is_current(cont, out, newline):
+                    output_markdown(cont, out, newline)
+            else:
+                print(cont)
+            if self.callback is not None:
+                self.callback(f, cont)
+        return results
+
+    def regenerate(self, input_file):
+        """Returns the Markdown contents incl. the TOC of `input_file`."""
+        options = self.options
+        if options.get('roundtrip'):
+            # all lines are kept as they are, so there are no records to reuse
+            return markdown_toclify(input_file, **options)
+        cleaned = remove_lines(read_lines(input_file))
+        old_cleaned, old_records = self._states.get(input_file, ([], []))
+
+        # reuse the records of the unchanged beginning and end
+        n_old, n_new = len(old_cleaned), len(cleaned)
+        start = 0
+        while (start < n_old and start < n_new and
+               old_cleaned[start] == cleaned[start]):
+            start += 1
+        end = 0
+        while (end < n_old - start and end < n_new - start and
+               old_cleaned[n_old - 1 - end] == cleaned[n_new - 1 - end]):
+            end += 1
+
+        exclude_h = _exclude_levels(options.get('exclude_h'),
+                                    options.get('min_depth', 1),
+                                    options.get('max_depth', 6))
+        tag_options = dict(id_tag=not options.get('github', False),
+                           back_links=options.get('back_to_top', False),
+                           exclude_h=exclude_h,
+                           remove_dashes=options.get('remove_dashes', False),
+                           slug_flavor=_slug_flavor(options.get('slug_flavor')))
+        if options.get('unique_slugs'):
+            # the suffixes depend on all previous headlines
+            tag_options['seen'] = {}
+            start = end = 0
+        setext_levels = None
+        if options.get('setext'):
+            # a Setext headline depends on the lines around it
+            levels = [None]
+            setext_levels = [levels[0] for _ in _iter_setext(cleaned, levels)]
+            start = end = 0
+        # the (output lines, headline, block after the line) records of
+        # the unchanged end can only be reused if the code/HTML block
+        # state before it is the same as in the previous run
+        records = old_records[:start]
+        block = records[-1][2] if records else None
+        i = start
+        while i < n_new:
+            if i >= n_new - end:
+                j = n_old - (n_new - i)
+                old_block = old_records[j - 1][2] if j > 0 else None
+                if old_block == block:
+                    records.extend(old_records[j:])
+                    break
+            record = _tag_line(cleaned[i], block,
+                               setext=setext_levels[i] if setext_levels else None,
+                               **tag_options)
+            records.append(record)
+            block = record[2]
+            i += 1
+        self._states[input_file] = (cleaned, records)
+
+        processed_contents = []
+        raw_headlines = []
+        # index of the first output line of every record
+        starts = []
+        for number, (processed, headline, _) in enumerate(records, 1):
+            starts.append(len(processed_contents))
+            processed_contents.extend(processed)
+            if headline is not None:
+                # copies, since positioning_headlines changes the levels
+                headline = headline.copy()
+                headline.line = number
+                raw_headlines.append(headline)
+
+        nolink = options.get('nolink', False)
+        placeholder = options.get('placeholder')
+        placeholder_lines = None
+        if placeholder:
+            placeholder_lines = _placeholder_lines(cleaned, placeholder)
+            if not nolink:
+                placeholder_lines = [(starts[i] + _body_line(records[i][0]), count)
+                                     for i, count in placeholder_lines]
+
+        toc_outputs = options.get('toc_outputs')
+        toc_headlines = [] if toc_outputs else None
+        cont = _render_markdown(cleaned, processed_contents, raw_headlines,
+                                github=options.get('github', False),
+                                nolink=nolink,
+                                no_toc_header=options.get('no_toc_header', False),
+                                spacer=options.get('spacer', 0),
+                                placeholder=placeholder,
+                                max_children=options.get('max_children'),
+                                placeholder_lines=placeholder_lines,
+                                multiple_placeholders=options.get('multiple_placeholders', 'all'),
+                                missing_placeholder=options.get('missing_placeholder', 'ignore'),
+                                headlines=toc_headlines)
+        if toc_outputs:
+            _write_toc_outputs(toc_headlines, toc_outputs, nolink=nolink,
+                               no_toc_header=options.get('no_toc_header', False),
+                               max_children=options.get('max_children'))
+        return cont
+
+    def run(self):
+        """Polls the watched files until interrupted (e.g., via Ctrl-C)."""
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
 
 
-def commandline():
+def _write_stats(path, stats):
+    """Writes the statistics as JSON to `path` ('-' for standard error)."""
+    import json
+    if path == '-':
+        json.dump(stats, sys.stderr, indent=2, sort_keys=True)
+        sys.stderr.write('\n')
+    else:
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+# command line flags that _fast_commandline handles without argparse
+_FAST_FLAGS = {'-b': 'back_to_top', '--back_to_top': 'back_to_top',
+               '-g': 'github', '--github': 'github',
+               '-n': 'nolink', '--nolink': 'nolink',
+               '-i': 'in_place', '--in_place': 'in_place', '--in-place': 'in_place',
+               '--remove_dashes': 'remove_dashes',
+               '--unique_slugs': 'unique_slugs',
+               '--no_toc_header': 'no_toc_header',
+               '--setext': 'setext',
+               '--roundtrip': 'roundtrip'}
+
+
+def _fast_commandline(argv):
+    """
+    Runs the common command lines (-v, or a single input file with
+    -o and the on/off flags in _FAST_FLAGS) without importing argparse.
+    Returns False if `argv` has to be parsed by `commandline`, e.g.,
+    for other arguments, --help and invalid combinations.
+
+    """
+    if argv in (['-v'], ['--version']):
+        sys.stdout.write('%s\n' % __version__)
+        return True
+    options = {}
+    input_files = []
+    output_file = None
+    args = iter(argv)
+    for arg in args:
+        if arg in _FAST_FLAGS:
+            options[_FAST_FLAGS[arg]] = True
+        elif arg in ('-o', '--output'):
+            output_file = next(args, None)
+            if output_file is None or output_file.startswith('-'):
+                return False
+        elif arg.startswith('-'):
+            return False
+        else:
+            input_files.append(arg)
+    if len(input_files) != 1 or not os.path.isfile(input_files[0]):
+        return False
+    if output_file and options.get('in_place'):
+        return False
+    if options.get('setext') and options.get('roundtrip'):
+        return False
+    try:
+        cont = markdown_toclify(input_file=input_files[0],
+                                output_file=output_file,
+                                **options)
+    except PlaceholderError as e:
+        sys.stderr.write('%s: %s\n' % (input_files[0], e))
+        sys.exit(1)
+    if not output_file and not options.get('in_place'):
+        print(cont)
+    return True
+
+
+def commandline(argv=None):
 
+    if argv is None:
+        argv = sys.argv[1:]
+    if _fast_commandline(argv):
+        return
+
+    import argparse
     parser = argparse.ArgumentParser(
             description='Python script that inserts a table of contents\n'\
                     'into markdown documents and creates the required internal links.',
@@ -350,11 +4403,25 @@ def commandline():
 
     parser.add_argument('InputFile',
                         metavar='input.md',
-                        help='path to the Markdown input file')
+                        nargs='*',
+                        help='path to the Markdown input file; multiple paths,\n'
+                             'glob patterns or directories enable batch mode\n'
+                             '(restrict the changed files of --files_from and --since)')
     parser.add_argument('-o', '--output',
                         metavar='output.md',
                         default=None,
-                        help='path to the Markdown output file')
+                        help='path to the Markdown output file\n'
+                             '(output directory in batch mode)')
+    parser.add_argument('-i', '--in_place', '--in-place',
+                        action='store_true',
+                        help='rewrite the input files instead of writing to -o; files whose\n'
+                             'contents do not change are not written (and keep their mtime)')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=None,
+                        metavar='N',
+                        help='number of worker processes in batch and parallel mode\n'
+                             '(default: number of CPUs)')
     parser.add_argument('-b', '--back_to_top',
                         action='store_true',
                         help='add [back to top] links.')
@@ -373,39 +4440,312 @@ def commandline():
                         type=str,
                         default='',
                         help='exclude eading levels, e.g., "2,3" to exclude all level 2 and 3 headings')
+    parser.add_argument('--min_depth',
+                        type=int,
+                        default=1,
+                        metavar='LEVEL',
+                        help='lowest heading level in the table of contents (default: %(default)s)')
+    parser.add_argument('--max_depth',
+                        type=int,
+                        default=6,
+                        metavar='LEVEL',
+                        help='deepest heading level in the table of contents (default: %(default)s)')
+    parser.add_argument('--max_children',
+                        type=int,
+                        default=None,
+                        metavar='N',
+                        help='at most N entries below every table of contents entry;\n'
+                             'further entries are collapsed into a "more..." link')
     parser.add_argument('--placeholder',
                         type=str,
                         help='inserts TOC at the placeholder string instead of inserting it on top of the document')
+    parser.add_argument('--multiple_placeholders',
+                        choices=MULTIPLE_PLACEHOLDERS,
+                        default='all',
+                        help='replace all placeholders, only the first one, or fail\n'
+                             'if the placeholder occurs more than once (default: %(default)s)')
+    parser.add_argument('--missing_placeholder',
+                        choices=MISSING_PLACEHOLDER,
+                        default='ignore',
+                        help='leave the document without a TOC, insert the TOC on top,\n'
+                             'or fail if the placeholder is not found (default: %(default)s)')
     parser.add_argument('--remove_dashes',
                         action='store_true',
                         help='Removes dashes from generated slugs')
+    parser.add_argument('--unique_slugs',
+                        action='store_true',
+                        help='append GitHub-style suffixes to duplicate slugs (e.g., "parameters-1")')
+    parser.add_argument('--slug_flavor',
+                        choices=sorted(SLUG_FLAVORS),
+                        default='default',
+                        help='create the anchors like the given Markdown renderer (default: %(default)s)')
+    parser.add_argument('--setext',
+                        action='store_true',
+                        help='add Setext headlines (text underlined by === or ---) to the TOC')
+    parser.add_argument('--roundtrip',
+                        action='store_true',
+                        help='keep all other lines as they are and put the TOC between\n'
+                             'marker comments that are replaced on the next run')
     parser.add_argument('--no_toc_header',
                         action='store_true',
                         help='suppresses the Table of Contents header')
+    parser.add_argument('--cache_dir', '--cache-dir',
+                        metavar='DIR',
+                        default=None,
+                        help='cache the output keyed by a hash of the input file and the options;\n'
+                             'up-to-date output files are not rewritten')
+    parser.add_argument('--cache_size',
+                        type=int,
+                        default=CACHE_MAX_SIZE // (1024 * 1024),
+                        metavar='MB',
+                        help='maximum size of the cache directory in MB (default: %(default)s)')
+    parser.add_argument('--index',
+                        metavar='FILE',
+                        default=None,
+                        help='write a headline index (JSON lines if FILE ends with .jsonl,\n'
+                             'binary otherwise; a directory in batch mode)')
+    parser.add_argument('--toc_md',
+                        metavar='FILE',
+                        default=None,
+                        help='also write the table of contents on its own as Markdown\n'
+                             '(a directory for the *.toc.md files in batch mode)')
+    parser.add_argument('--toc_html',
+                        metavar='FILE',
+                        default=None,
+                        help='also write the table of contents as an HTML <nav> fragment\n'
+                             '(a directory for the *.toc.html files in batch mode)')
+    parser.add_argument('--toc_json',
+                        metavar='FILE',
+                        default=None,
+                        help='also write the table of contents as a JSON tree\n'
+                             '(a directory for the *.toc.json files in batch mode)')
+    parser.add_argument('--files_from',
+                        metavar='FILE',
+                        default=None,
+                        help='only process the changed files listed in FILE, one per line\n'
+                             '(- for the standard input, e.g., git diff --name-only | ...);\n'
+                             'runs in batch mode, up-to-date output files are not rewritten')
+    parser.add_argument('--since',
+                        metavar='REF',
+                        default=None,
+                        help='only process the Markdown files changed since the git revision\n'
+                             'REF (incl. uncommitted and untracked files); batch mode')
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='keep running and regenerate the output whenever an input file changes')
+    parser.add_argument('--interval',
+                        type=float,
+                        default=0.5,
+                        metavar='SECONDS',
+                        help='polling interval in watch mode (default: %(default)s)')
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help='stream the document from the input file to the output\n'
+                             'to keep memory usage low for very large files')
+    parser.add_argument('--mmap',
+                        action='store_true',
+                        help='memory-map the input file and copy unchanged lines straight\n'
+                             'to the output (for very large files)')
+    parser.add_argument('--parallel',
+                        action='store_true',
+                        help='scan the headlines of a single large file in parallel\n'
+                             'worker processes (see -j)')
+    parser.add_argument('--stats',
+                        nargs='?',
+                        const='-',
+                        default=None,
+                        metavar='FILE',
+                        help='write the timings of the pipeline stages, the number of bytes,\n'
+                             'lines and headings and the peak memory usage as JSON to FILE\n'
+                             '(standard error if FILE is omitted); per file in batch mode')
+    parser.add_argument('--check',
+                        action='store_true',
+                        help='only check if the tables of contents are up to date; reports\n'
+                             'stale files and exits with status 1 without writing any files')
     parser.add_argument('-v', '--version',
                         action='version',
                         version='%s' % __version__)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.exclude_h:
         exclude_h = [int(i) for i in args.exclude_h.split(',')]
     else:
         exclude_h = None
 
-    cont = markdown_toclify(input_file=args.InputFile,
-                            output_file=args.output,
-                            github=args.github,
-                            back_to_top=args.back_to_top,
-                            nolink=args.nolink,
-                            no_toc_header=args.no_toc_header,
-                            spacer=args.spacer,
-                            placeholder=args.placeholder,
-                            exclude_h=exclude_h,
-                            remove_dashes=args.remove_dashes)
-
-    if not args.output:
-        print(cont)
+    options = dict(github=args.github,
+                   back_to_top=args.back_to_top,
+                   nolink=args.nolink,
+                   no_toc_header=args.no_toc_header,
+                   spacer=args.spacer,
+                   placeholder=args.placeholder,
+                   exclude_h=exclude_h,
+                   remove_dashes=args.remove_dashes,
+                   unique_slugs=args.unique_slugs,
+                   min_depth=args.min_depth,
+                   max_depth=args.max_depth,
+                   max_children=args.max_children,
+                   multiple_placeholders=args.multiple_placeholders,
+                   missing_placeholder=args.missing_placeholder,
+                   slug_flavor=args.slug_flavor,
+                   setext=args.setext)
+
+    cache_max_size = args.cache_size * 1024 * 1024
+    toc_outputs = dict((toc_format, path) for toc_format, path in
+                       (('markdown', args.toc_md), ('html', args.toc_html),
+                        ('json', args.toc_json)) if path) or None
+
+    if args.in_place and args.output:
+        parser.error('-o cannot be used with --in_place')
+    if args.roundtrip:
+        if args.setext:
+            parser.error('--roundtrip cannot be used with --setext')
+        if args.stream or args.mmap or args.parallel or args.watch or args.check:
+            parser.error('--roundtrip cannot be used with --stream, --mmap, --parallel,\n'
+                         '--watch or --check')
+        # only markdown_toclify (and markdown_toclify_many) accept it
+        options['roundtrip'] = True
+
+    records = [] if args.stats else None
+    stats = records.append if args.stats else None
+
+    changed = args.files_from is not None or args.since is not None
+    if not args.InputFile and not changed:
+        parser.error('the following arguments are required: input.md')
+    input_files = args.InputFile
+    base_dir = None
+    if changed:
+        if args.watch:
+            parser.error('--watch cannot be used with --files_from or --since')
+        import subprocess
+        input_files = []
+        if args.files_from == '-':
+            input_files += read_file_list(sys.stdin)
+        elif args.files_from is not None:
+            with open(args.files_from) as f:
+                input_files += read_file_list(f)
+        if args.since is not None:
+            try:
+                input_files += git_changed_files(args.since)
+            except subprocess.CalledProcessError as e:
+                sys.stderr.write('git: %s\n' % os.fsdecode(e.stderr).strip())
+                sys.exit(1)
+            except OSError as e:
+                sys.stderr.write('git: %s\n' % e)
+                sys.exit(1)
+        input_files = list(collections.OrderedDict.fromkeys(input_files))
+        if args.InputFile:
+            input_files = filter_input_paths(input_files, args.InputFile)
+        # keep the directory structure stable for different sets of files
+        base_dir = os.curdir
+
+    if args.check:
+        if args.output or args.in_place or args.watch or args.stats or toc_outputs:
+            parser.error('--check cannot be used with -o, --in_place, --watch, --stats\n'
+                         'or --toc_md/--toc_html/--toc_json')
+        check_options = dict(options)
+        for option in ('spacer', 'placeholder', 'multiple_placeholders', 'missing_placeholder'):
+            del check_options[option]
+        jobs = [(f, check_options) for f in expand_input_paths(input_files)]
+        max_workers = min(args.jobs or os.cpu_count() or 1, len(jobs))
+        if max_workers <= 1:
+            done = list(map(_check_job, jobs))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                done = list(executor.map(_check_job, jobs))
+        stale = [(f, reason) for f, reason in done if reason is not None]
+        for input_file, reason in stale:
+            sys.stderr.write('%s: %s\n' % (input_file, reason))
+        if stale:
+            sys.exit(1)
+        return
+
+    if args.watch:
+        if args.in_place:
+            parser.error('--watch cannot be used with --in_place')
+        if args.stats:
+            parser.error('--watch cannot be used with --stats')
+        if toc_outputs:
+            parser.error('--watch cannot be used with --toc_md, --toc_html or --toc_json')
+        single = len(args.InputFile) == 1 and os.path.isfile(args.InputFile[0])
+        watcher = TocWatcher(args.InputFile,
+                             output_file=args.output if single else None,
+                             output_dir=None if single else args.output,
+                             interval=args.interval,
+                             **options)
+        watcher.run()
+        return
+
+    if not changed and len(input_files) == 1 and os.path.isfile(input_files[0]):
+        try:
+            if args.parallel:
+                markdown_toclify_parallel(input_file=args.InputFile[0],
+                                          output_file=args.output,
+                                          in_place=args.in_place,
+                                          stats=stats,
+                                          max_workers=args.jobs,
+                                          toc_outputs=toc_outputs,
+                                          **options)
+            elif args.mmap:
+                markdown_toclify_mmap(input_file=args.InputFile[0],
+                                      output_file=args.output,
+                                      in_place=args.in_place,
+                                      stats=stats,
+                                      toc_outputs=toc_outputs,
+                                      **options)
+            elif args.stream:
+                markdown_toclify_stream(input_file=args.InputFile[0],
+                                        output_file=args.output,
+                                        in_place=args.in_place,
+                                        stats=stats,
+                                        toc_outputs=toc_outputs,
+                                        **options)
+            else:
+                cont = markdown_toclify(input_file=args.InputFile[0],
+                                        output_file=args.output,
+                                        cache_dir=args.cache_dir,
+                                        index_file=args.index,
+                                        in_place=args.in_place,
+                                        stats=stats,
+                                        toc_outputs=toc_outputs,
+                                        **options)
+                if args.cache_dir:
+                    prune_cache(args.cache_dir, cache_max_size)
+                if not args.output and not args.in_place:
+                    print(cont)
+        except PlaceholderError as e:
+            sys.stderr.write('%s: %s\n' % (args.InputFile[0], e))
+            sys.exit(1)
+        if args.stats:
+            _write_stats(args.stats, records[0])
+        return
+
+    if not args.output and not args.in_place and not toc_outputs:
+        parser.error('batch mode requires an output directory (-o), --in_place\n'
+                     'or a --toc_md/--toc_html/--toc_json directory')
+
+    start = time.perf_counter()
+    results, errors = markdown_toclify_many(input_files,
+                                            output_dir=args.output,
+                                            in_place=args.in_place,
+                                            max_workers=args.jobs,
+                                            cache_dir=args.cache_dir,
+                                            cache_max_size=cache_max_size,
+                                            index_dir=args.index,
+                                            toc_output_dirs=toc_outputs,
+                                            stats=stats,
+                                            base_dir=base_dir,
+                                            **options)
+    for input_file, error in sorted(errors.items()):
+        sys.stderr.write('%s: %s\n' % (input_file, error))
+    if args.stats:
+        _write_stats(args.stats, dict(files=records,
+                                      seconds=time.perf_counter() - start,
+                                      errors=dict((f, str(e)) for f, e in errors.items()),
+                                      peak_rss=_peak_rss()))
+    if errors:
+        sys.exit(1)
 
 if __name__ == '__main__':
     commandline()
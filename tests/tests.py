@@ -5,9 +5,31 @@
 # bash> nosetests
 # bash> py.test tests.py
 
+import asyncio
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+
 import markdown_toclify as mt
 
 
+@contextlib.contextmanager
+def temp_dir():
+    """Yields a temporary directory that is removed afterwards."""
+    tmp = tempfile.mkdtemp()
+    try:
+        yield tmp
+    finally:
+        shutil.rmtree(tmp)
+
+
 def test_markdown_std():
     # new markdown standards (makdown-toclify > 1.6)
     # see http://jgm.github.io/stmd/spec.html#atx-headers
@@ -183,6 +205,34 @@ def test_tag_and_collect():
 
 
 
+def test_tag_and_collect_text():
+    lines = ['<a class="mk-toclify" id="old"></a>',
+             '# first headline',
+             '  some text',
+             '```',
+             '# no headline',
+             '  code',
+             '[[back to top](#table-of-contents)]',
+             '```',
+             '   ## second headline',
+             '    # indented code',
+             '<!--',
+             '# no headline',
+             '-->',
+             '####### no headline',
+             '[[back to top](#table-of-contents)]']
+    text = '\n'.join(lines)
+    for options in (dict(), dict(id_tag=False, back_links=True),
+                    dict(exclude_h=[2], unique_slugs=True)):
+        body, expect = mt.tag_and_collect(mt.remove_lines(lines), **options)
+        headlines = []
+        assert(mt.tag_and_collect_text(text, headlines, **options) == '\n'.join(body))
+        assert(headlines == expect)
+        assert([h.line for h in headlines] == [h.line for h in expect])
+    assert(mt.tag_and_collect_text(text, id_tag=False, strip_indent=False) ==
+           '\n'.join(mt.remove_lines(lines)))
+
+
 def test_positioning_headlines():
     in1 = [['first headline', 'first-headline', 1],
            ['second headline', 'second-headline', 2]]
@@ -206,7 +256,827 @@ def test_create_toc():
     assert(mt.create_toc(in1, hyperlink=True, top_link=True) == out2)
 
 
+def test_markdown_toclify_many():
+    with temp_dir() as tmp:
+        os.makedirs(os.path.join(tmp, 'in', 'sub'))
+        with open(os.path.join(tmp, 'in', 'a.md'), 'w') as f:
+            f.write('# first headline\nsome text\n')
+        with open(os.path.join(tmp, 'in', 'sub', 'b.md'), 'w') as f:
+            f.write('## second headline\nmore text\n')
+        with open(os.path.join(tmp, 'in', 'sub', 'c.txt'), 'w') as f:
+            f.write('# not markdown\n')
+        missing = os.path.join(tmp, 'in', 'missing.md')
+
+        out_dir = os.path.join(tmp, 'out')
+        for workers in (1, 2):
+            results, errors = mt.markdown_toclify_many(
+                [os.path.join(tmp, 'in'), missing],
+                output_dir=out_dir, max_workers=workers, github=True)
+
+            assert(sorted(results) == [os.path.join(tmp, 'in', 'a.md'),
+                                       os.path.join(tmp, 'in', 'sub', 'b.md')])
+            assert(list(errors) == [missing])
+            expect = mt.markdown_toclify(os.path.join(tmp, 'in', 'sub', 'b.md'),
+                                         github=True)
+            with open(os.path.join(out_dir, 'sub', 'b.md')) as f:
+                assert(f.read() == expect)
+
+
+def test_changed_files():
+    with temp_dir() as tmp:
+        os.makedirs(os.path.join(tmp, 'docs', 'sub'))
+        a = os.path.join(tmp, 'docs', 'a.md')
+        b = os.path.join(tmp, 'docs', 'sub', 'b.md')
+        for path in (a, b):
+            with open(path, 'w') as f:
+                f.write('# headline\n')
+        listed = io.StringIO('%s\n\n%s\n%s\n%s\n' % (b, a, b, os.path.join(tmp, 'gone.md')))
+        assert(mt.read_file_list(listed) == [b, a])
+        assert(mt.filter_input_paths([a, b], [os.path.join(tmp, 'docs', 'sub')]) == [b])
+        assert(mt.filter_input_paths([a, b], [os.path.join(tmp, '*', 'a.md')]) == [a])
+
+        out_dir = os.path.join(tmp, 'out')
+        mt.markdown_toclify_many([b], output_dir=out_dir, max_workers=1, base_dir=tmp)
+        out_file = os.path.join(out_dir, 'docs', 'sub', 'b.md')
+        assert(os.path.isfile(out_file))
+        # up-to-date output files are not rewritten
+        os.utime(out_file, (0, 0))
+        mt.markdown_toclify_many([b], output_dir=out_dir, max_workers=1, base_dir=tmp)
+        assert(os.stat(out_file).st_mtime == 0)
+
+        try:
+            git = ['git', '-c', 'user.name=t', '-c', 'user.email=t@t']
+            subprocess.check_call(git + ['init', '-q'], cwd=tmp)
+            subprocess.check_call(git + ['add', 'docs'], cwd=tmp)
+            subprocess.check_call(git + ['commit', '-q', '-m', 'init'], cwd=tmp)
+        except OSError:
+            return
+        docs = os.path.join(tmp, 'docs')
+        assert(mt.git_changed_files('HEAD', cwd=docs) == [])
+        with open(b, 'a') as f:
+            f.write('## more\n')
+        with open(os.path.join(docs, 'c.md'), 'w') as f:
+            f.write('# new\n')
+        os.remove(a)
+        assert(mt.git_changed_files('HEAD', cwd=docs) == [b, os.path.join(docs, 'c.md')])
+        # untracked output files are changed files, too
+        assert(out_file in mt.git_changed_files('HEAD', cwd=tmp))
+
+
+def test_toclify_async():
+    from concurrent.futures import ProcessPoolExecutor
+
+    with temp_dir() as tmp:
+        in_files = []
+        for i in range(5):
+            in_files.append(os.path.join(tmp, 'in', '%d.md' % i))
+            os.makedirs(os.path.dirname(in_files[-1]), exist_ok=True)
+            with open(in_files[-1], 'w') as f:
+                f.write('# headline %d\nsome text\n## sub %d\n### subsub\n' % (i, i))
+        missing = os.path.join(tmp, 'in', 'missing.md')
+        out_file = os.path.join(tmp, 'out', 'a.md')
+
+        async def main():
+            cont = await mt.toclify_async(in_files[0], out_file, max_depth=2)
+            assert(cont == mt.markdown_toclify(in_files[0], max_depth=2))
+            with open(out_file) as f:
+                assert(f.read() == cont)
+
+            text = await mt.toclify_text_async(b'# a\ntext', github=True)
+            assert(text == mt.toclify_text(b'# a\ntext', github=True))
+
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                return await mt.toclify_many_async(
+                    [os.path.join(tmp, 'in'), missing],
+                    output_dir=os.path.join(tmp, 'out_dir'),
+                    max_concurrency=2, executor=executor, back_to_top=True)
+
+        results, errors = asyncio.run(main())
+        assert(sorted(results) == in_files)
+        assert(list(errors) == [missing])
+        for f in in_files:
+            assert(results[f] == mt.markdown_toclify(f, back_to_top=True))
+        with open(os.path.join(tmp, 'out_dir', '4.md')) as f:
+            assert(f.read() == results[in_files[4]])
+
+
+def test_markdown_toclify_stream():
+    from markdown_toclify.markdown_toclify import build_markdown, iter_markdown
+
+    toc = mt.create_toc([['first headline', 'first-headline', 1]])
+    body = ['', '  ', 'PH first line', '', 'last line  ', '', '']
+    for placeholder in (None, 'PH'):
+        assert(''.join(iter_markdown(toc, iter(body), 10, placeholder)) ==
+               build_markdown(toc, body, 10, placeholder))
+
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('\n# first headline\nsome text\n'
+                    '    indented text\n## second headline\n\n')
+        for options in (dict(), dict(github=True, back_to_top=True),
+                        dict(nolink=True, spacer=50)):
+            mt.markdown_toclify_stream(in_file, out_file, **options)
+            with open(out_file) as f:
+                assert(f.read() == mt.markdown_toclify(in_file, **options))
+
+        # the output file is the input file
+        expect = mt.markdown_toclify(in_file)
+        mt.markdown_toclify_stream(in_file, in_file)
+        with open(in_file) as f:
+            assert(f.read() == expect)
+        assert(sorted(os.listdir(tmp)) == ['in.md', 'out.md'])
+
+
+def test_cache():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        cache_dir = os.path.join(tmp, 'cache')
+        with open(in_file, 'w') as f:
+            f.write('# first headline\nsome text\n## second headline\n')
+
+        expect = mt.markdown_toclify(in_file)
+        assert(mt.markdown_toclify(in_file, out_file, cache_dir=cache_dir) == expect)
+        assert(len(os.listdir(cache_dir)) == 1)
+
+        # a hit does not rewrite an up-to-date output file
+        os.utime(out_file, (0, 0))
+        assert(mt.markdown_toclify(in_file, out_file, cache_dir=cache_dir) == expect)
+        assert(os.stat(out_file).st_mtime == 0)
+
+        # the options are part of the key
+        assert(mt.markdown_toclify(in_file, cache_dir=cache_dir, github=True) ==
+               mt.markdown_toclify(in_file, github=True))
+        assert(len(os.listdir(cache_dir)) == 2)
+
+        # the slug flavors are part of the key by their names and rules
+        from markdown_toclify.markdown_toclify import _cache_key, SLUG_FLAVORS
+        key = _cache_key(b'x', dict(slug_flavor='gitlab', exclude_h={3, 2}))
+        assert(key == _cache_key(b'x', dict(slug_flavor=SLUG_FLAVORS['gitlab'],
+                                            exclude_h=[2, 3])))
+        assert(key != _cache_key(b'x', dict(slug_flavor=mt.SlugFlavor('gitlab', dash='-'),
+                                            exclude_h=[2, 3])))
+
+        # an output file that only differs in the line breaks is not up to date
+        with open(out_file, 'wb') as f:
+            f.write(expect.replace('\n', '\r\n').encode('utf-8'))
+        mt.markdown_toclify(in_file, out_file, cache_dir=cache_dir)
+        with open(out_file, 'rb') as f:
+            assert(f.read() == expect.encode('utf-8'))
+
+        assert(mt.prune_cache(cache_dir, max_size=len(expect) + 10) == 1)
+        assert(len(os.listdir(cache_dir)) == 1)
+
+
+def test_in_place():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        contents = '??ph??\n# first headline\nsome text\n# second headline\n'
+        for func in (mt.markdown_toclify, mt.markdown_toclify_stream,
+                     mt.markdown_toclify_mmap, mt.markdown_toclify_parallel):
+            with open(in_file, 'w') as f:
+                f.write(contents)
+            os.chmod(in_file, 0o640)
+            expect = mt.markdown_toclify(in_file, placeholder='??ph??', github=True)
+            func(in_file, placeholder='??ph??', github=True, in_place=True)
+            with open(in_file) as f:
+                assert(f.read() == expect)
+            assert(stat.S_IMODE(os.stat(in_file).st_mode) == 0o640)
+
+            # the placeholder is gone (and there are no anchor tags), so the
+            # contents do not change again
+            os.utime(in_file, (0, 0))
+            func(in_file, placeholder='??ph??', github=True, in_place=True)
+            assert(os.stat(in_file).st_mtime == 0)
+            assert(os.listdir(tmp) == ['in.md'])
+
+        # concurrent in-place writes of the same file in threads
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: mt.markdown_toclify(in_file, in_place=True,
+                                                            nolink=i % 2 == 0),
+                              range(32)))
+        assert(os.listdir(tmp) == ['in.md'])
+
+
+def test_slugify_headline_reference():
+    valids = ('0123456789abcdefghijklmnopqrstuvwxyz'
+              'ABCDEFGHIJKLMNOPQRSTUVWXYZ_-&')
+
+    def reference(line, remove_dashes=False):
+        # slugify_headline up to version 1.7.2
+        stripped_right = line.rstrip('#')
+        stripped_both = stripped_right.lstrip('#')
+        level = len(stripped_right) - len(stripped_both)
+        stripped_wspace = stripped_both.strip()
+        replaced = stripped_wspace.replace('.', '').replace('/', '')
+        rem_nonvalids = ''.join([c if c in valids
+                                 else '-' for c in replaced])
+        slugified = re.sub(r'(-)\1+', r'\1', rem_nonvalids.lower())
+        slugified = slugified.strip('-').replace('-&-', '--')
+        if remove_dashes:
+            slugified = slugified.replace('-', '')
+        return [stripped_wspace, slugified, level]
+
+    lines = ['# Parameters', '## Returns ##', '### a.b/c -- d',
+             '# Foo & Bar', '## --leading and trailing--',
+             '#### Ünïcödé héadline – 2', '# x_y & & z', '## C++ / C#',
+             '### [link](http://example.com) `code`', '# ---', '#  tabs\tand  spaces ']
+    for line in lines * 2:
+        for remove_dashes in (False, True):
+            assert(mt.slugify_headline(line, remove_dashes) ==
+                   reference(line, remove_dashes))
+
+    # results are copies, not shared memoized objects
+    mt.slugify_headline('# Parameters')[2] = 0
+    assert(mt.slugify_headline('# Parameters')[2] == 1)
+
+
+def test_toclify_text():
+    text = '# first headline\r\nsome text\n## second headline\n'
+    expect = ('<a class="mk-toclify" id="table-of-contents"></a>\n\n'
+              '# Table of Contents\n'
+              '- [first headline](#first-headline)\n'
+              '    - [second headline](#second-headline)\n\n'
+              '<a class="mk-toclify" id="first-headline"></a>\n'
+              '# first headline\n'
+              'some text\n'
+              '<a class="mk-toclify" id="second-headline"></a>\n'
+              '## second headline')
+    assert(mt.toclify_text(text) == expect)
+    assert(mt.toclify_text(text.encode('utf-8')) == expect.encode('utf-8'))
+    assert(mt.toclify_text(memoryview(text.encode('utf-8'))) == expect.encode('utf-8'))
+
+    out = io.BytesIO()
+    assert(mt.toclify_stream(io.BytesIO(text.encode('utf-8')), out) ==
+           expect.encode('utf-8'))
+    assert(out.getvalue() == expect.encode('utf-8'))
+
+    out = io.StringIO()
+    mt.toclify_stream(io.StringIO(text), out, github=True)
+    assert(out.getvalue() == mt.toclify_text(text, github=True))
+
+    # the depth range of markdown_toclify
+    assert('second headline](' not in mt.toclify_text(text, max_depth=1))
+    assert(mt.toclify_text(text, min_depth=2) == mt.toclify_text(text, exclude_h=[1]))
+    assert(mt.toclify_stream(io.StringIO(text), max_depth=1) ==
+           mt.toclify_text(text, exclude_h=[2]))
+
+
+def test_toc_watcher():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        seen = []
+        watcher = mt.TocWatcher([in_file], output_file=out_file, debounce=0,
+                                callback=lambda f, cont: seen.append(f),
+                                back_to_top=True)
+
+        contents = ['# first headline', 'some text', '## second headline',
+                    'more text', '## third headline']
+        for step, edit in enumerate([None, (1, 'changed text'),
+                                     (3, '### new headline'), (0, 'intro')]):
+            if edit is not None:
+                contents[edit[0]] = edit[1]
+            with open(in_file, 'w') as f:
+                f.write('\n'.join(contents))
+            os.utime(in_file, (step, step))
+
+            expect = mt.markdown_toclify(in_file, back_to_top=True)
+            assert(watcher.poll() == {in_file: expect})
+            with open(out_file) as f:
+                assert(f.read() == expect)
+
+        # unchanged files are not processed again
+        assert(watcher.poll() == {})
+        assert(seen == [in_file] * 4)
+
+        # the round trip and the TOC outputs match a single run
+        toc_file = os.path.join(tmp, 'toc.json')
+        expect_file = os.path.join(tmp, 'expect.json')
+        with open(in_file, 'wb') as f:
+            f.write(b'# first headline\r\nsome text\r\n## second headline\r\n')
+        for options in (dict(), dict(roundtrip=True)):
+            expect = mt.markdown_toclify(in_file, toc_outputs={'json': expect_file}, **options)
+            watcher = mt.TocWatcher([in_file], output_file=out_file, debounce=0,
+                                    toc_outputs={'json': toc_file}, **options)
+            assert(watcher.poll() == {in_file: expect})
+            with open(out_file, 'rb') as f:
+                assert(f.read() == expect.encode('utf-8'))
+            with open(toc_file) as f1, open(expect_file) as f2:
+                assert(f1.read() == f2.read())
+
+        try:
+            mt.TocWatcher([in_file], in_place=True)
+            assert(False)
+        except ValueError:
+            pass
+
+
+def test_code_blocks():
+    ex = ['# first headline',
+          '```bash',
+          '# install deps',
+          '````',
+          '``` still code',
+          '```',
+          '~~~~',
+          '## no headline',
+          '~~~',
+          '~~~~~',
+          '<pre>',
+          '# no headline',
+          '</pre>',
+          '<!-- # no headline -->',
+          '<!--',
+          '# no headline',
+          '-->',
+          '    # indented code',
+          '## second headline',
+          '``` `not a fence`',
+          '### third headline',
+          ]
+    out = [['first headline', 'first-headline', 1],
+           ['second headline', 'second-headline', 2],
+           ['third headline', 'third-headline', 3]]
+    contents, headlines = mt.tag_and_collect(ex, id_tag=False)
+    assert(headlines == out)
+    assert(contents == [l.lstrip() for l in ex])
+
+    # an unclosed fence extends to the end of the document
+    assert(mt.tag_and_collect(['```', '# no headline'])[1] == [])
+
+
+def test_markdown_toclify_mmap():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'wb') as f:
+            f.write(u'\n# first headline\nsome text ??ph??\n    indented text\n'
+                    u'<a class="mk-toclify" id="old"></a>\n```\n# no headline\n```\n'
+                    u'## sécond headline\n<pre>\n# no headline\nx </pre>\n'
+                    u'### third headline\n\n'.encode('utf-8'))
+        for options in (dict(), dict(github=True, back_to_top=True),
+                        dict(nolink=True, spacer=50), dict(placeholder='??ph??')):
+            mt.markdown_toclify_mmap(in_file, out_file, **options)
+            with open(out_file, 'rb') as f:
+                assert(f.read().decode('utf-8') ==
+                       mt.markdown_toclify(in_file, **options))
+
+        # the output file is the input file
+        expect = mt.markdown_toclify(in_file)
+        mt.markdown_toclify_mmap(in_file, in_file)
+        with open(in_file, 'rb') as f:
+            assert(f.read().decode('utf-8') == expect)
+        assert(sorted(os.listdir(tmp)) == ['in.md', 'out.md'])
+
+        # the same whitespace as str.lstrip and str.strip
+        with open(in_file, 'wb') as f:
+            f.write(u'\xa0# first\n\x1ctext\n```\n\u3000code\n\xa0```\n'
+                    u'\u2028## second\n<pre>\n\x1f<!--\n</pre>\n\xa0'.encode('utf-8'))
+        for options in (dict(), dict(nolink=True), dict(back_to_top=True)):
+            mt.markdown_toclify_mmap(in_file, out_file, **options)
+            with open(out_file, 'rb') as f:
+                assert(f.read().decode('utf-8') == mt.markdown_toclify(in_file, **options))
+            mt.markdown_toclify_parallel(in_file, out_file, max_workers=1, chunk_size=16,
+                                         **options)
+            with open(out_file, 'rb') as f:
+                assert(f.read().decode('utf-8') == mt.markdown_toclify(in_file, **options))
+
+
+def test_markdown_toclify_parallel():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'wb') as f:
+            f.write(u'\n# first headline\nsome text ??ph??\n    indented text\n'
+                    u'<a class="mk-toclify" id="old"></a>\n```\n# no headline\n\n'
+                    u'# no headline\n```\n## sécond headline\n<pre>\n# no headline\n'
+                    u'x </pre>\n### first headline\n\n'.encode('utf-8'))
+        # tiny chunks make the code blocks span chunks
+        for options in (dict(), dict(github=True, back_to_top=True),
+                        dict(nolink=True, spacer=50), dict(placeholder='??ph??'),
+                        dict(unique_slugs=True, exclude_h=[2])):
+            for max_workers in (1, 2):
+                headlines = mt.markdown_toclify_parallel(in_file, out_file,
+                                                         max_workers=max_workers,
+                                                         chunk_size=16, **options)
+                with open(out_file, 'rb') as f:
+                    assert(f.read().decode('utf-8') ==
+                           mt.markdown_toclify(in_file, **options))
+        assert(headlines == [['first headline', 'first-headline', 1],
+                             ['first headline', 'first-headline-1', 3]])
+        assert([h.line for h in headlines] == [2, 15])
+
+        # the output file is the input file
+        expect = mt.markdown_toclify(in_file)
+        mt.markdown_toclify_parallel(in_file, in_file, max_workers=2, chunk_size=16)
+        with open(in_file, 'rb') as f:
+            assert(f.read().decode('utf-8') == expect)
+        assert(sorted(os.listdir(tmp)) == ['in.md', 'out.md'])
+
+
+def test_headline_index():
+    lines = ['# first headline', 'some text', '```', '# no headline', '```',
+             u'## sécond headline', '[[back to top](#table-of-contents)]',
+             '### third headline']
+    entries = [('first headline', 'first-headline', 1, 1, 0),
+               (u'sécond headline', 's-cond-headline', 2, 6, 49),
+               ('third headline', 'third-headline', 3, 8, 105)]
+    assert(mt.headline_index(lines) == entries)
+    assert(mt.headline_index(lines, exclude_h=[2]) == entries[::2])
+
+    with temp_dir() as tmp:
+        for ext in ('.jsonl', '.idx'):
+            path = os.path.join(tmp, 'index' + ext)
+            source = os.path.join(tmp, 'docs', 'a.md')
+            mt.write_headline_index(path, entries, source=source)
+            assert(mt.read_headline_index(path) == (source, entries))
+
+        in_file = os.path.join(tmp, 'b.md')
+        with open(in_file, 'w') as f:
+            f.write('## other headline\n### first headline\n')
+        mt.markdown_toclify(in_file, index_file=os.path.join(tmp, 'b.idx'))
+
+        index_files = [os.path.join(tmp, 'index.idx'), os.path.join(tmp, 'b.idx')]
+        assert(mt.build_site_toc(index_files, base_dir=tmp, top_level=True) ==
+               ['- [first headline](docs/a.md#first-headline)',
+                '- [other headline](b.md#other-headline)'])
+        assert(mt.section_lookup(index_files)['first-headline'] ==
+               [(source, 1, 0), (in_file, 2, 18)])
+
+        # the offsets count the actual line terminators
+        with open(in_file, 'wb') as f:
+            f.write(b'# first\r\ntext\r\n# second\r\n\r\n# third\rtext\n')
+        for cache_dir in (None, os.path.join(tmp, 'cache')):
+            index_file = os.path.join(tmp, 'crlf.jsonl')
+            mt.markdown_toclify(in_file, index_file=index_file, cache_dir=cache_dir)
+            assert([e[3:] for e in mt.read_headline_index(index_file)[1]] ==
+                   [(1, 0), (3, 15), (5, 27)])
+
+
+def test_headline():
+    h = mt.Headline('some headline', 'some-headline', 2, line=5)
+    assert(h == ['some headline', 'some-headline', 2])
+    assert(['some headline', 'some-headline', 2] == h)
+    assert(h != ['some headline', 'some-headline', 3])
+    assert(list(h) == ['some headline', 'some-headline', 2])
+    h[-1] -= 1
+    assert(h.level == 1 and h[2] == 1 and h.line == 5)
+
+    headlines = mt.tag_and_collect(['text', '## first headline', '```', '# no',
+                                    '```', '### second headline'])[1]
+    assert([(h.line, h.level) for h in headlines] == [(2, 2), (6, 3)])
+    assert(mt.positioning_headlines(headlines) ==
+           [['first headline', 'first-headline', 1],
+            ['second headline', 'second-headline', 2]])
+
+
+def test_unique_slugs():
+    ex = ['# Parameters',
+          '## Parameters',
+          '```',
+          '# Parameters',
+          '```',
+          '## Parameters 1',
+          '### Parameters',
+          '## Returns']
+    out = [['Parameters', 'parameters', 1],
+           ['Parameters', 'parameters-1', 2],
+           ['Parameters 1', 'parameters-1-1', 2],
+           ['Parameters', 'parameters-2', 3],
+           ['Returns', 'returns', 2]]
+    contents, headlines = mt.tag_and_collect(ex, unique_slugs=True)
+    assert(headlines == out)
+    assert(headlines[3].suffix == 2 and headlines[0].suffix is None)
+    assert('<a class="mk-toclify" id="parameters-1-1"></a>' in contents)
+
+    # excluded headlines still count like on GitHub
+    assert(mt.tag_and_collect(ex, exclude_h=[1], unique_slugs=True)[1] == out[1:])
+
+    assert([h[1] for h in mt.tag_and_collect(ex, remove_dashes=True,
+                                             unique_slugs=True)[1]] ==
+           ['parameters', 'parameters1', 'parameters11', 'parameters2', 'returns'])
+
+    # without unique_slugs the slugs are not changed
+    assert([h[1] for h in mt.tag_and_collect(ex)[1]] ==
+           ['parameters', 'parameters', 'parameters-1', 'parameters', 'returns'])
+
+
+def test_slug_flavors():
+    line = '## Dogs?--in *my* house & 1. Café'
+    assert(mt.slugify_headline(line) == mt.slugify_headline(line, slug_flavor='default'))
+    assert(mt.slugify_headline(line, slug_flavor='github')[1] == 'dogs--in-my-house--1-café')
+    assert(mt.slugify_headline(line, slug_flavor='gitlab')[1] == 'dogs-in-my-house-1-café')
+    assert(mt.slugify_headline('# 1. Intro', slug_flavor='pandoc')[1] == 'intro')
+    assert(mt.slugify_headline('# 1.', slug_flavor='pandoc')[1] == 'section')
+    assert(mt.slugify_headline(line, slug_flavor='mkdocs')[1] == 'dogs-in-my-house-1-cafe')
+
+    flavor = mt.register_slug_flavor('test_flavor', dash=r'\W+', strip='-', sep='_')
+    assert(isinstance(flavor, mt.SlugFlavor))
+    headlines = mt.tag_and_collect(['# A.B', '# a b'], unique_slugs=True,
+                                   slug_flavor='test_flavor')[1]
+    assert([h.slug for h in headlines] == ['a-b', 'a-b_1'])
+    try:
+        mt.slugify_headline('# a', slug_flavor='missing')
+    except ValueError:
+        pass
+    else:
+        assert(False)
+
+
+def test_setext():
+    ex = ['Title',
+          '=====',
+          '',
+          'some text',
+          'more text',
+          '---',
+          '',
+          '```',
+          'no headline',
+          '---',
+          '```',
+          'Section',
+          '-------',
+          '- item',
+          '---']
+    contents, headlines = mt.tag_and_collect(ex, back_links=True, setext=True)
+    assert(headlines == [['Title', 'title', 1], ['Section', 'section', 2]])
+    assert([h.line for h in headlines] == [1, 12])
+    assert(contents[:4] == ['<a class="mk-toclify" id="title"></a>', 'Title', '=====',
+                            '[[back to top](#table-of-contents)]'])
+    assert(mt.tag_and_collect(ex)[1] == [])
+
+    assert(mt.headline_index(ex, setext=True) ==
+           [('Title', 'title', 1, 1, 0), ('Section', 'section', 2, 12, 62)])
+
+    with temp_dir() as tmp:
+        path = os.path.join(tmp, 'in.md')
+        with open(path, 'w') as f:
+            f.write('\n'.join(ex))
+        cont = mt.markdown_toclify(path, setext=True, back_to_top=True)
+        assert('    - [Section](#section)' in cont.split('\n'))
+        with open(path, 'w') as f:
+            f.write(cont)
+        assert(mt.check_toc(path, setext=True, back_to_top=True) is None)
+        assert(mt.check_toc(path, back_to_top=True) is not None)
+
+
+def test_toc_outputs():
+    headlines = [mt.Headline('a & b', 'a--b', 1, line=1),
+                 mt.Headline('c', 'c', 2, line=3),
+                 mt.Headline('d', 'd', 1, line=5)]
+    assert(mt.create_toc_tree(headlines) ==
+           [{'text': 'a & b', 'slug': 'a--b', 'level': 1, 'line': 1,
+             'children': [{'text': 'c', 'slug': 'c', 'level': 2, 'line': 3,
+                           'children': []}]},
+            {'text': 'd', 'slug': 'd', 'level': 1, 'line': 5, 'children': []}])
+    assert(mt.create_toc_html(headlines).split('\n') ==
+           ['<nav class="mk-toclify">', '<ul>',
+            '<li><a href="#a--b">a &amp; b</a>', '<ul>', '<li><a href="#c">c</a></li>',
+            '</ul>', '</li>', '<li><a href="#d">d</a></li>', '</ul>', '</nav>'])
+    assert(mt.render_toc(headlines, 'markdown', no_toc_header=True) ==
+           '- [a & b](#a--b)\n    - [c](#c)\n- [d](#d)\n')
+
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('# first\ntext\n## second\n# third\n')
+        toc_outputs = dict((fmt, os.path.join(tmp, 'toc.' + fmt))
+                           for fmt in ('markdown', 'html', 'json'))
+        funcs = (mt.markdown_toclify, mt.markdown_toclify_stream,
+                 mt.markdown_toclify_mmap, mt.markdown_toclify_parallel)
+        for func in funcs:
+            func(in_file, out_file, toc_outputs=toc_outputs)
+            with open(toc_outputs['markdown']) as f:
+                assert(f.read() == '# Table of Contents\n- [first](#first)\n'
+                                   '    - [second](#second)\n- [third](#third)\n')
+            with open(toc_outputs['html']) as f:
+                assert('<li><a href="#second">second</a></li>' in f.read())
+            with open(toc_outputs['json']) as f:
+                tree = json.load(f)
+            assert([n['slug'] for n in tree] == ['first', 'third'])
+            assert(tree[0]['children'][0]['line'] == 3)
+
+        results, errors = mt.markdown_toclify_many([in_file], max_workers=1,
+                                                   toc_output_dirs={'html': tmp})
+        assert(not errors)
+        assert(os.path.isfile(os.path.join(tmp, 'in.toc.html')))
+        try:
+            mt.markdown_toclify(in_file, toc_outputs={'pdf': out_file})
+        except ValueError:
+            pass
+        else:
+            assert(False)
+
+
+def test_depth_and_max_children():
+    headlines = [['a', 'a', 1], ['b', 'b', 2], ['c', 'c', 2], ['d', 'd', 3],
+                 ['e', 'e', 2], ['f', 'f', 3], ['g', 'g', 1], ['h', 'h', 1]]
+    assert(mt.create_toc(headlines, no_toc_header=True, max_children=2) ==
+           ['- [a](#a)', '    - [b](#b)', '    - [c](#c)', '        - [d](#d)',
+            '    - [more...](#e)', '- [g](#g)', '- [more...](#h)', '\n'])
+
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        with open(in_file, 'w') as f:
+            f.write('# one\n## two\n### three\n#### four\n## five\n')
+        cont = mt.markdown_toclify(in_file, min_depth=2, max_depth=3, no_toc_header=True)
+        assert(cont.startswith('- [two](#two)\n    - [three](#three)\n- [five](#five)\n'))
+        assert('id="one"' not in cont and 'id="four"' not in cont)
+        assert(cont == mt.markdown_toclify(in_file, exclude_h=[1, 4], no_toc_header=True))
+
+
+def test_stats():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        with open(in_file, 'w') as f:
+            f.write('# first headline\nsome text\n## second headline\n')
+
+        records = []
+        mt.markdown_toclify(in_file, stats=records.append)
+        record = json.loads(json.dumps(records[0]))
+        assert(list(record['stages']) == ['read', 'tag_and_collect', 'create_toc',
+                                          'build_markdown', 'output'])
+        assert((record['bytes'], record['lines'], record['headings']) == (46, 4, 2))
+        assert(record['seconds'] >= sum(record['stages'].values()) * 0.999)
+
+        for func in (mt.markdown_toclify_stream, mt.markdown_toclify_mmap):
+            del records[:]
+            func(in_file, os.path.join(tmp, 'out.md'), stats=records.append)
+            assert(list(records[0]['stages']) == ['collect', 'create_toc', 'write'])
+            assert(records[0]['headings'] == 2)
+
+        del records[:]
+        results, errors = mt.markdown_toclify_many([tmp], max_workers=1,
+                                                   stats=records.append)
+        assert([r['input_file'] for r in records] == sorted(results))
+
+
+def test_check_toc():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('# first\ntext\n## second\n### third\n')
+        assert(mt.check_toc(in_file) is not None)
+
+        for options in ({}, {'github': True}, {'back_to_top': True},
+                        {'nolink': True}, {'max_children': 0}):
+            mt.markdown_toclify(in_file, out_file, **options)
+            assert(mt.check_toc(out_file, **options) is None)
+
+        mt.markdown_toclify(in_file, out_file, back_to_top=True)
+        assert(mt.check_toc(out_file) is not None)
+
+        mt.markdown_toclify(in_file, out_file, github=True)
+        with open(out_file) as f:
+            cont = f.read()
+        with open(out_file, 'w') as f:
+            f.write(cont.replace('### third', '### renamed'))
+        assert('renamed' in mt.check_toc(out_file, github=True))
+
+
+def test_fast_commandline():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('# first\ntext\n## second\n')
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        code = ('import sys\n'
+                'from markdown_toclify.markdown_toclify import commandline\n'
+                'commandline(sys.argv[1:])\n'
+                'assert "argparse" not in sys.modules\n')
+        subprocess.check_call([sys.executable, '-c', code, in_file, '-b', '-o', out_file],
+                              env=env)
+        with open(out_file) as f:
+            assert(f.read() == mt.markdown_toclify(in_file, back_to_top=True))
+
+        from markdown_toclify.markdown_toclify import _fast_commandline
+        assert(not _fast_commandline([in_file, '-s', '10']))
+        assert(not _fast_commandline([in_file, in_file]))
+        assert(not _fast_commandline([in_file, '-i', '-o', out_file]))
+
+
+def test_commandline_engines():
+    from markdown_toclify.markdown_toclify import commandline
+
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('# first\ntext\n## second\n')
+        expect = mt.markdown_toclify(in_file, github=True)
+        for flags in (['--stream'], ['--mmap'], ['--parallel', '-j', '1'], ['--roundtrip']):
+            commandline([in_file, '-g', '-o', out_file] + flags)
+            with open(out_file) as f:
+                if flags == ['--roundtrip']:
+                    assert(f.read() == mt.markdown_toclify(in_file, github=True, roundtrip=True))
+                else:
+                    assert(f.read() == expect)
+            os.remove(out_file)
+
+
+def test_placeholder_policies():
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        out_file = os.path.join(tmp, 'out.md')
+        with open(in_file, 'w') as f:
+            f.write('PH\n\n```\nPH\n```\n# first\nsee PH\n')
+        toc = '# Table of Contents\n- [first](#first)\n\n'
+
+        funcs = (mt.markdown_toclify, mt.markdown_toclify_stream,
+                 mt.markdown_toclify_mmap, mt.markdown_toclify_parallel)
+        for func in funcs:
+            func(in_file, out_file, github=True, placeholder='PH')
+            with open(out_file) as f:
+                assert(f.read() == toc + '\n\n```\nPH\n```\n# first\nsee ' + toc)
+            func(in_file, out_file, github=True, placeholder='PH',
+                 multiple_placeholders='first')
+            with open(out_file) as f:
+                assert(f.read() == toc + '\n\n```\nPH\n```\n# first\nsee PH')
+            try:
+                func(in_file, out_file, placeholder='PH', multiple_placeholders='error')
+                assert(False)
+            except mt.PlaceholderError:
+                pass
+            func(in_file, out_file, github=True, placeholder='XX',
+                 missing_placeholder='top')
+            with open(out_file) as f:
+                assert(f.read().startswith(toc + 'PH\n'))
+
+        # placeholders that are HTML comments themselves
+        with open(in_file, 'w') as f:
+            f.write('<!-- toc -->\n<!--\n<!-- toc -->\n-->\n# first\n')
+        for func in funcs:
+            func(in_file, out_file, github=True, placeholder='<!-- toc -->',
+                 missing_placeholder='error')
+            with open(out_file) as f:
+                assert(f.read() == toc + '\n<!--\n<!-- toc -->\n-->\n# first')
+
+
+def test_roundtrip():
+    begin = '<!-- mk-toclify-begin -->'
+    end = '<!-- mk-toclify-end -->'
+    with temp_dir() as tmp:
+        in_file = os.path.join(tmp, 'in.md')
+        contents = ('intro  \n'
+                    '  # first headline\n'
+                    '\tsome text\t\n'
+                    '```\n'
+                    '%s\n'
+                    '```\n'
+                    '## second headline\n\n' % begin)
+        with open(in_file, 'w') as f:
+            f.write(contents)
+        toc = ('%s\n'
+               '# Table of Contents\n'
+               '- [first headline](#first-headline)\n'
+               '    - [second headline](#second-headline)\n'
+               '%s\n' % (begin, end))
+        cont = mt.markdown_toclify(in_file, in_place=True, github=True, roundtrip=True)
+        assert(cont == toc + contents)
 
+        # the TOC is replaced, and a second run does not change anything
+        with open(in_file, 'w') as f:
+            f.write(cont.replace('## second', '## other'))
+        cont = mt.markdown_toclify(in_file, in_place=True, github=True, roundtrip=True)
+        assert(cont == toc.replace('second', 'other') +
+               contents.replace('## second', '## other'))
+        os.utime(in_file, (0, 0))
+        assert(mt.markdown_toclify(in_file, in_place=True, github=True, roundtrip=True) == cont)
+        assert(os.stat(in_file).st_mtime == 0)
 
+        # only the anchor tags and [back to top] links change
+        cont = mt.toclify_text('x PH y\n# a\n', placeholder='PH', back_to_top=True,
+                               roundtrip=True)
+        assert(cont.startswith('x \n' + begin + '\n<a class="mk-toclify" id="table-of-contents">'))
+        assert(cont.endswith(end + '\n y\n<a class="mk-toclify" id="a"></a>\n# a\n'
+                             '[[back to top](#table-of-contents)]\n'))
+        assert(mt.toclify_text(cont, placeholder='PH', back_to_top=True, roundtrip=True) == cont)
 
+        # the line breaks are kept
+        crlf = contents.replace('\n', '\r\n').encode('utf-8')
+        with open(in_file, 'wb') as f:
+            f.write(crlf)
+        cont = mt.markdown_toclify(in_file, in_place=True, github=True, roundtrip=True)
+        assert(cont == (toc + contents).replace('\n', '\r\n'))
+        with open(in_file, 'rb') as f:
+            assert(f.read() == cont.encode('utf-8'))
+        os.utime(in_file, (0, 0))
+        assert(mt.markdown_toclify(in_file, in_place=True, github=True, roundtrip=True) == cont)
+        assert(os.stat(in_file).st_mtime == 0)
+        assert(mt.toclify_text(crlf, github=True, roundtrip=True) == cont.encode('utf-8'))
 
+        try:
+            mt.toclify_text(begin + '\n# a\n', roundtrip=True)
+            assert(False)
+        except mt.PlaceholderError:
+            pass